@@ -3,26 +3,30 @@
 
 #include <limits>
 #include <memory>
+#include <new>
 
 #include "game_tree_node.h"
+#include "node_arena.h"
 #include "player.h"
 
 /**
  * Represents a single node in the game tree.
  *
+ * All of the nodes of a tree are stored in a single NodeArena created along
+ * with the root, so growing the tree doesn't touch the global heap for the
+ * nodes themselves, and the whole tree is released at once.
+ *
  * @tparam Board The board representation used by the game.
  */
 template <class Board>
 class BFSNode : public Node<Board> {
  private:
-  static std::shared_ptr<BFSNode<Board>> downcast(
-      std::shared_ptr<Node<Board>> node) {
-    return std::dynamic_pointer_cast<BFSNode<Board>>(node);
-  }
-
-  static std::shared_ptr<const BFSNode<Board>> downcast(
-      std::shared_ptr<const Node<Board>> node) {
-    return std::dynamic_pointer_cast<const BFSNode<Board>>(node);
+  /**
+   * Every node in a BFSNode tree is a BFSNode, so children can be downcast
+   * without any runtime type checks.
+   */
+  static BFSNode *downcast(const std::shared_ptr<Node<Board>> &node) {
+    return static_cast<BFSNode *>(node.get());
   }
 
   /**
@@ -38,9 +42,21 @@ class BFSNode : public Node<Board> {
    */
 
   /**
-   * The child of this node with the best known heuristic value.
+   * The arena that this node and the rest of its tree are stored in. Kept alive
+   * by the node's own control block.
    */
-  std::shared_ptr<BFSNode> best_known_child;
+  NodeArena *const arena;
+
+  /**
+   * The parent of this node, if any. Only valid while `parent` hasn't expired.
+   */
+  BFSNode *const parent_node;
+
+  /**
+   * The child of this node with the best known heuristic value. Owned by
+   * `children`.
+   */
+  BFSNode *best_known_child;
 
   /**
    * The heuristic value of this node.
@@ -58,14 +74,16 @@ class BFSNode : public Node<Board> {
   int opt;
 
   /**
-   * Creates a node on the heap that is a child of the current node and returns
-   * a pointer to it.
+   * Creates a node in this node's arena that is a child of the current node
+   * and returns a pointer to it.
    *
+   * @param self A pointer to this node.
    * @param move The move to be represented by the child.
    *
    * @return A pointer to the newly created node.
    */
-  std::shared_ptr<BFSNode> create_child(const typename Board::MoveT &move) {
+  std::shared_ptr<BFSNode> create_child(const std::shared_ptr<BFSNode> &self,
+                                        const typename Board::MoveT &move) {
     // Validate that the parent doesn't already have this child.
     for (const auto &child : this->children) {
       if (downcast(child)->move.board_position == move.board_position) {
@@ -74,20 +92,37 @@ class BFSNode : public Node<Board> {
       }
     }
 
-    return std::shared_ptr<BFSNode>(
-        new BFSNode(downcast(this->shared_from_this()), move));
+    return adopt_arena_object(
+        arena->shared_from_this(),
+        new (arena->allocate(sizeof(BFSNode), alignof(BFSNode)))
+            BFSNode(self, move));
+  }
+
+  /**
+   * @return The parent of this node, or nullptr if it has no parent or its
+   * parent has been released.
+   */
+  BFSNode *get_parent_node() const {
+    return this->parent.expired() ? nullptr : parent_node;
   }
 
   /**
    * Private node constructor for nodes without meaningful move history (i.e.,
    * with no parents).
    *
+   * @param arena The arena the node is stored in.
    * @param board The board state prior to the move being represented by this
    * node is made.
    * @param val The heuristic value of the move this node represents.
    */
-  BFSNode(const Board &board, double val)
-      : Node<Board>(board), val(val), pess(0), opt(0) {
+  BFSNode(NodeArena *arena, const Board &board, double val)
+      : Node<Board>(board),
+        arena(arena),
+        parent_node(nullptr),
+        best_known_child(nullptr),
+        val(val),
+        pess(0),
+        opt(0) {
     setup_pess_opt();
   }
 
@@ -104,9 +139,12 @@ class BFSNode : public Node<Board> {
    * @param val The heuristic value of the move this node represents.
    * @param parent The parent of this node, if any.
    */
-  BFSNode(const std::shared_ptr<BFSNode> parent,
+  BFSNode(const std::shared_ptr<BFSNode> &parent,
           const typename Board::MoveT &move)
       : Node<Board>(parent, move),
+        arena(parent->arena),
+        parent_node(parent.get()),
+        best_known_child(nullptr),
         val(parent->board.active_player() == Player::Player1
                 ? parent->val + move.val
                 : parent->val - move.val),
@@ -115,6 +153,46 @@ class BFSNode : public Node<Board> {
     setup_pess_opt();
   }
 
+  /**
+   * Converts a pessimistic or optimistic estimate to a tree whose root lies
+   * the given number of layers deeper. Wins are worth less the deeper they
+   * occur, so every win or loss is worth as many points more from that root;
+   * draws are unchanged.
+   *
+   * @param outcome The estimate to convert.
+   * @param layers The number of layers between the old and the new root.
+   *
+   * @return The estimate as seen from the new root.
+   */
+  static int rebase_outcome(int outcome, std::size_t layers) {
+    const int shift = static_cast<int>(layers);
+    return outcome > 0 ? outcome + shift : outcome < 0 ? outcome - shift : 0;
+  }
+
+  /**
+   * Copies the values and the subtree of another node into this childless
+   * node, creating the copied children in this node's arena.
+   *
+   * @param other The node to copy.
+   * @param layers The number of layers this node lies above `other` in their
+   * respective trees.
+   */
+  void copy_subtree(const BFSNode &other, std::size_t layers) {
+    val = other.val;
+    pess = rebase_outcome(other.pess, layers);
+    opt = rebase_outcome(other.opt, layers);
+    const auto self =
+        std::static_pointer_cast<BFSNode>(this->shared_from_this());
+    this->children.reserve(other.children.size());
+    for (const auto &child : other.children) {
+      auto copy = create_child(self, downcast(child)->move);
+      copy->copy_subtree(*downcast(child), layers);
+      if (downcast(child) == other.best_known_child)
+        best_known_child = copy.get();
+      this->children.push_back(std::move(copy));
+    }
+  }
+
   /**
    * Establishes initial values for pess and opt based on the board state.
    */
@@ -188,7 +266,7 @@ class BFSNode : public Node<Board> {
    * @param child The child node that has been updated and whose new values
    * should be propagated to the root of the tree.
    */
-  void backpropagate(const std::shared_ptr<BFSNode> &child) {
+  void backpropagate(BFSNode *child) {
     if (!this->update_field_against_child(child->opt, opt)) update_opt();
     if (!this->update_field_against_child(child->pess, pess)) update_pess();
     if (!child->determined() &&
@@ -199,9 +277,7 @@ class BFSNode : public Node<Board> {
       update_best_determined();
     }
 
-    if (auto locked_parent = this->get_parent())
-      downcast(locked_parent)
-          ->backpropagate(downcast(this->shared_from_this()));
+    if (auto parent = get_parent_node()) parent->backpropagate(this);
   }
 
   /**
@@ -236,8 +312,8 @@ class BFSNode : public Node<Board> {
 
  public:
   /**
-   * Creates a node with no move history on the heap and returns a pointer to
-   * it.
+   * Creates a node with no move history in a new arena and returns a pointer
+   * to it.
    *
    * @param board The board state prior to the move being represented by this
    * node is made.
@@ -246,11 +322,35 @@ class BFSNode : public Node<Board> {
    * @return A pointer to the newly created node.
    */
   static std::shared_ptr<BFSNode> create(const Board &board, double val) {
-    return std::shared_ptr<BFSNode>(new BFSNode(board, val));
+    auto arena = NodeArena::create();
+    return adopt_arena_object(
+        arena, new (arena->allocate(sizeof(BFSNode), alignof(BFSNode)))
+                   BFSNode(arena.get(), board, val));
+  }
+
+  /**
+   * Copies the tree under a node into a new arena, as the tree of a search
+   * started from the node's position: the copy of the node is the root, and
+   * depths and the win distances of the pessimistic and optimistic estimates
+   * are measured from it. Nothing is shared with the original tree, so its
+   * arena can be released once the copy is made.
+   *
+   * @param node The node whose subtree to copy.
+   *
+   * @return A pointer to the copy of the node.
+   */
+  static std::shared_ptr<BFSNode> copy_as_root(const BFSNode &node) {
+    auto root = create(node.board, node.val);
+    root->copy_subtree(node, node.depth - root->depth);
+    return root;
   }
 
   virtual double get_value() const override { return val; }
 
+  virtual int get_pess() const override { return pess; }
+
+  virtual int get_opt() const override { return opt; }
+
   /**
    * @return True if the heuristic value of this node has converged, i.e. if the
    * pessimistic and optimistic bounds on the value of the node are equal.
@@ -276,17 +376,18 @@ class BFSNode : public Node<Board> {
   void expand(const std::vector<typename Board::MoveT> &moves) override {
     if (moves.empty()) return;
 
+    const auto self =
+        std::static_pointer_cast<BFSNode>(this->shared_from_this());
+    this->children.reserve(this->children.size() + moves.size());
     for (const typename Board::MoveT &move : moves) {
-      this->children.push_back(create_child(move));
+      this->children.push_back(create_child(self, move));
     }
 
     update_opt();
     update_pess();
     update_val();
     if (determined()) update_best_determined();
-    if (auto locked_parent = this->get_parent())
-      downcast(locked_parent)
-          ->backpropagate(downcast(this->shared_from_this()));
+    if (auto parent = get_parent_node()) parent->backpropagate(this);
   }
 
   /**
@@ -296,7 +397,7 @@ class BFSNode : public Node<Board> {
   std::size_t get_depth_of_pv() const override {
     const auto selected_node = this->select();
     if (selected_node == this->shared_from_this()) return 0;
-    return downcast(selected_node)->depth - this->depth - 1;
+    return selected_node->get_depth() - this->depth - 1;
   }
 
   /**
@@ -342,7 +443,7 @@ class BFSNode : public Node<Board> {
     if (best_known_child) {
       return best_known_child->select();
     } else {
-      return downcast(this->shared_from_this());
+      return this->shared_from_this();
     }
   }
 };
@@ -94,6 +94,19 @@ TEST(BFSNodeTest, TestNodeCountingFunctions) {
   // The best path through the tree for player 1 leads us to a position at depth
   // 4, and 4 - 1 - 1 = 2;
   EXPECT_EQ(game_tree->get_depth_of_pv(), 2U);
+
+  // All of the above are also collected together in a single pass. 3 nodes
+  // have 1 child, 3 have 2 children, and 4 have 3 children.
+  const auto statistics = game_tree->get_statistics();
+  EXPECT_EQ(statistics.node_count, 22U);
+  EXPECT_EQ(statistics.num_leaves, 12U);
+  EXPECT_EQ(statistics.num_internal_nodes, 10U);
+  EXPECT_EQ(statistics.sum_depth, 45U);
+  EXPECT_EQ(statistics.get_mean_depth(), 3.75);
+  EXPECT_EQ(statistics.get_average_branching_factor(), 2.1);
+  EXPECT_EQ(statistics.depth_of_pv, 2U);
+  EXPECT_EQ(statistics.branching_histogram,
+            (std::vector<std::size_t>{12, 3, 3, 4}));
 }
 
 /**
@@ -159,3 +172,124 @@ TEST(BFSNodeTest, TestGetBestMove) {
     }
   }
 }
+
+/**
+ * Tests that nodes remain usable after the rest of their tree is released.
+
+ */
+TEST(BFSNodeTest, TestSubtreeOutlivesRoot) {
+  using Board = NInARow::Board<3, 3, 3>;
+  auto game_tree = BFSNode<Board>::create(Board(), 0.0);
+
+  std::vector<Board::MoveT> moves;
+  moves.emplace_back(0, 0, 1.0, Player::Player1);
+  moves.emplace_back(1, 1, 0.0, Player::Player1);
+  game_tree->expand(moves);
+
+  auto child = game_tree->get_children()[0];
+  game_tree.reset();
+  EXPECT_EQ(child->get_parent(), nullptr);
+
+  // Expanding an orphaned node must not propagate to its released parent.
+  moves.clear();
+  moves.emplace_back(2, 2, 0.5, Player::Player2);
+  child->expand(moves);
+  EXPECT_EQ(child->get_num_leaves(), 1);
+  EXPECT_EQ(child->get_best_move().board_position,
+            Board::MoveT(2, 2, 0.0, Player::Player2).board_position);
+}
+
+/**
+ * Tests flattening a tree into arrays.
+ */
+TEST(BFSNodeTest, TestExportArrays) {
+  using Board = NInARow::Board<3, 3, 3>;
+  auto game_tree = BFSNode<Board>::create(Board(), 0.5);
+  game_tree->expand({Board::MoveT(0, 0, 1.0, Player::Player1),
+                     Board::MoveT(1, 1, 2.0, Player::Player1)});
+  auto child =
+      std::dynamic_pointer_cast<BFSNode<Board>>(game_tree->get_children()[1]);
+  child->expand({Board::MoveT(2, 2, 0.25, Player::Player2)});
+
+  const auto arrays = game_tree->export_arrays();
+  ASSERT_EQ(arrays.size(), game_tree->get_node_count());
+  EXPECT_EQ(arrays.parent, (std::vector<std::int64_t>{-1, 0, 0, 2}));
+  EXPECT_EQ(arrays.depth, (std::vector<std::int64_t>{1, 2, 2, 3}));
+  EXPECT_EQ(arrays.move, (std::vector<std::int64_t>{-1, 0, 4, 8}));
+  std::size_t i = 0;
+  for (const auto& node : *game_tree) {
+    EXPECT_EQ(arrays.value[i], node.get_value());
+    EXPECT_EQ(arrays.pess[i], node.get_pess());
+    EXPECT_EQ(arrays.opt[i], node.get_opt());
+    EXPECT_EQ(arrays.determined[i], node.determined());
+    const auto board = node.get_board();
+    EXPECT_EQ(arrays.black_pieces[i],
+              board.get_pieces(Player::Player1).positions.to_ullong());
+    EXPECT_EQ(arrays.white_pieces[i],
+              board.get_pieces(Player::Player2).positions.to_ullong());
+    ++i;
+  }
+
+  // Exports can be limited to the top of the tree, or start below the root.
+  EXPECT_EQ(game_tree->export_arrays(1).size(), 1);
+  EXPECT_EQ(game_tree->export_arrays(2).size(), 3);
+  const auto subtree = child->export_arrays();
+  EXPECT_EQ(subtree.parent, (std::vector<std::int64_t>{-1, 0}));
+  EXPECT_EQ(subtree.depth, (std::vector<std::int64_t>{2, 3}));
+
+  EXPECT_EQ(arrays.get_address("value"),
+            reinterpret_cast<std::uintptr_t>(arrays.value.data()));
+  EXPECT_THROW(arrays.get_address("missing"), std::invalid_argument);
+}
+
+TEST(BFSNodeTest, TestCopyAsRoot) {
+  using Board = NInARow::Board<3, 3, 3>;
+  // Play out a game in which black wins on the top row, and the same game
+  // from black's first move onwards.
+  const std::vector<Board::MoveT> moves = {
+      Board::MoveT(0, 0, 1.0, Player::Player1),
+      Board::MoveT(1, 0, 0.5, Player::Player2),
+      Board::MoveT(0, 1, 1.0, Player::Player1),
+      Board::MoveT(1, 1, 0.5, Player::Player2),
+      Board::MoveT(0, 2, 1.0, Player::Player1)};
+  auto game_tree = BFSNode<Board>::create(Board(), 0.0);
+  auto node = game_tree;
+  for (const auto& move : moves) {
+    node->expand({move});
+    node = std::static_pointer_cast<BFSNode<Board>>(node->get_children()[0]);
+  }
+  auto child =
+      std::static_pointer_cast<BFSNode<Board>>(game_tree->get_children()[0]);
+  auto expected = BFSNode<Board>::create(child->get_board(), 0.0);
+  node = expected;
+  for (std::size_t i = 1; i < moves.size(); ++i) {
+    node->expand({moves[i]});
+    node = std::static_pointer_cast<BFSNode<Board>>(node->get_children()[0]);
+  }
+  ASSERT_TRUE(child->determined());
+
+  // The copy is scored as if the game had started at the child.
+  const auto copy = BFSNode<Board>::copy_as_root(*child);
+  EXPECT_FALSE(copy->get_parent());
+  EXPECT_EQ(copy->get_node_count(), child->get_node_count());
+  EXPECT_EQ(copy->get_best_move().board_position,
+            child->get_best_move().board_position);
+  auto original = child->begin();
+  auto copied = copy->begin();
+  for (const auto& node : *expected) {
+    EXPECT_EQ(copied->get_board(), node.get_board());
+    EXPECT_EQ(copied->get_depth(), node.get_depth());
+    EXPECT_EQ(copied->get_pess(), node.get_pess());
+    EXPECT_EQ(copied->get_opt(), node.get_opt());
+    EXPECT_EQ(copied->get_value(), original->get_value());
+    ++original;
+    ++copied;
+  }
+  EXPECT_EQ(copied, copy->end());
+
+  // The copy doesn't share any nodes with the original.
+  const std::weak_ptr<BFSNode<Board>> released = child;
+  game_tree.reset();
+  child.reset();
+  EXPECT_TRUE(released.expired());
+}
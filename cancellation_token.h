@@ -0,0 +1,83 @@
+#ifndef CANCELLATION_TOKEN_H_INCLUDED
+#define CANCELLATION_TOKEN_H_INCLUDED
+
+#include <atomic>
+#include <cstdint>
+#include <memory>
+#include <stdexcept>
+
+/**
+ * A flag that can be raised to ask running searches to stop early. The flag
+ * is either owned by the token, or is a single byte of externally owned memory,
+ * e.g. a `multiprocessing.Value` or a slot of a shared memory block, so that
+ * searches in several processes can be cancelled at once. Any nonzero value of
+ * the byte means the token has been cancelled.
+ */
+class CancellationToken {
+ private:
+  /**
+   * The flag used if the token doesn't refer to external memory.
+   */
+  std::atomic<std::uint8_t> own_flag;
+
+  /**
+   * The flag being watched; either `own_flag` or external memory.
+   */
+  std::atomic<std::uint8_t>* flag;
+
+  static_assert(sizeof(std::atomic<std::uint8_t>) == 1,
+                "External flags are expected to be a single byte.");
+
+  /**
+   * Constructor.
+   *
+   * @param flag The flag to watch, or nullptr to use the token's own flag.
+   */
+  explicit CancellationToken(std::atomic<std::uint8_t>* flag)
+      : own_flag(0), flag(flag ? flag : &own_flag) {}
+
+ public:
+  /**
+   * @return A pointer to a new, uncancelled token that owns its flag.
+   */
+  static std::shared_ptr<CancellationToken> create() {
+    return std::shared_ptr<CancellationToken>(new CancellationToken(nullptr));
+  }
+
+  /**
+   * Creates a token that watches a byte of externally owned memory. The memory
+   * must outlive the token and every search using it.
+   *
+   * @param address The address of the byte to watch, e.g.
+   * `ctypes.addressof(value.get_obj())` for a `multiprocessing.Value('b')`.
+   *
+   * @return A pointer to a new token watching the given byte.
+   */
+  static std::shared_ptr<CancellationToken> from_address(
+      std::uint64_t address) {
+    if (address == 0)
+      throw std::invalid_argument("Cannot watch a null cancellation flag!");
+    return std::shared_ptr<CancellationToken>(
+        new CancellationToken(reinterpret_cast<std::atomic<std::uint8_t>*>(
+            static_cast<std::uintptr_t>(address))));
+  }
+
+  /**
+   * Raises the flag, cancelling every search using this token.
+   */
+  void cancel() { flag->store(1, std::memory_order_release); }
+
+  /**
+   * Lowers the flag, so that the token can be reused.
+   */
+  void reset() { flag->store(0, std::memory_order_release); }
+
+  /**
+   * @return True if the flag has been raised.
+   */
+  bool is_cancelled() const {
+    return flag->load(std::memory_order_acquire) != 0;
+  }
+};
+
+#endif  // CANCELLATION_TOKEN_H_INCLUDED
@@ -1,19 +1,35 @@
 // fourbynine.i - SWIG interface
-%module(directors="1") fourbynine
+%module(directors="1", threads="1") fourbynine
 %{
 #include "game_tree_node.h"
 #include "bfs_node.h"
+#include "cancellation_token.h"
 #include "ninarow_bfs.h"
 #include "ninarow_board.h"
 #include "ninarow_move.h"
+#include "ninarow_move_histogram.h"
 #include "ninarow_pattern.h"
 #include "ninarow_heuristic.h"
 #include "ninarow_heuristic_feature.h"
+#include "ninarow_ibs.h"
+#include "ninarow_transposition_table.h"
 #include "fourbynine_features.h"
 #include "player.h"
 #include "searches.h"
 %}
 
+// Only release the GIL around the calls that do real work. Searches keep their
+// mutable state in their own SearchContext, so these can run concurrently from
+// several Python threads sharing one heuristic. Director upcalls still take the
+// GIL, so searches subclassed in Python may run while it is released.
+%nothreadallow;
+%threadallow AbstractSearch::complete_search;
+%threadallow AbstractSearch::sample_move;
+%threadallow NInARow::Heuristic<NInARow::Board<4, 9, 4>>::get_moves;
+%threadallow NInARow::Heuristic<NInARow::Board<4, 9, 4>>::evaluate;
+%threadallow NInARow::InverseBinomialSampler<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>::estimate_log_likelihoods;
+%threadallow NInARow::sample_move_histogram<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>;
+
 %include "stdint.i"
 %include "std_string.i"
 %include "std_vector.i"
@@ -31,22 +47,79 @@
   }
 }
 
+%shared_ptr(CancellationToken);
 %shared_ptr(NInARow::Heuristic<NInARow::Board<4, 9, 4>>);
+%shared_ptr(NInARow::TranspositionTable<NInARow::Board<4, 9, 4>>);
 %shared_ptr(Node<NInARow::Board<4, 9, 4>>);
 %shared_ptr(BFSNode<NInARow::Board<4, 9, 4>>);
 %shared_ptr(AbstractSearch<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>);
 %shared_ptr(Search<NInARow::Heuristic<NInARow::Board<4, 9, 4>>, BFSNode<NInARow::Board<4, 9, 4>>>);
 %shared_ptr(NInARow::NInARowBestFirstSearch<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>);
 
+// Feature overlap counts are only ever passed between C++ calls, so expose them
+// to Python as an opaque type.
+namespace NInARow {
+struct FeatureOverlapCounts;
+}
+
+// Cached evaluations are only read and written by the heuristic; Python only
+// needs the table's statistics.
+%ignore NInARow::TranspositionTable::find;
+%ignore NInARow::TranspositionTable::insert;
+
+// Search contexts are owned by the searches themselves.
+%ignore NInARow::SearchContext;
+
+// Exported tree fields are viewed through get_buffer() below instead.
+%ignore TreeArrays::parent;
+%ignore TreeArrays::depth;
+%ignore TreeArrays::move;
+%ignore TreeArrays::value;
+%ignore TreeArrays::pess;
+%ignore TreeArrays::opt;
+%ignore TreeArrays::determined;
+%ignore TreeArrays::black_pieces;
+%ignore TreeArrays::white_pieces;
+
+%extend TreeArrays {
+%pythoncode %{
+    field_formats = {"parent": "q", "depth": "q", "move": "q", "value": "d", "pess": "i", "opt": "i",
+                     "determined": "B", "black_pieces": "Q", "white_pieces": "Q"}
+
+    def get_buffer(self, field):
+        """
+        Args:
+            field: The name of a field, e.g. "parent".
+
+        Returns:
+            A read-only memoryview of the field that shares its memory and keeps these arrays alive, e.g. for
+            numpy.asarray().
+        """
+        import ctypes
+        import struct
+        field_format = self.field_formats[field]
+        size = self.size() * struct.calcsize(field_format)
+        if size == 0:
+            return memoryview(b"").cast(field_format)
+        buffer = (ctypes.c_char * size).from_address(self.get_address(field))
+        buffer.owner = self
+        return memoryview(buffer).toreadonly().cast("B").cast(field_format)
+%}
+}
+
 // Parse the original header files
 %include "game_tree_node.h"
 %include "bfs_node.h"
+%include "cancellation_token.h"
 %include "ninarow_bfs.h"
 %include "ninarow_board.h"
 %include "ninarow_move.h"
+%include "ninarow_move_histogram.h"
 %include "ninarow_pattern.h"
 %include "ninarow_heuristic.h"
 %include "ninarow_heuristic_feature.h"
+%include "ninarow_ibs.h"
+%include "ninarow_transposition_table.h"
 %include "fourbynine_features.h"
 %include "player.h"
 %include "searches.h"
@@ -56,19 +129,29 @@
 %template(fourbynine_board) NInARow::Board<4, 9, 4>;
 %template(fourbynine_move) NInARow::Move<4, 9, 4>;
 %template(fourbynine_pattern) NInARow::Pattern<4, 9, 4>;
+%template(fourbynine_transposition_table) NInARow::TranspositionTable<NInARow::Board<4, 9, 4>>;
 %template(fourbynine_heuristic) NInARow::Heuristic<NInARow::Board<4, 9, 4>>;
+%template(fourbynine_inverse_binomial_sampler) NInARow::InverseBinomialSampler<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>;
 %template(fourbynine_heuristic_feature) NInARow::HeuristicFeature<NInARow::Board<4, 9, 4>>;
 %template(fourbynine_heuristic_feature_with_metadata) NInARow::HeuristicFeatureWithMetadata<NInARow::Board<4, 9, 4>>;
 %template(fourbynine_game_tree_node) Node<NInARow::Board<4, 9, 4>>;
 %template(fourbynine_bfs_node) BFSNode<NInARow::Board<4, 9, 4>>;
 
 %template(DoubleVector) std::vector<double>;
+%template(SizeVector) std::vector<size_t>;
+%template(BoardVector) std::vector<NInARow::Board<4, 9, 4>>;
+%template(PatternVector) std::vector<NInARow::Pattern<4, 9, 4>>;
 %template(MoveVector) std::vector<NInARow::Move<4, 9, 4>>;
 %template(NodeVector) std::vector<std::shared_ptr<Node<NInARow::Board<4, 9, 4>>>>;
 %template(BFSNodeVector) std::vector<std::shared_ptr<BFSNode<NInARow::Board<4, 9, 4>>>>;
 %template(FeatureGroupWeightVector) std::vector<NInARow::FeatureGroupWeight>;
 %template(FeatureWithMetadataVector) std::vector<NInARow::HeuristicFeatureWithMetadata<NInARow::Board<4, 9, 4>>>;
 
+// Instantiated after the vectors so that their arguments and results convert to and from Python sequences.
+%template(fourbynine_sample_move_histogram) NInARow::sample_move_histogram<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>;
+%template(fourbynine_count_threats_made) NInARow::count_threats_made<NInARow::Board<4, 9, 4>>;
+%template(fourbynine_count_threats_defended) NInARow::count_threats_defended<NInARow::Board<4, 9, 4>>;
+
 %feature("director") AbstractSearch;
 %template(AbstractSearch) AbstractSearch<NInARow::Heuristic<NInARow::Board<4, 9, 4>>>;
 
@@ -1,12 +1,162 @@
 #ifndef GAME_TREE_NODE_H_INCLUDED
 #define GAME_TREE_NODE_H_INCLUDED
 
+#include <cstdint>
 #include <memory>
 #include <queue>
 #include <sstream>
+#include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
 
 #include "player.h"
 
+/**
+ * A flattened copy of a game tree, with one entry per node in each field.
+ * Nodes are stored in breadth-first order, so the root comes first and every
+ * node comes after its parent. Each field is contiguous, so that it can be
+ * viewed without copying, e.g. as a NumPy array.
+ */
+struct TreeArrays {
+  /**
+   * The index of the parent of each node, or -1 for the root.
+   */
+  std::vector<std::int64_t> parent;
+
+  /**
+   * The depth of each node in its tree (see `Node::get_depth`). Exports that
+   * start below the root keep the depths of the full tree.
+   */
+  std::vector<std::int64_t> depth;
+
+  /**
+   * The board position of the move leading to each node, or -1 for the root.
+   */
+  std::vector<std::int64_t> move;
+
+  /**
+   * The heuristic value of each node.
+   */
+  std::vector<double> value;
+
+  /**
+   * The pessimistic bound on the value of each node.
+   */
+  std::vector<std::int32_t> pess;
+
+  /**
+   * The optimistic bound on the value of each node.
+   */
+  std::vector<std::int32_t> opt;
+
+  /**
+   * 1 if each node is determined, 0 otherwise.
+   */
+  std::vector<std::uint8_t> determined;
+
+  /**
+   * The bitboards of the black and white pieces of each node's position.
+   * @{
+   */
+  std::vector<std::uint64_t> black_pieces;
+  std::vector<std::uint64_t> white_pieces;
+  /**
+   * @}
+   */
+
+  /**
+   * @return The number of nodes.
+   */
+  std::size_t size() const { return parent.size(); }
+
+  /**
+   * @param field The name of a field, e.g. "parent".
+   *
+   * @return The address of the first element of the field, so that it can be
+   * viewed without copying, e.g. from Python. Only valid as long as these
+   * arrays are alive and unchanged.
+   */
+  std::uint64_t get_address(const std::string &field) const {
+    const void *data;
+    if (field == "parent") {
+      data = parent.data();
+    } else if (field == "depth") {
+      data = depth.data();
+    } else if (field == "move") {
+      data = move.data();
+    } else if (field == "value") {
+      data = value.data();
+    } else if (field == "pess") {
+      data = pess.data();
+    } else if (field == "opt") {
+      data = opt.data();
+    } else if (field == "determined") {
+      data = determined.data();
+    } else if (field == "black_pieces") {
+      data = black_pieces.data();
+    } else if (field == "white_pieces") {
+      data = white_pieces.data();
+    } else {
+      throw std::invalid_argument("No such field: " + field);
+    }
+    return reinterpret_cast<std::uintptr_t>(data);
+  }
+};
+
+/**
+ * Summary statistics of a game tree, all collected in a single traversal.
+ */
+struct TreeStatistics {
+  /**
+   * The number of nodes in the tree.
+   */
+  std::size_t node_count = 0;
+
+  /**
+   * The number of leaf nodes, i.e. nodes without children.
+   */
+  std::size_t num_leaves = 0;
+
+  /**
+   * The number of internal nodes, i.e. nodes with children.
+   */
+  std::size_t num_internal_nodes = 0;
+
+  /**
+   * The sum of the depths of the leaf nodes (see `Node::get_depth`).
+   */
+  std::size_t sum_depth = 0;
+
+  /**
+   * The number of moves between the root and its recursively best known child
+   * (see `Node::get_depth_of_pv`).
+   */
+  std::size_t depth_of_pv = 0;
+
+  /**
+   * The number of nodes with each number of children, indexed by the number of
+   * children.
+   */
+  std::vector<size_t> branching_histogram;
+
+  /**
+   * @return The average depth of the leaf nodes.
+   */
+  double get_mean_depth() const {
+    return static_cast<double>(sum_depth) / num_leaves;
+  }
+
+  /**
+   * @return The average number of children of the internal nodes, or zero if
+   * there are none.
+   */
+  double get_average_branching_factor() const {
+    if (num_internal_nodes == 0) return 0.0;
+    return static_cast<double>(node_count - 1) / num_internal_nodes;
+  }
+};
+
 /**
  * Represents a single node in the game tree.
  *
@@ -236,7 +386,7 @@ class Node : public std::enable_shared_from_this<Node<Board>> {
    * @param parent The parent of this node.
    * @param move The move represented by this node.
    */
-  Node(const std::shared_ptr<Node> parent, const typename Board::MoveT &move)
+  Node(const std::shared_ptr<Node> &parent, const typename Board::MoveT &move)
       : children(),
         parent(parent),
         depth(1U + parent->depth),
@@ -279,16 +429,7 @@ class Node : public std::enable_shared_from_this<Node<Board>> {
    * @return The sum of the depth of all of the leaf nodes in the tree beneath
    * us, including us.
    */
-  std::size_t get_sum_depth() const {
-    if (children.empty()) {
-      return depth;
-    }
-    std::size_t n = 0;
-    for (const auto &child : children) {
-      n += child->get_sum_depth();
-    }
-    return n;
-  }
+  std::size_t get_sum_depth() const { return get_statistics().sum_depth; }
 
  public:
   /**
@@ -327,40 +468,53 @@ class Node : public std::enable_shared_from_this<Node<Board>> {
             ->select());
   }
 
+  /**
+   * Collects the statistics of the tree beneath us in a single iterative
+   * traversal, so that they can be computed together for the cost of one.
+   *
+   * @return The statistics of the tree beneath us, including us.
+   */
+  TreeStatistics get_statistics() const {
+    TreeStatistics statistics;
+    std::vector<const Node *> nodes{this};
+    while (!nodes.empty()) {
+      const Node *node = nodes.back();
+      nodes.pop_back();
+      const std::size_t num_children = node->children.size();
+      ++statistics.node_count;
+      if (statistics.branching_histogram.size() <= num_children)
+        statistics.branching_histogram.resize(num_children + 1);
+      ++statistics.branching_histogram[num_children];
+      if (num_children == 0) {
+        ++statistics.num_leaves;
+        statistics.sum_depth += node->depth;
+      } else {
+        ++statistics.num_internal_nodes;
+        for (const auto &child : node->children) nodes.push_back(child.get());
+      }
+    }
+    statistics.depth_of_pv = get_depth_of_pv();
+    return statistics;
+  }
+
   /**
    * Find the number of leaf nodes beneath us, including us. A leaf node is
    * defined as a node that has no best known children.
    *
    * @return The number of leaf nodes beneath us, including us.
    */
-  std::size_t get_num_leaves() const {
-    if (children.empty()) {
-      return 1;
-    }
-    std::size_t n = 0;
-    for (const auto &child : children) {
-      n += child->get_num_leaves();
-    }
-    return n;
-  }
+  std::size_t get_num_leaves() const { return get_statistics().num_leaves; }
 
   /**
    * @return The number of all nodes in the tree.
    */
-  std::size_t get_node_count() const {
-    std::size_t node_count = 1;
-    for (const auto &child : children) {
-      node_count += child->get_node_count();
-    }
-    return node_count;
-  }
+  std::size_t get_node_count() const { return get_statistics().node_count; }
 
   /**
    * @return The average branching factor of the tree.
    */
   double get_average_branching_factor() const {
-    if (children.empty()) return 0.0;
-    return static_cast<double>(get_node_count() - 1) / get_num_internal_nodes();
+    return get_statistics().get_average_branching_factor();
   }
 
   /**
@@ -370,23 +524,14 @@ class Node : public std::enable_shared_from_this<Node<Board>> {
    * @return The number of internal nodes beneath us, including us.
    */
   std::size_t get_num_internal_nodes() const {
-    if (children.empty()) {
-      return 0;
-    }
-    std::size_t n = 1;
-    for (const auto &child : children) {
-      n += child->get_num_internal_nodes();
-    }
-    return n;
+    return get_statistics().num_internal_nodes;
   }
 
   /**
    * @return The average depth of all of the leaf nodes in the tree beneath us,
    * including us.
    */
-  double get_mean_depth() const {
-    return (static_cast<double>(get_sum_depth()) / get_num_leaves());
-  }
+  double get_mean_depth() const { return get_statistics().get_mean_depth(); }
 
   /**
    * @return The best known move from the current position for the current
@@ -394,6 +539,66 @@ class Node : public std::enable_shared_from_this<Node<Board>> {
    */
   virtual typename Board::MoveT get_best_move() const = 0;
 
+  /**
+   * @return A pessimistic bound on the value of this node.
+   */
+  virtual int get_pess() const = 0;
+
+  /**
+   * @return An optimistic bound on the value of this node.
+   */
+  virtual int get_opt() const = 0;
+
+  /**
+   * Flattens the tree under this node into contiguous arrays in a single pass,
+   * which is much cheaper than walking the tree node by node from Python.
+   *
+   * @param max_depth How many layers of the tree to export, including this
+   * node, or zero to export the whole tree.
+   *
+   * @return The exported tree, with this node as its root.
+   */
+  TreeArrays export_arrays(std::size_t max_depth = 0) const {
+    TreeArrays arrays;
+    std::vector<std::pair<const Node *, std::int64_t>> nodes{{this, -1}};
+    for (std::size_t i = 0; i < nodes.size(); ++i) {
+      const Node &node = *nodes[i].first;
+      if (max_depth == 0 || node.depth - depth + 1 < max_depth) {
+        for (const auto &child : node.children) {
+          nodes.emplace_back(child.get(), static_cast<std::int64_t>(i));
+        }
+      }
+    }
+
+    const std::size_t size = nodes.size();
+    arrays.parent.reserve(size);
+    arrays.depth.reserve(size);
+    arrays.move.reserve(size);
+    arrays.value.reserve(size);
+    arrays.pess.reserve(size);
+    arrays.opt.reserve(size);
+    arrays.determined.reserve(size);
+    arrays.black_pieces.reserve(size);
+    arrays.white_pieces.reserve(size);
+    for (const auto &entry : nodes) {
+      const Node &node = *entry.first;
+      arrays.parent.push_back(entry.second);
+      arrays.depth.push_back(node.depth);
+      arrays.move.push_back(entry.second < 0 ? -1
+                                             : static_cast<std::int64_t>(
+                                                   node.move.board_position));
+      arrays.value.push_back(node.get_value());
+      arrays.pess.push_back(node.get_pess());
+      arrays.opt.push_back(node.get_opt());
+      arrays.determined.push_back(node.determined());
+      arrays.black_pieces.push_back(
+          node.board.get_pieces(Player::Player1).positions.to_ullong());
+      arrays.white_pieces.push_back(
+          node.board.get_pieces(Player::Player2).positions.to_ullong());
+    }
+    return arrays;
+  }
+
  protected:
   /**
    * Select the next move to be searched from among our children recursively.
@@ -311,22 +311,26 @@ class BoardDisplay(QWidget):
         if (self.board.contains_spaces(new_move.board_position) and not self.board.game_has_ended()):
             self.board += new_move
             self.move_history.add_board(self.board)
-            self.on_board_update()
+            self.on_board_update(played_move=new_move)
 
     def play_best_move(self):
         if not self.board.game_has_ended():
             self.play_move(
                 self.heuristic.get_best_move(self.search.get_tree()))
 
-    def on_board_update(self, player_ghost=None):
+    def on_board_update(self, player_ghost=None, played_move=None):
         self.heuristic_values = self.heuristic.get_moves(
             self.board, self.board.active_player())
         self.hover = None
         self.player_ghost = player_ghost
         self.candidate_moves = []
-        self.search = None
-        self.search = self.create_search(
-            self.heuristic, self.board)
+        if played_move is None or self.board.game_has_ended():
+            self.search = None
+            self.search = self.create_search(
+                self.heuristic, self.board)
+        else:
+            # Keep the part of the search tree under the move that was just played.
+            self.search.advance_root(played_move)
         self.feature_list.update(
             self.heuristic, self.board)
 
@@ -0,0 +1,197 @@
+import numpy as np
+from fourbynine import fourbynine_board
+
+BOARD_HEIGHT = fourbynine_board.get_board_height()
+BOARD_WIDTH = fourbynine_board.get_board_width()
+BOARD_SIZE = fourbynine_board.get_board_size()
+
+# The (row, col) coordinates of every board position. (0, 0) is the upper left corner.
+COORDINATES = np.stack(np.divmod(np.arange(BOARD_SIZE), BOARD_WIDTH), axis=1)
+
+# DISTANCES[i, j] is the Manhattan distance between board positions i and j.
+DISTANCES = np.abs(COORDINATES[:, None, :] -
+                   COORDINATES[None, :, :]).sum(axis=2)
+
+# ADJACENCY[i, j] is True if board positions i and j are orthogonal neighbors.
+ADJACENCY = DISTANCES == 1
+
+
+def bitboards_to_masks(bitboards):
+    """
+    Unpacks bitboards into boolean masks.
+
+    Args:
+        bitboards: An array of bitboards, with bit i set if board position i is occupied, as stored in
+                   MoveDataset.data["black_pieces"].
+
+    Returns:
+        A boolean array of shape (len(bitboards), BOARD_SIZE), True where a position is occupied.
+    """
+    bitboards = np.asarray(bitboards, dtype=np.uint64)
+    return ((bitboards[:, None] >> np.arange(BOARD_SIZE, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+
+
+# WIN_LINES[k, i] is True if board position i is part of the k-th line of fourbynine_board.get_win_lines(), i.e. the
+# k-th line that wins the game when covered by a single player.
+WIN_LINES = bitboards_to_masks(
+    [int(line.to_string(), 2) for line in fourbynine_board.get_win_lines()])
+
+# The number of pieces in a row needed to win.
+WIN_LENGTH = int(WIN_LINES[0].sum())
+
+
+def split_pieces_by_player(black_pieces, white_pieces):
+    """
+    Splits the pieces of each board into those of the player to move and those of their opponent.
+
+    Args:
+        black_pieces: An array of bitboards of the black pieces of each board.
+        white_pieces: An array of bitboards of the white pieces of each board.
+
+    Returns:
+        The pieces of the player to move and the pieces of their opponent, as masks of shape (number of boards,
+        BOARD_SIZE).
+    """
+    black = bitboards_to_masks(black_pieces)
+    white = bitboards_to_masks(white_pieces)
+    # Black plays first, so black is to move whenever both players have the same number of pieces.
+    black_to_move = (black.sum(axis=1) == white.sum(axis=1))[:, None]
+    return np.where(black_to_move, black, white), np.where(black_to_move, white, black)
+
+
+def distance_from_center(moves):
+    """
+    Args:
+        moves: An array of move indices.
+
+    Returns:
+        The Manhattan distance between each move and the center of the board.
+    """
+    center = np.array([(BOARD_HEIGHT - 1) / 2, (BOARD_WIDTH - 1) / 2])
+    return np.abs(COORDINATES[moves] - center).sum(axis=1)
+
+
+def average_distance_from_pieces(pieces, moves):
+    """
+    Args:
+        pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces to measure against.
+        moves: An array of move indices.
+
+    Returns:
+        The average Manhattan distance between each move and every piece in the corresponding row of pieces, or 0 if
+        the row has no pieces.
+    """
+    num_pieces = pieces.sum(axis=1)
+    total_distance = (DISTANCES[moves] * pieces).sum(axis=1)
+    return np.divide(total_distance, num_pieces, out=np.zeros(len(moves)), where=num_pieces > 0)
+
+
+def distance_from_center_of_mass(pieces, moves):
+    """
+    Args:
+        pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces to measure against.
+        moves: An array of move indices.
+
+    Returns:
+        The Manhattan distance between each move and the center of mass of the corresponding row of pieces, or 0 if
+        the row has no pieces.
+    """
+    num_pieces = pieces.sum(axis=1)
+    center_of_mass = np.divide(pieces @ COORDINATES, num_pieces[:, None], out=np.zeros((len(moves), 2)),
+                               where=num_pieces[:, None] > 0)
+    distance = np.abs(COORDINATES[moves] - center_of_mass).sum(axis=1)
+    return np.where(num_pieces > 0, distance, 0.0)
+
+
+def count_neighbors(pieces, moves):
+    """
+    Args:
+        pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces to check against.
+        moves: An array of move indices.
+
+    Returns:
+        The number of pieces in the corresponding row of pieces orthogonally adjacent to each move.
+    """
+    return (ADJACENCY[moves] & pieces).sum(axis=1)
+
+
+def _count_line_pieces(own_pieces, opponent_pieces, moves):
+    """
+    Args:
+        own_pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces of the player to move.
+        opponent_pieces: A mask of the same shape of the pieces of their opponent.
+        moves: An array of move indices.
+
+    Returns:
+        The number of pieces of the player to move and of their opponent on each winning line once each move is
+        played, as two arrays of shape (number of moves, number of lines), and a mask of the same shape that is True
+        for the lines containing each move.
+    """
+    own_pieces = own_pieces.copy()
+    own_pieces[np.arange(len(moves)), moves] = True
+    lines = WIN_LINES.T.astype(np.int64)
+    return own_pieces @ lines, opponent_pieces @ lines, WIN_LINES[:, moves].T
+
+
+def count_threats_made(own_pieces, opponent_pieces, moves):
+    """
+    Counts the threats made by a batch of moves, as fourbynine_board.count_threats_made() does for a single move.
+
+    Args:
+        own_pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces of the player to move.
+        opponent_pieces: A mask of the same shape of the pieces of their opponent.
+        moves: An array of move indices.
+
+    Returns:
+        The number of winning lines through each move that it leaves with WIN_LENGTH - 1 pieces of the player who
+        moved and a single empty position.
+    """
+    own, opponent, contains_move = _count_line_pieces(
+        own_pieces, opponent_pieces, moves)
+    return (contains_move & (own == WIN_LENGTH - 1) & (opponent == 0)).sum(axis=1)
+
+
+def count_threats_defended(own_pieces, opponent_pieces, moves):
+    """
+    Counts the threats defended by a batch of moves, as fourbynine_board.count_threats_defended() does for a single
+    move.
+
+    Args:
+        own_pieces: A mask of shape (number of moves, BOARD_SIZE) of the pieces of the player to move.
+        opponent_pieces: A mask of the same shape of the pieces of their opponent.
+        moves: An array of move indices.
+
+    Returns:
+        The number of winning lines through each move that hold WIN_LENGTH - 1 of the opponent's pieces, and that
+        the move blocks.
+    """
+    own, opponent, contains_move = _count_line_pieces(
+        own_pieces, opponent_pieces, moves)
+    return (contains_move & (own == 1) & (opponent == WIN_LENGTH - 1)).sum(axis=1)
+
+
+def compute_board_statistics(black_pieces, white_pieces, moves):
+    """
+    Computes every board statistic of the summary plots for a batch of moves.
+
+    Args:
+        black_pieces: An array of bitboards of the black pieces of the board each move is played on.
+        white_pieces: An array of bitboards of the white pieces of the board each move is played on.
+        moves: An array of move indices.
+
+    Returns:
+        A dictionary mapping the name of each statistic to an array of its value for each move.
+    """
+    moves = np.asarray(moves, dtype=np.int64)
+    own, opponent = split_pieces_by_player(black_pieces, white_pieces)
+    return {
+        "distance_from_center": distance_from_center(moves),
+        "distance_from_own_pieces": average_distance_from_pieces(own, moves),
+        "distance_from_opponent_pieces": average_distance_from_pieces(opponent, moves),
+        "distance_from_own_center_of_mass": distance_from_center_of_mass(own, moves),
+        "distance_from_opponent_center_of_mass": distance_from_center_of_mass(opponent, moves),
+        "own_neighbors": count_neighbors(own, moves),
+        "opponent_neighbors": count_neighbors(opponent, moves),
+        "threats_made": (count_threats_made(own, opponent, moves) > 0).astype(float),
+        "threats_defended": (count_threats_defended(own, opponent, moves) > 0).astype(float),
+    }
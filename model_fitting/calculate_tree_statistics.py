@@ -52,6 +52,33 @@ def sample_average_branching_factor(heuristic, positions, num_samples, disable_t
     return float(total_branching_factor) / (len(positions) * num_samples)
 
 
+def sample_tree_statistics(heuristic, positions, num_samples, disable_tqdm=True):
+    """
+    Given a heuristic and a list of positions, find both the average planning depth and the average
+    branching factor for the heuristic across all of the positions. Each search contributes to both
+    statistics, so this costs as much as sample_planning_depth() alone.
+
+    Args:
+        heuristic: The heuristic to use.
+        positions: A list of positions to evaluate.
+        num_samples: The number of samples to take in each position.
+        disable_tqdm: If true, suppress TQDM command line output
+
+    Returns:
+        The average planning depth and average branching factor of the given heuristic across all given positions.
+    """
+    total_depth = 0
+    total_branching_factor = 0.0
+    for position in tqdm(positions, disable=disable_tqdm):
+        for i in range(num_samples):
+            statistics = search_from_position(
+                position, heuristic).get_statistics()
+            total_depth += statistics.depth_of_pv
+            total_branching_factor += statistics.get_average_branching_factor()
+    num_searches = len(positions) * num_samples
+    return float(total_depth) / num_searches, total_branching_factor / num_searches
+
+
 def calculate_tree_statistics_from_file(path, heuristic, num_samples=10):
     """
     Given a file containing many positions, return some tree statistics across
@@ -64,7 +91,7 @@ def calculate_tree_statistics_from_file(path, heuristic, num_samples=10):
     """
     moves = parse_participant_file(path)
     positions = [move.board for move in moves]
-    return sample_planning_depth(heuristic, positions, num_samples, False), sample_average_branching_factor(heuristic, positions, num_samples, False)
+    return sample_tree_statistics(heuristic, positions, num_samples, False)
 
 
 def main():
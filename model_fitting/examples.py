@@ -109,17 +109,18 @@ def play_game_to_completion(heuristic):
     heuristic.seed_generator(random.randint(0, 2**64))
     current_player = False
     current_position = fourbynine_board()
+    bfs = NInARowBestFirstSearch(heuristic, current_position)
     while not current_position.game_has_ended():
         start = time.time()
-        bfs = NInARowBestFirstSearch(
-            heuristic, current_position)
-        bfs.complete_search()
-        best_move = heuristic.get_best_move(bfs.get_tree())
+        best_move = bfs.sample_move()
         end = time.time()
         moves.append(move_to_csv_string(current_position,
                      best_move, end - start, 1, "DefaultHeuristic"))
         current_position = current_position + best_move
         current_player = not current_player
+        if not current_position.game_has_ended():
+            # With noise enabled, this starts a fresh search from the new position.
+            bfs.advance_root(best_move)
     return moves, current_position
 
 
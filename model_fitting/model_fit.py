@@ -1,20 +1,53 @@
 from collections import defaultdict
 from functools import total_ordering
 import atomics
-from UltraDict import UltraDict
 import argparse
 import numpy as np
-from scipy.interpolate import CubicSpline
+from scipy.special import spence
 import random
 import fourbynine
 import copy
+import struct
 import time
-from multiprocessing import Pool, Value, set_start_method
+from multiprocessing import Condition, Pool, set_start_method
+from multiprocessing.shared_memory import SharedMemory
 from pybads import BADS
 from pathlib import Path
 from tqdm import tqdm
 from parsers import *
 
+# The heuristic reused by each worker process across likelihood evaluations. See ModelFitter.get_worker_heuristic.
+worker_heuristic = None
+
+# Notified whenever a claimed group is handed back or retired, so that idle workers can block until there is
+# work to claim. Shared by every worker process. See create_worker_pool.
+group_released = None
+
+
+def initialize_worker(condition):
+    """
+    Initializes a worker process of the pool returned by create_worker_pool.
+
+    Args:
+        condition: The condition notified whenever a claimed group is handed back or retired.
+    """
+    global group_released
+    group_released = condition
+
+
+def create_worker_pool(num_workers):
+    """
+    Creates the pool of worker processes that IBS likelihood estimation runs on, along with the condition that
+    idle workers block on.
+
+    Args:
+        num_workers: The number of worker processes.
+
+    Returns:
+        The pool.
+    """
+    return Pool(num_workers, initializer=initialize_worker, initargs=(Condition(),))
+
 
 class SuccessFrequencyTracker:
     """
@@ -69,6 +102,450 @@ class SuccessFrequencyTracker:
             return delta
 
 
+class SharedTaskState:
+    """
+    The state of a set of SuccessFrequencyTrackers stored as a struct of arrays in shared memory, so that worker
+    processes can update it without pickling trackers or moves. The state may hold several independent samples of
+    the same moves, each with its own Lexpt and cutoff, so that they can be processed as a single job. Each
+    (sample, move) task is identified by its index into the arrays, sample * num_moves + move.
+
+    Tasks of the same sample whose moves were played from the same position form a group. Each move sampled from
+    a group's position is reported as a trial to every unfinished tracker in the group, so duplicated positions
+    only need to be searched once. Groups are identified by their index into the group_* arrays, and count the
+    trials committed for them so far.
+
+    Unfinished groups that no worker is currently sampling are kept in a bounded lock-free queue, also in shared
+    memory. A worker claims a group by dequeuing it and hands it back by enqueuing it once it has committed a
+    success, so each group is sampled by at most one worker at a time and picking a group is O(1).
+
+    Every hand-back and retirement also notifies a condition shared by all of the workers, which workers that
+    found every unfinished group claimed wait on until there is something to claim or nothing left to do.
+
+    The block begins with a header of atomically updated slots: the queue head and tail, the number of unfinished
+    groups, and the number of claims refused because every unfinished group was held. It is followed by one
+    atomically updated slot per sample holding the current value of that sample's Lexpt, then one slot per sample
+    whose first byte is set once that sample hits its cutoff. Workers watch these bytes through CancellationTokens
+    so that searches still running for a sample are cancelled as soon as any worker gives up on it.
+    """
+    header = ["queue_head", "queue_tail",
+              "remaining_count", "duplicates_avoided"]
+    fields = [("attempt_count", np.int64),
+              ("success_count", np.int64),
+              ("required_success_count", np.int64),
+              ("L", np.float64),
+              ("black_pieces", np.uint64),
+              ("white_pieces", np.uint64),
+              ("move_position", np.int64),
+              ("group_start", np.int64),
+              ("group_size", np.int64),
+              ("group_members", np.int64),
+              ("group_trial_count", np.int64),
+              ("queue_sequence", np.int64),
+              ("queue_value", np.int64)]
+    slot_size = 8
+
+    def __init__(self, shared_memory, num_moves, num_samples, expt_factor, group_released=None):
+        """
+        Constructor. Prefer create() or attach() to calling this directly.
+
+        Args:
+            shared_memory: The shared memory block backing the state.
+            num_moves: The number of moves tracked.
+            num_samples: The number of independent samples of each move.
+            expt_factor: Controls the fitting cutoff of the BADS process.
+            group_released: The condition to notify whenever a claimed group is handed back or retired, if any.
+        """
+        self.shared_memory = shared_memory
+        self.group_released = group_released
+        self.num_moves = num_moves
+        self.num_samples = num_samples
+        self.size = num_moves * num_samples
+        self.expt_factor = expt_factor
+        offset = self.slot_size * (len(self.header) + num_samples)
+        self.cancellation_flags = np.ndarray(
+            (num_samples,), dtype=np.uint8, buffer=shared_memory.buf, offset=offset, strides=(self.slot_size,))
+        offset += self.slot_size * num_samples
+        for name, dtype in self.fields:
+            setattr(self, name, np.ndarray(
+                (self.size,), dtype=dtype, buffer=shared_memory.buf, offset=offset))
+            offset += self.slot_size * self.size
+
+    @classmethod
+    def create(cls, moves, required_success_counts, expt_factor, num_samples=1):
+        """
+        Allocates a new shared memory block and fills each sample with a new tracker for each move. Unfinished
+        groups are queued in a random order.
+
+        Args:
+            moves: A MoveDataset of the moves to track. Task i of each sample tracks row i.
+            required_success_counts: The number of times each move has to be reproduced.
+            expt_factor: Controls the fitting cutoff of the BADS process.
+            num_samples: The number of independent samples of each move.
+
+        Returns:
+            The newly allocated state. The caller is responsible for calling close() and unlink().
+        """
+        num_moves = len(moves)
+        size = num_moves * num_samples
+        shared_memory = SharedMemory(
+            create=True, size=cls.slot_size * (len(cls.header) + 2 * num_samples + len(cls.fields) * max(size, 1)))
+        state = cls(shared_memory, num_moves, num_samples, expt_factor)
+        for sample in range(num_samples):
+            state.set_lexpt(sample, 0.0)
+        state.cancellation_flags[:] = 0
+        # Each tracker starts out as a new SuccessFrequencyTracker would.
+        state.attempt_count[:] = 1
+        state.success_count[:] = 0
+        state.required_success_count[:] = np.tile(
+            required_success_counts, num_samples)
+        state.L[:] = 0.0
+        state.black_pieces[:] = np.tile(
+            moves.data["black_pieces"], num_samples)
+        state.white_pieces[:] = np.tile(
+            moves.data["white_pieces"], num_samples)
+        state.move_position[:] = np.tile(moves.data["move"], num_samples)
+
+        # Group tasks by sample and position; group_members lists the tasks of each group contiguously.
+        group_keys = np.tile(moves.board_keys, num_samples) + \
+            np.repeat(np.arange(num_samples), num_moves) * \
+            (moves.board_keys.max(initial=0) + 1)
+        order = np.argsort(group_keys, kind="stable")
+        starts = np.flatnonzero(np.diff(group_keys[order], prepend=-1))
+        num_groups = len(starts)
+        state.group_members[:] = order
+        state.group_start[:num_groups] = starts
+        state.group_size[:num_groups] = np.diff(starts, append=size)
+        state.group_trial_count[:] = 0
+
+        unfinished = np.flatnonzero(np.logical_or.reduceat(
+            (state.success_count != state.required_success_count)[order], starts))
+        np.random.shuffle(unfinished)
+        # A cell whose sequence number equals its position is free; one whose sequence number is one past its
+        # position holds a value ready to be dequeued.
+        state.queue_sequence[:] = np.arange(size)
+        state.queue_sequence[:len(unfinished)] += 1
+        state.queue_value[:len(unfinished)] = unfinished
+        state._store_header("queue_head", 0)
+        state._store_header("queue_tail", len(unfinished))
+        state._store_header("remaining_count", len(unfinished))
+        state._store_header("duplicates_avoided", 0)
+        return state
+
+    @classmethod
+    def attach(cls, name, num_moves, num_samples, expt_factor, group_released=None):
+        """
+        Attaches to a state previously allocated by create(), e.g. from a worker process.
+
+        Args:
+            name: The name of the shared memory block.
+            num_moves: The number of moves tracked.
+            num_samples: The number of independent samples of each move.
+            expt_factor: Controls the fitting cutoff of the BADS process.
+            group_released: The condition to notify whenever a claimed group is handed back or retired, if any.
+
+        Returns:
+            A view of the existing state. The caller is responsible for calling close().
+        """
+        return cls(SharedMemory(name=name), num_moves, num_samples, expt_factor, group_released)
+
+    @property
+    def name(self):
+        """
+        Returns:
+            The name of the shared memory block, which can be passed to attach().
+        """
+        return self.shared_memory.name
+
+    def close(self):
+        """
+        Releases this process' view of the state.
+        """
+        for name, _ in self.fields:
+            setattr(self, name, None)
+        self.cancellation_flags = None
+        self.shared_memory.close()
+
+    def unlink(self):
+        """
+        Frees the underlying shared memory block. Should be called once, by the process that created it.
+        """
+        self.shared_memory.unlink()
+
+    def _atomic_slot(self, index):
+        """
+        Args:
+            index: The index of the 8-byte slot in the shared memory block.
+
+        Returns:
+            An atomic view over the given slot.
+        """
+        return atomics.atomicview(buffer=self.shared_memory.buf[index * self.slot_size:(index + 1) * self.slot_size],
+                                  atype=atomics.INT)
+
+    def _header_slot(self, name):
+        """
+        Returns:
+            An atomic view over the given header slot.
+        """
+        return self._atomic_slot(self.header.index(name))
+
+    def _field_slot(self, name, i):
+        """
+        Returns:
+            An atomic view over the ith element of the given field.
+        """
+        field_index = [field for field, _ in self.fields].index(name)
+        return self._atomic_slot(len(self.header) + 2 * self.num_samples + field_index * self.size + i)
+
+    def _load_header(self, name):
+        with self._header_slot(name) as slot:
+            return slot.load()
+
+    def _store_header(self, name, value):
+        with self._header_slot(name) as slot:
+            slot.store(value)
+
+    def _lexpt_slot(self, sample):
+        """
+        Returns:
+            An atomic view over the Lexpt of the given sample.
+        """
+        return self._atomic_slot(len(self.header) + sample)
+
+    def get_lexpt(self, sample):
+        """
+        Args:
+            sample: The index of the sample.
+
+        Returns:
+            The current value of the sample's Lexpt.
+        """
+        with self._lexpt_slot(sample) as slot:
+            return struct.unpack("d", struct.pack("q", slot.load()))[0]
+
+    def set_lexpt(self, sample, value):
+        """
+        Sets the Lexpt of a sample to the given value.
+
+        Args:
+            sample: The index of the sample.
+            value: The new value of Lexpt.
+        """
+        with self._lexpt_slot(sample) as slot:
+            slot.store(struct.unpack("q", struct.pack("d", value))[0])
+
+    def add_to_lexpt(self, sample, delta):
+        """
+        Atomically adds the given delta to the Lexpt of a sample.
+
+        Args:
+            sample: The index of the sample.
+            delta: The amount to add.
+        """
+        with self._lexpt_slot(sample) as slot:
+            expected = slot.load()
+            while True:
+                current = struct.unpack("d", struct.pack("q", expected))[0]
+                desired = struct.unpack(
+                    "q", struct.pack("d", current + delta))[0]
+                result = slot.cmpxchg_weak(expected, desired)
+                if result.success:
+                    return
+                expected = result.expected
+
+    def cancel(self, sample):
+        """
+        Signals every worker that the given sample has hit its cutoff, cancelling searches still running for it.
+
+        Args:
+            sample: The index of the sample.
+        """
+        self.cancellation_flags[sample] = 1
+
+    def create_cancellation_token(self, sample):
+        """
+        Args:
+            sample: The index of the sample.
+
+        Returns:
+            A CancellationToken that is cancelled once the given sample hits its cutoff. It watches this process'
+            view of the state, so it must not be used after close().
+        """
+        return fourbynine.CancellationToken.from_address(
+            self.cancellation_flags.ctypes.data + int(sample) * self.slot_size)
+
+    def get_remaining_count(self):
+        """
+        Returns:
+            The number of groups that contain a task which has not yet observed its required number of successes,
+            and whose sample has not given up.
+        """
+        return self._load_header("remaining_count")
+
+    def get_duplicates_avoided(self):
+        """
+        Returns:
+            The number of claims refused because every unfinished group was held by another worker. Without
+            claiming, each of these would have started a search of a position that another worker was already
+            searching.
+        """
+        return self._load_header("duplicates_avoided")
+
+    def claim(self):
+        """
+        Claims an unfinished group that no other worker is sampling. A refused claim is counted as a duplicate
+        avoided.
+
+        Returns:
+            The index of the claimed group, or None if every unfinished group is currently claimed or finished.
+        """
+        with self._header_slot("queue_head") as head:
+            position = head.load()
+            while True:
+                with self._field_slot("queue_sequence", position % self.size) as sequence:
+                    difference = sequence.load() - (position + 1)
+                if difference == 0:
+                    result = head.cmpxchg_weak(position, position + 1)
+                    if result.success:
+                        break
+                    position = result.expected
+                elif difference < 0:
+                    if self.get_remaining_count() > 0:
+                        with self._header_slot("duplicates_avoided") as slot:
+                            slot.inc()
+                    return None
+                else:
+                    position = head.load()
+        cell = position % self.size
+        i = int(self.queue_value[cell])
+        with self._field_slot("queue_sequence", cell) as sequence:
+            sequence.store(position + self.size)
+        return i
+
+    def release(self, group, retire=False):
+        """
+        Hands a claimed group back to the other workers. Finished groups are retired instead of being requeued.
+
+        Args:
+            group: The index of the claimed group.
+            retire: If true, retire the group even if it is unfinished.
+        """
+        tasks = self.get_group_tasks(group)
+        if retire or np.array_equal(self.success_count[tasks], self.required_success_count[tasks]):
+            with self._header_slot("remaining_count") as remaining_count:
+                remaining_count.dec()
+            self._notify_group_released()
+            return
+        with self._header_slot("queue_tail") as tail:
+            position = tail.load()
+            while True:
+                with self._field_slot("queue_sequence", position % self.size) as sequence:
+                    difference = sequence.load() - position
+                if difference == 0:
+                    result = tail.cmpxchg_weak(position, position + 1)
+                    if result.success:
+                        break
+                    position = result.expected
+                else:
+                    # Each group is queued at most once, so the queue can never be full.
+                    position = tail.load()
+        cell = position % self.size
+        self.queue_value[cell] = group
+        with self._field_slot("queue_sequence", cell) as sequence:
+            sequence.store(position + 1)
+        self._notify_group_released()
+
+    def _notify_group_released(self):
+        """
+        Wakes up every worker blocked in wait_for_release().
+        """
+        if self.group_released is not None:
+            with self.group_released:
+                self.group_released.notify_all()
+
+    def _is_group_queued(self):
+        """
+        Returns:
+            True if the queue holds a group that can be claimed.
+        """
+        with self._header_slot("queue_head") as head:
+            position = head.load()
+        with self._field_slot("queue_sequence", position % self.size) as sequence:
+            return sequence.load() == position + 1
+
+    def wait_for_release(self):
+        """
+        Blocks until a group can be claimed or every group is finished. Should be called after claim() has
+        returned None. Another worker may claim the group first, so callers should claim again rather than assume
+        that a group is available.
+        """
+        if self.group_released is None:
+            time.sleep(0.001)
+            return
+        with self.group_released:
+            self.group_released.wait_for(
+                lambda: self.get_remaining_count() == 0 or self._is_group_queued())
+
+    def get_group_tasks(self, group):
+        """
+        Returns:
+            The indices of the tasks in the given group.
+        """
+        start = self.group_start[group]
+        return self.group_members[start:start + self.group_size[group]]
+
+    def get_sample(self, i):
+        """
+        Returns:
+            The index of the sample the ith task belongs to.
+        """
+        return i // self.num_moves
+
+    def get_L_values(self):
+        """
+        Returns:
+            A (num_samples, num_moves) view of the L-value of every task.
+        """
+        return self.L.reshape(self.num_samples, self.num_moves)
+
+    def get_board(self, i):
+        """
+        Returns:
+            The position the move of the ith task was played from.
+        """
+        return fourbynine_board(fourbynine_pattern(int(self.black_pieces[i])),
+                                fourbynine_pattern(int(self.white_pieces[i])))
+
+    def get_tracker(self, i):
+        """
+        Args:
+            i: The index of a task claimed by the calling worker.
+
+        Returns:
+            A SuccessFrequencyTracker holding a copy of the state of the ith task.
+        """
+        task = SuccessFrequencyTracker(self.expt_factor)
+        task.attempt_count = int(self.attempt_count[i])
+        task.success_count = int(self.success_count[i])
+        task.required_success_count = int(self.required_success_count[i])
+        task.L = float(self.L[i])
+        return task
+
+    def commit(self, i, task):
+        """
+        Writes back the tracker of a task claimed by the calling worker. The slots are written with plain stores:
+        only the worker holding the task's group writes them, and it hands the group back through the atomic
+        claim queue afterwards, which orders these stores before the next worker claims it.
+
+        Args:
+            i: The index of the task.
+            task: The tracker to commit.
+        """
+        self.attempt_count[i] = task.attempt_count
+        self.L[i] = task.L
+        self.success_count[i] = task.success_count
+
+
 def generate_splits(moves, split_count):
     """
     Given a list of positions, split the positions into split_count randomized subsets.
@@ -123,6 +600,17 @@ class DefaultModel:
                              5, -5, -5, -5], dtype=np.float64)
         self.c = 50
 
+    def get_heuristic_parameters(self, params):
+        """
+        Converts the parameters being fit into the full parameter vector of a heuristic.
+
+        Args:
+            params: The parameters of the heuristic.
+        Returns:
+            The full parameter vector of a heuristic with the given parameters.
+        """
+        return fourbynine.DoubleVector(bads_parameters_to_model_parameters(params))
+
     def create_heuristic(self, params):
         """
         Used by the model fitter to construct heuristics with different parameters
@@ -133,7 +621,19 @@ class DefaultModel:
         Returns:
             A heuristic with the given parameters.
         """
-        return fourbynine.fourbynine_heuristic.create(fourbynine.DoubleVector(bads_parameters_to_model_parameters(params)), True)
+        return fourbynine.fourbynine_heuristic.create(self.get_heuristic_parameters(params), True)
+
+    def update_heuristic(self, heuristic, params):
+        """
+        Used by the model fitter to reuse a heuristic previously returned by create_heuristic
+        with a different set of parameters, without rebuilding its features. Models that
+        override create_heuristic should override this as well.
+
+        Args:
+            heuristic: A heuristic previously returned by create_heuristic.
+            params: The new parameters of the heuristic.
+        """
+        heuristic.set_parameters(self.get_heuristic_parameters(params))
 
     def create_search(self, params, heuristic, board):
         """
@@ -151,11 +651,11 @@ class DefaultModel:
 
     def estimate_initial_l_value_guess(self, fitter, moves):
         """
-        Given a model fitter and a list of moves, estimate initial L-value guesses for each move.
+        Given a model fitter and a dataset of moves, estimate initial L-value guesses for each move.
 
         Args:
             fitter: The model fitter.
-            moves: The moves to estimate.
+            moves: The MoveDataset of moves to estimate.
 
         Returns:
             A list of L-values corresponding to each of the given moves.
@@ -189,81 +689,234 @@ class ModelFitter:
             self.sample_count = 0
         self.verbose = args.verbose
         self.num_workers = args.threads
+        self.native_ibs = args.native_ibs
+        if args.common_random_numbers:
+            self.crn_seed = args.common_random_numbers[0]
+            if self.crn_seed < 0:
+                raise Exception(
+                    "The common random numbers seed must be non-negative!")
+            if self.native_ibs:
+                raise Exception(
+                    "Common random numbers are not supported with native IBS!")
+        else:
+            self.crn_seed = None
+
+    def get_worker_heuristic(self, params):
+        """
+        Returns the heuristic of the calling worker process, set to the given parameters. The heuristic
+        is created on first use and updated in place afterwards, so that its features are only built once
+        per worker.
+
+        Args:
+            params: The heuristic parameters to use.
+
+        Returns:
+            The worker's heuristic.
+        """
+        global worker_heuristic
+        if worker_heuristic is None:
+            worker_heuristic = self.model.create_heuristic(params)
+        else:
+            self.model.update_heuristic(worker_heuristic, params)
+        return worker_heuristic
+
+    def get_search_seed(self, sample, black_pieces, white_pieces, trial):
+        """
+        Derives the seed of a single search in common random numbers mode. The seed only depends on the run seed,
+        the sample, the position and the trial index, so evaluations at different parameters see the same noise
+        for the same trial.
+
+        Args:
+            sample: The index of the sample the search is run for.
+            black_pieces: The bitmask of black pieces of the position searched from.
+            white_pieces: The bitmask of white pieces of the position searched from.
+            trial: The index of the trial at this position within the sample.
+
+        Returns:
+            The seed to pass to the heuristic's seed_generator() before creating the search.
+        """
+        entropy = [self.crn_seed, int(sample), int(black_pieces),
+                   int(white_pieces), int(trial)]
+        return int(np.random.SeedSequence(entropy).generate_state(1, np.uint64)[0])
 
     def estimate_log_lik_ibs(
             self,
             params,
             cutoff,
-            move_tasks):
+            shared_state_name,
+            num_moves,
+            num_samples):
         """
         The main parallelized portion of our workload. Takes a set of
         heuristic parameters and a list of moves and runs the heuristic
         against the list until the heuristic produces the expected number
-        of matches to the observed dataset. Modifies move_tasks in place.
+        of matches to the observed dataset. Modifies the shared task state in place.
 
         Args:
             params: The heuristic parameters to test.
-            cutoff: A stop-loss cutoff that will cause us to exit early if needed.
-            move_tasks: The list of moves that need to be evaluated by the heuristic.
-        """
-        heuristic = self.model.create_heuristic(params)
-        heuristic.seed_generator(random.randint(0, 2**64))
-        while Lexpt.value <= cutoff:
-            unfinished_items = list(
-                filter(lambda x: not x[1].is_done(), move_tasks.items()))
-            if not unfinished_items:
-                break
-            move, task = copy.deepcopy(random.choice(unfinished_items))
-            local_Lexpt_delta = 0
-            while not move_tasks[move].is_done():
-                search = self.model.create_search(
-                    params, heuristic, move.board)
-                search.complete_search()
-                best_move = heuristic.get_best_move(search.get_tree())
-                success = best_move.board_position == move.move.board_position
-                local_Lexpt_delta += task.report_trial(success)
-                if (success):
-                    with move_tasks.lock:
-                        if task.success_count == move_tasks[move].success_count + 1:
-                            move_tasks[move] = task
-                            Lexpt.value += local_Lexpt_delta
-                    break
-                else:
-                    # We may need to exit early. This implicitly signals all of the other processes as well.
-                    if Lexpt.value + local_Lexpt_delta > cutoff:
-                        with move_tasks.lock:
-                            Lexpt.value += local_Lexpt_delta
+            cutoff: A stop-loss cutoff that will cause us to exit early if needed. Applies to each sample separately.
+            shared_state_name: The name of the SharedTaskState holding the moves that need to be evaluated by the heuristic.
+            num_moves: The number of moves in the shared task state.
+            num_samples: The number of samples of each move in the shared task state.
+        """
+        state = SharedTaskState.attach(
+            shared_state_name, num_moves, num_samples, self.model.expt_factor, group_released)
+        tokens = {}
+        try:
+            heuristic = self.get_worker_heuristic(params)
+            # Common random numbers reseed the heuristic before every search, which is only cheap with counter-based
+            # generators.
+            heuristic.set_counter_based_rng(self.crn_seed is not None)
+            heuristic.seed_generator(random.randint(0, 2**64))
+            while state.get_remaining_count() > 0:
+                group = state.claim()
+                if group is None:
+                    # Every unfinished group is being sampled by another worker; wait for one to be handed back
+                    # rather than duplicating its work.
+                    state.wait_for_release()
+                    continue
+                tasks = state.get_group_tasks(group)
+                sample = state.get_sample(tasks[0])
+                if state.get_lexpt(sample) > cutoff:
+                    # This sample has hit the cutoff, so its unfinished groups are abandoned.
+                    state.cancel(sample)
+                    state.release(group, retire=True)
+                    continue
+                if sample not in tokens:
+                    tokens[sample] = state.create_cancellation_token(sample)
+                trackers = [(i, state.get_tracker(i), state.move_position[i])
+                            for i in tasks if state.success_count[i] != state.required_success_count[i]]
+                board = state.get_board(tasks[0])
+                local_Lexpt_delta = 0
+                trial = state.group_trial_count[group]
+                while True:
+                    if self.crn_seed is not None:
+                        heuristic.seed_generator(self.get_search_seed(
+                            sample, state.black_pieces[tasks[0]], state.white_pieces[tasks[0]], trial))
+                    trial += 1
+                    search = self.model.create_search(
+                        params, heuristic, board)
+                    search.set_cancellation_token(tokens[sample])
+                    best_move = search.sample_move()
+                    if search.was_cancelled():
+                        # Another worker gave up on this sample while we were searching.
+                        state.add_to_lexpt(sample, local_Lexpt_delta)
                         break
+                    # The sampled move counts as a trial for every unfinished move observed at this position.
+                    any_success = False
+                    for i, task, move_position in trackers:
+                        if task.is_done():
+                            continue
+                        success = best_move.board_position == move_position
+                        local_Lexpt_delta += task.report_trial(success)
+                        any_success = any_success or success
+                    if (any_success):
+                        for i, task, move_position in trackers:
+                            state.commit(i, task)
+                        state.group_trial_count[group] = trial
+                        state.add_to_lexpt(sample, local_Lexpt_delta)
+                        break
+                    else:
+                        # We may need to exit early. This implicitly signals all of the other processes as well.
+                        if state.get_lexpt(sample) + local_Lexpt_delta > cutoff:
+                            state.add_to_lexpt(sample, local_Lexpt_delta)
+                            state.cancel(sample)
+                            break
+                state.release(group)
+        finally:
+            state.close()
+
+    def sample_log_liks(self, moves, required_success_counts, params, sample_count, show_progress=False):
+        """
+        Draws several independent samples of the log likelihood of each observed move given a set of parameters.
+        All of the samples are submitted to the worker pool at once, so workers never sit idle waiting for the
+        last moves of one sample to finish before starting on the next.
+
+        Args:
+            moves: The MoveDataset of observed moves to be fitted to.
+            required_success_counts: The number of times each move has to be reproduced.
+            params: The parameters to evaluate.
+            sample_count: The number of samples to draw.
+            show_progress: If true, display a progress bar.
 
-    def compute_loglik(self, move_tasks, params):
+        Returns:
+            A (sample_count, len(moves)) array of the log-likelihood of each observed move in each sample.
+        """
+        if self.native_ibs:
+            l_values = [self.compute_loglik_native(moves, required_success_counts, params)
+                        for i in tqdm(range(sample_count), disable=not show_progress)]
+            return np.array(l_values, dtype=np.float64).reshape(sample_count, len(moves))
+
+        N = len(moves)
+
+        cutoff = N * self.model.cutoff
+        state = SharedTaskState.create(
+            moves, required_success_counts, self.model.expt_factor, sample_count)
+        try:
+            for sample in range(sample_count):
+                state.set_lexpt(sample, N * self.model.expt_factor)
+
+            global pool
+            results = [pool.apply_async(
+                self.estimate_log_lik_ibs, (params, cutoff, state.name, N, sample_count,)) for i in range(self.num_workers)]
+            if show_progress:
+                with tqdm(total=state.get_remaining_count()) as progress:
+                    while not all(result.ready() for result in results):
+                        progress.update(
+                            progress.total - state.get_remaining_count() - progress.n)
+                        time.sleep(0.1)
+                    # The workers may finish between two polls; every task is resolved once they have.
+                    progress.update(progress.total - progress.n)
+            [result.get() for result in results]
+
+            if self.verbose:
+                print("Duplicate searches avoided: {}".format(
+                    state.get_duplicates_avoided()))
+            return state.get_L_values().copy()
+        finally:
+            state.close()
+            state.unlink()
+
+    def compute_loglik(self, moves, required_success_counts, params):
         """
         Computes the log likelihood of the given set of parameters being the set that best fits
         the observed data.
 
         Args:
-            move_tasks: The observed data to be fitted to.
+            moves: The MoveDataset of observed moves to be fitted to.
+            required_success_counts: The number of times each move has to be reproduced.
             params: The parameters to evaluate.
 
         Returns:
-            The log-likelihood of each observed move at each position given the set of parameters.
+            An array of the log-likelihood of each observed move given the set of parameters.
         """
-        N = len(move_tasks)
-
-        cutoff = N * self.model.cutoff
-        shared_tasks = UltraDict(move_tasks, shared_lock=True)
+        if self.native_ibs:
+            return self.compute_loglik_native(moves, required_success_counts, params)
+        return self.sample_log_liks(moves, required_success_counts, params, 1)[0]
 
-        global Lexpt
-        Lexpt.value = N * self.model.expt_factor
+    def compute_loglik_native(self, moves, required_success_counts, params):
+        """
+        Computes the log likelihood of the given set of parameters using the C++ IBS engine, which
+        samples moves on a pool of native threads instead of worker processes. Only supports models
+        that search with the default NInARowBestFirstSearch.
 
-        global pool
-        results = [pool.apply_async(
-            self.estimate_log_lik_ibs, (params, cutoff, shared_tasks,)) for i in range(self.num_workers)]
-        [result.get() for result in results]
+        Args:
+            moves: The MoveDataset of observed moves to be fitted to.
+            required_success_counts: The number of times each move has to be reproduced.
+            params: The parameters to evaluate.
 
-        L_values = {}
-        for move in shared_tasks:
-            L_values[move] = shared_tasks[move].L
-        return L_values
+        Returns:
+            An array of the log-likelihood of each observed move given the set of parameters.
+        """
+        sampler = fourbynine.fourbynine_inverse_binomial_sampler(
+            self.model.expt_factor, self.model.cutoff)
+        for i in range(len(moves)):
+            board = moves.get_board(i)
+            sampler.add_task(board, fourbynine_move(int(moves.data["move"][i]), 0.0, board.active_player()),
+                             int(required_success_counts[i]))
+        result = sampler.estimate_log_likelihoods(
+            self.model.get_heuristic_parameters(params), random.randint(0, 2**64 - 1), self.num_workers)
+        return np.array(result.L_values)
 
     def generate_attempt_counts(self, L_values, c):
         """
@@ -277,13 +930,13 @@ class ModelFitter:
         Returns:
             A list of the number of times we would expect each move to be reproduced given the L-values.
         """
-        x = np.linspace(1e-6, 1 - 1e-6, int(1e6))
-        dilog = np.pi**2 / 6.0 + np.cumsum(np.log(x) / (1 - x)) / len(x)
-        p = np.exp(-L_values)
-        interp1 = CubicSpline(x, np.sqrt(x * dilog), extrapolate=True)
-        interp2 = CubicSpline(x, np.sqrt(dilog / x), extrapolate=True)
-        times = (c * interp1(p)) / np.mean(interp2(p))
-        return np.vectorize(lambda x: max(x, 1))(np.round(times))
+        # Keep probabilities within [1e-6, 1 - 1e-6]; sqrt(dilog / p) diverges as p approaches 0.
+        p = np.clip(np.exp(-np.asarray(L_values, dtype=np.float64)),
+                    1e-6, 1 - 1e-6)
+        # spence(p) is the dilogarithm Li2(1 - p), i.e. pi^2 / 6 + the integral of log(x) / (1 - x) from 0 to p.
+        dilog = spence(p)
+        times = (c * np.sqrt(p * dilog)) / np.mean(np.sqrt(dilog / p))
+        return np.maximum(np.round(times), 1)
 
     def estimate_l_values(self, moves, params, sample_count):
         """
@@ -291,34 +944,23 @@ class ModelFitter:
         starting parameters. Averages over multiple samples.
 
         Args:
-            moves: The set of observed moves.
+            moves: The MoveDataset of observed moves.
             params: The parameters to evaluate.
             sample_count: The number of samples to average over.
 
         Returns:
             A list of estimated L-values for the observed moves given the parameters.
         """
-        move_tasks = {}
-        for move in moves:
-            move_tasks[move] = SuccessFrequencyTracker(self.model.expt_factor)
-        l_values = []
-        for i in tqdm(range(sample_count)):
-            l_values.append(self.compute_loglik(
-                move_tasks, params))
-        average_l_values = []
-        for move in tqdm(moves):
-            average = 0.0
-            for l_value in l_values:
-                average += l_value[move]
-            average /= len(l_values)
-            average_l_values.append(average)
-        return average_l_values
+        tasks, task_indices = moves.unique()
+        average_l_values = self.sample_log_liks(
+            tasks, np.ones(len(tasks), dtype=np.int64), params, sample_count, show_progress=True).mean(axis=0)
+        return average_l_values[task_indices].tolist()
 
     def fit_model(self, moves):
         """
         Given a set of moves, find the set of heuristic/search parameters that best fit the observations.
 
-        @params moves The set of moves to fit to.
+        @params moves The MoveDataset of moves to fit to.
 
         @return The set of parameters that best correspond to the given moves, as well as their corresponding L-values.
         """
@@ -327,17 +969,16 @@ class ModelFitter:
             self, moves)
         counts = self.generate_attempt_counts(
             np.array(average_l_values), self.model.c)
-        move_tasks = {}
-        for move in moves:
-            move_tasks[move] = SuccessFrequencyTracker(self.model.expt_factor)
-        for i in range(len(counts)):
-            move_tasks[moves[i]].required_success_count = int(counts[i])
+        # Equal moves share a single task.
+        tasks, task_indices = moves.unique()
+        required_success_counts = np.empty(len(tasks), dtype=np.int64)
+        required_success_counts[task_indices] = counts
 
         if self.random_sample:
-            clamped_sample_count = min(self.sample_count, len(move_tasks))
+            clamped_sample_count = min(self.sample_count, len(tasks))
             if clamped_sample_count != self.sample_count:
                 print("Requested sample count ({}) is larger than the dataset size ({})! Clamping sample count and using entire set...".format(
-                    self.sample_count, len(move_tasks)))
+                    self.sample_count, len(tasks)))
 
         def opt_fun(x):
             if self.verbose:
@@ -346,12 +987,10 @@ class ModelFitter:
                     opt_fun.current_iteration_count))
                 opt_fun.current_iteration_count += 1
             if self.random_sample:
-                subsampled_keys = random.sample(
-                    sorted(move_tasks), clamped_sample_count)
-                subsampled_tasks = {k: move_tasks[k] for k in subsampled_keys}
-            else:
-                subsampled_tasks = move_tasks
-            return sum(list(self.compute_loglik(subsampled_tasks, x).values()))
+                subsample = np.sort(random.sample(
+                    range(len(tasks)), clamped_sample_count))
+                return float(self.compute_loglik(tasks[subsample], required_success_counts[subsample], x).sum())
+            return float(self.compute_loglik(tasks, required_success_counts, x).sum())
 
         opt_fun.current_iteration_count = 0
         badsopts = {}
@@ -366,42 +1005,35 @@ class ModelFitter:
         final_l_values = self.estimate_l_values(moves, out_params, 10)
         return out_params, final_l_values
 
-    def cross_validate(self, groups, i):
+    def cross_validate(self, moves, splits, num_splits, i):
         """
-        Given a set of pre-split groups, cross validate the i-th group against the rest, i.e.,
-        fit against all of the groups but the i-th and evaluate the resultant fit on the i-th group.
+        Given a set of pre-split moves, cross validate the i-th split against the rest, i.e.,
+        fit against all of the splits but the i-th and evaluate the resultant fit on the i-th split.
 
         Args:
-            groups: A pre-split list of lists of moves corresponding to different validation groups.
-            i: The group that should be held-out of the fitting process and tested against.
+            moves: The MoveDataset of all moves.
+            splits: An array of the index of the validation split each move belongs to.
+            num_splits: The number of validation splits.
+            i: The split that should be held-out of the fitting process and tested against.
 
         Returns:
-            The best-fit parameters for all of the groups but the ith, as well as the log-likelihood
+            The best-fit parameters for all of the splits but the ith, as well as the log-likelihood
             of the moves from both the training (non-i) and test (i) sets.
         """
         print("Cross validating split {} against the other {} splits".format(
-            i + 1, len(groups) - 1))
-        test = groups[i]
-        train = []
-        if len(groups) == 1:
-            train.extend(groups[0])
+            i + 1, num_splits - 1))
+        test = moves[splits == i]
+        if num_splits == 1:
+            train = test
         else:
-            for j in range(len(groups)):
-                if i != j:
-                    train.extend(groups[j])
+            train = moves[splits != i]
         params, loglik_train = self.fit_model(train)
-        test_tasks = {}
-        for move in test:
-            test_tasks[move] = SuccessFrequencyTracker(self.model.expt_factor)
-        loglik_test = list(self.compute_loglik(test_tasks, params).values())
+        test_tasks, _ = test.unique()
+        loglik_test = self.compute_loglik(test_tasks, np.ones(
+            len(test_tasks), dtype=np.int64), params).tolist()
         return params, loglik_train, loglik_test
 
 
-def initialize_thread(shared_value):
-    global Lexpt
-    Lexpt = shared_value
-
-
 def main():
     random.seed()
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, epilog="""Example usages:
@@ -465,6 +1097,18 @@ Read in splits from the above command, and only process/cross validate a single
         type=int,
         default=16,
         help="The number of threads to use when fitting.")
+    parser.add_argument(
+        "-n",
+        "--native-ibs",
+        help="If specified, run inverse binomial sampling in C++ on native threads rather than in Python worker processes. Only supported for models using the default search.",
+        action='store_true')
+    parser.add_argument(
+        "-C",
+        "--common-random-numbers",
+        type=int,
+        nargs=1,
+        help="If specified, seed every search from the given run seed, the position and the trial index, so that likelihood evaluations at different parameters use correlated noise. Not supported with -n.",
+        metavar=('seed'))
     args = parser.parse_args()
     if args.participant_file and args.input_dir:
         raise Exception("Can't specify both -f and -i!")
@@ -493,6 +1137,16 @@ Read in splits from the above command, and only process/cross validate a single
     else:
         raise Exception("Either -f or -i must be specified!")
 
+    # Every fit indexes into this one dataset, so moves are only converted from CSVMoves once.
+    all_moves = MoveDataset.from_moves(
+        [move for group in groups for move in group])
+    splits = np.repeat(np.arange(len(groups)), [
+                       len(group) for group in groups])
+    num_positions = len(np.unique(all_moves.board_keys))
+    if num_positions:
+        print("Parsed {} moves played from {} distinct positions (dedup ratio {:.2f})".format(
+            len(all_moves), num_positions, len(all_moves) / num_positions))
+
     output_path = Path(args.output_dir)
     if not output_path.is_dir():
         output_path.mkdir()
@@ -509,10 +1163,10 @@ Read in splits from the above command, and only process/cross validate a single
     if args.splits_only:
         exit()
 
-    set_start_method('spawn')
-    global pool, Lexpt
-    Lexpt = Value('d', 0)
-    pool = Pool(args.threads, initializer=initialize_thread, initargs=(Lexpt,))
+    if not args.native_ibs:
+        set_start_method('spawn')
+        global pool
+        pool = create_worker_pool(args.threads)
     model_fitter = ModelFitter(DefaultModel(), args)
     start, end = 0, len(groups)
     if (args.cluster_mode):
@@ -520,7 +1174,7 @@ Read in splits from the above command, and only process/cross validate a single
         end = start + 1
     for i in range(start, end):
         params, loglik_train, loglik_test = model_fitter.cross_validate(
-            groups, i)
+            all_moves, splits, len(groups), i)
         with (output_path / ("params" + str(i + 1) + ".csv")).open('w') as f:
             f.write(','.join(str(x) for x in params))
         with (output_path / ("lltrain" + str(i + 1) + ".csv")).open('w') as f:
@@ -143,7 +143,7 @@ class SearchRenderer():
         self.clear()
 
     def _clear_board_axes(self):
-        for axis, board in self.board_axes:
+        for axis, node in self.board_axes:
             axis.remove()
         self.board_axes.clear()
 
@@ -190,22 +190,44 @@ class SearchRenderer():
         self.draw()
 
     def _populate_graph(self):
+        """
+        Builds the graph of the displayed part of the search tree. Only the displayed layers of the tree are
+        exported. Graph nodes are identified by their index into the tree exported by export_arrays(), with the root
+        at index 0, so a position reached through several move orders is drawn once per path. This keeps the graph a
+        tree that mirrors the search, rather than merging transpositions into a single node.
+        """
         self.g = nx.Graph()
         reverse = not player_to_bool(self.root.get_board().active_player())
-        nodes_to_process = [self.root]
-        while nodes_to_process:
-            node = nodes_to_process.pop(0)
-            if self.max_depth and node.get_depth() > self.max_depth:
-                break
-            self.g.add_node(node.get_board().to_string(),
-                            subset=node.get_depth(), board=node.get_board())
-            if (node.get_parent()):
-                self.g.add_edge(node.get_parent().get_board().to_string(
-                ), node.get_board().to_string(), weight=node.get_value())
-            for i, child in enumerate(sorted(node.get_children(), key=fourbynine_game_tree_node.get_value, reverse=reverse)):
-                if self.max_branching_factor and i >= self.max_branching_factor:
-                    break
-                nodes_to_process.append(child)
+        arrays = self.root.export_arrays(self.max_depth)
+        parent = np.asarray(arrays.get_buffer("parent"))
+        depth = np.asarray(arrays.get_buffer("depth"))
+        # Exports below the root of a tree keep its depths, so measure them from the displayed root.
+        depth = depth - depth[0] + 1
+        value = np.asarray(arrays.get_buffer("value"))
+        black_pieces = np.asarray(arrays.get_buffer("black_pieces"))
+        white_pieces = np.asarray(arrays.get_buffer("white_pieces"))
+
+        # Rank each node among its siblings, best first. Ties keep their order in the tree.
+        order = np.lexsort((-value if reverse else value, parent))
+        group_starts = np.flatnonzero(np.diff(parent[order], prepend=-2))
+        rank = np.empty(len(parent), dtype=np.int64)
+        rank[order] = np.arange(len(parent)) - np.repeat(group_starts,
+                                                         np.diff(group_starts, append=len(parent)))
+
+        # A node is displayed if its parent is, so resolve the tree one layer at a time.
+        displayed = np.ones(len(parent), dtype=bool)
+        if self.max_branching_factor:
+            displayed &= rank < self.max_branching_factor
+        for layer in np.unique(depth[1:]):
+            in_layer = np.flatnonzero(depth == layer)
+            displayed[in_layer] &= displayed[parent[in_layer]]
+
+        for i in np.flatnonzero(displayed).tolist():
+            board = fourbynine_board(fourbynine_pattern(
+                int(black_pieces[i])), fourbynine_pattern(int(white_pieces[i])))
+            self.g.add_node(i, subset=int(depth[i]), board=board)
+            if parent[i] >= 0:
+                self.g.add_edge(int(parent[i]), i, weight=value[i])
 
     def draw(self):
         """
@@ -222,7 +244,7 @@ class SearchRenderer():
             new_axis = self.ax.inset_axes([self.pos[n][0] - board_center, self.pos[n][1] -
                                           board_center, self.board_size, self.board_size], transform=self.ax.transData)
             board = self.g.nodes[n]["board"]
-            self.board_axes.append((new_axis, board))
+            self.board_axes.append((new_axis, n))
             br = BoardRenderer(new_axis)
             br.set_board(board)
 
@@ -235,10 +257,9 @@ class SearchRenderer():
             event: The click event that has fired.
         """
         if event.dblclick and event.button == 1:
-            for axis, board in self.board_axes:
+            for axis, node in self.board_axes:
                 if (axis.in_axes(event)):
-                    path = nx.shortest_path(
-                        self.g, source=self.root.get_board().to_string(), target=board.to_string())
+                    path = nx.shortest_path(self.g, source=0, target=node)
                     attributes = nx.get_node_attributes(self.g, "board")
                     boards = [attributes[n] for n in path]
                     self.onclick_callback(boards)
@@ -2,6 +2,7 @@ from functools import total_ordering
 from fourbynine import fourbynine_board, fourbynine_pattern, fourbynine_move, Player_Player1, Player_Player2, bool_to_player, player_to_string
 from ninarow_utilities import bads_parameters_to_model_parameters
 import json
+import numpy as np
 
 
 @total_ordering
@@ -103,6 +104,7 @@ class CSVMove:
         self.time = float(time)
         self.group_id = int(group_id)
         self.participant_id = str(participant_id)
+        self._key = None
 
     def __repr__(self):
         """
@@ -111,25 +113,39 @@ class CSVMove:
         """
         return "\t".join([str(int(self.board.get_pieces(Player_Player1).to_string(), 2)), str(int(self.board.get_pieces(Player_Player2).to_string(), 2)), player_to_string(self.player), str(2**self.move.board_position), str(self.time), str(self.group_id), self.participant_id])
 
+    @property
+    def key(self):
+        """
+        Returns:
+            A tuple of every field of the move, with the pieces of each player as integers, computed once and cached.
+            Two moves are equal if and only if their keys are.
+        """
+        if self._key is None:
+            self._key = (int(self.board.get_pieces(Player_Player1).to_string(), 2),
+                         int(self.board.get_pieces(
+                             Player_Player2).to_string(), 2),
+                         self.move.board_position, self.time, self.group_id, self.participant_id)
+        return self._key
+
     def __hash__(self):
         """
         Hashes the move.
         """
-        return hash(str(self))
+        return hash(self.key)
 
     def __eq__(self, other):
         """
         Returns:
             True if both moves are equivalent.
         """
-        return str(self) == str(other)
+        return self.key == other.key
 
     def __lt__(self, other):
         """
         Returns:
             True if a given move is "less than" another move. Ordering is mostly arbitrary, this function just establishes a canonical ordering.
         """
-        return str(self) < str(other)
+        return self.key < other.key
 
     def __getstate__(self):
         return str(self)
@@ -139,6 +155,130 @@ class CSVMove:
         self.__dict__ = new_state.__dict__
 
 
+class MoveDataset:
+    """
+    A compact, array-backed collection of moves. Each move is stored as a single row of a NumPy structured array,
+    with SWIG boards and moves only being created on demand, so that datasets are cheap to hash, sort, and pickle.
+    """
+    dtype = np.dtype([("black_pieces", np.uint64),
+                      ("white_pieces", np.uint64),
+                      ("move", np.uint8),
+                      ("time", np.float64),
+                      ("group_id", np.int64),
+                      ("participant", np.int32)])
+
+    def __init__(self, data, participant_ids):
+        """
+        Constructor.
+
+        Args:
+            data: A structured array of dtype MoveDataset.dtype, with one row per move.
+            participant_ids: A list of participant ID strings, indexed by the participant column of data.
+        """
+        self.data = data
+        self.participant_ids = list(participant_ids)
+        self._keys = None
+        self._board_keys = None
+
+    @staticmethod
+    def from_moves(moves):
+        """
+        Creates a dataset from a list of CSVMove objects.
+
+        Args:
+            moves: The moves to store.
+
+        Returns:
+            A MoveDataset containing the given moves, in order.
+        """
+        participant_ids, participant_codes = np.unique(
+            np.array([move.participant_id for move in moves], dtype=object).astype(str), return_inverse=True)
+        data = np.empty(len(moves), dtype=MoveDataset.dtype)
+        data["black_pieces"] = [int(move.board.get_pieces(
+            Player_Player1).to_string(), 2) for move in moves]
+        data["white_pieces"] = [int(move.board.get_pieces(
+            Player_Player2).to_string(), 2) for move in moves]
+        data["move"] = [move.move.board_position for move in moves]
+        data["time"] = [move.time for move in moves]
+        data["group_id"] = [move.group_id for move in moves]
+        data["participant"] = participant_codes
+        return MoveDataset(data, participant_ids.tolist())
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        """
+        Args:
+            index: An integer, slice, or index/mask array.
+
+        Returns:
+            The CSVMove at the given index if index is an integer, otherwise a MoveDataset of the selected moves.
+        """
+        if isinstance(index, (int, np.integer)):
+            return self.get_move(index)
+        return MoveDataset(self.data[index], self.participant_ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_move(i)
+
+    @property
+    def keys(self):
+        """
+        Returns:
+            An integer key for each move, computed once and cached. Two moves share a key if and only if they are
+            equal, and comparing keys orders moves by the fields of their rows.
+        """
+        if self._keys is None:
+            self._keys = np.unique(self.data, return_inverse=True)[1]
+        return self._keys
+
+    @property
+    def board_keys(self):
+        """
+        Returns:
+            An integer key for the position each move was played from, computed once and cached. Two moves share
+            a key if and only if they were played from the same position, and keys range from 0 to the number of
+            distinct positions minus one.
+        """
+        if self._board_keys is None:
+            self._board_keys = np.unique(
+                self.data[["black_pieces", "white_pieces"]], return_inverse=True)[1]
+        return self._board_keys
+
+    def unique(self):
+        """
+        Returns:
+            A dataset holding each distinct move of this dataset once, in order of first occurrence, and an array
+            holding the index in it of each move of this dataset.
+        """
+        _, first, inverse = np.unique(
+            self.keys, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return self[first[order]], rank[inverse]
+
+    def get_board(self, i):
+        """
+        Returns:
+            The position the ith move was played from as a fourbynine_board.
+        """
+        return fourbynine_board(fourbynine_pattern(int(self.data["black_pieces"][i])),
+                                fourbynine_pattern(int(self.data["white_pieces"][i])))
+
+    def get_move(self, i):
+        """
+        Returns:
+            The ith move as a CSVMove.
+        """
+        board = self.get_board(i)
+        row = self.data[i]
+        return CSVMove(board, fourbynine_move(int(row["move"]), 0.0, board.active_player()), row["time"],
+                       row["group_id"], self.participant_ids[row["participant"]])
+
+
 def _parse_participant_csv(lines, group_id=1):
     """
     Parses a list of CSV-encoded moves.
@@ -0,0 +1,60 @@
+import threading
+import unittest
+from fourbynine import fourbynine_board, fourbynine_heuristic, NInARowBestFirstSearch
+
+
+class CountingSearch(NInARowBestFirstSearch):
+    """
+    A search subclassed in Python, so that every step of the search calls back into Python through its director.
+    """
+
+    def __init__(self, heuristic, board):
+        super().__init__(heuristic, board)
+        self.upcalls = 0
+
+    def stopping_conditions(self, heuristic, board):
+        self.upcalls += 1
+        return super().stopping_conditions(heuristic, board)
+
+    def on_node_expansion(self, expanded_node, heuristic, board):
+        self.upcalls += 1
+        return super().on_node_expansion(expanded_node, heuristic, board)
+
+
+class DirectorSearchTest(unittest.TestCase):
+    """
+    complete_search() and sample_move() release the GIL, so the overrides of a Python subclass must take it back.
+    """
+
+    def setUp(self):
+        self.heuristic = fourbynine_heuristic.create()
+        self.heuristic.set_noise_enabled(False)
+
+    def test_complete_search(self):
+        search = CountingSearch(self.heuristic, fourbynine_board())
+        search.complete_search()
+        self.assertGreater(search.upcalls, 0)
+        search.get_tree().get_best_move()
+
+    def test_sample_move(self):
+        search = CountingSearch(self.heuristic, fourbynine_board())
+        move = search.sample_move()
+        self.assertGreater(search.upcalls, 0)
+        self.assertTrue(
+            fourbynine_board().contains_spaces(move.board_position))
+
+    def test_concurrent_searches(self):
+        searches = [CountingSearch(self.heuristic, fourbynine_board())
+                    for i in range(4)]
+        threads = [threading.Thread(target=search.complete_search)
+                   for search in searches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for search in searches:
+            self.assertGreater(search.upcalls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
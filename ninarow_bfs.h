@@ -73,6 +73,12 @@ class NInARowBestFirstSearch
                stopping_conditions(heuristic, board);
   }
 
+  void on_root_advanced() override {
+    best_move = typename Heuristic::BoardT::MoveT();
+    num_repetitions = 0;
+    iterations = 0;
+  }
+
   void on_node_expansion(
       std::shared_ptr<BFSNode<typename Heuristic::BoardT>> /*expanded_node*/,
       std::shared_ptr<Heuristic> heuristic,
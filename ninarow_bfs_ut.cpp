@@ -14,3 +14,233 @@ TEST(SearchesTest, TestCreate) {
   Board board;
   auto bfs = NInARowBestFirstSearch<Heuristic<Board>>(heuristic, board);
 }
+
+TEST(SearchesTest, TestSampleMove) {
+  using namespace NInARow;
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  // Without noise, sampling a move is the same as searching.
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  Board b;
+  for (std::size_t i = 0; i < 6; ++i) {
+    Search search(heuristic, b);
+    search.complete_search();
+    const auto expected = search.get_tree()->get_best_move();
+    const auto sampled = Search(heuristic, b).sample_move();
+    EXPECT_EQ(sampled.board_position, expected.board_position);
+    b = b + sampled;
+  }
+
+  // A heuristic that always lapses never searches.
+  auto params = DefaultFourByNineParameters;
+  params[3] = 1.0;  // lapse_rate
+  auto lapsing_heuristic = Heuristic<Board>::create(params);
+  lapsing_heuristic->seed_generator(2);
+  for (std::size_t i = 0; i < 20; ++i) {
+    Search search(lapsing_heuristic, b);
+    const auto sampled = search.sample_move();
+    EXPECT_TRUE(b.contains_spaces(sampled.board_position));
+    EXPECT_TRUE(search.get_tree()->get_children().empty());
+  }
+}
+
+TEST(SearchesTest, TestCancellation) {
+  using namespace NInARow;
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  const Board b;
+
+  // An uncancelled token doesn't change the search.
+  auto token = CancellationToken::create();
+  Search expected(heuristic, b);
+  expected.complete_search();
+  Search search(heuristic, b);
+  search.set_cancellation_token(token, 3);
+  search.complete_search();
+  EXPECT_FALSE(search.was_cancelled());
+  EXPECT_EQ(search.get_iterations(), expected.get_iterations());
+  EXPECT_EQ(search.get_tree()->to_string(2), expected.get_tree()->to_string(2));
+  EXPECT_THROW(search.set_cancellation_token(token, 0), std::invalid_argument);
+
+  // A cancelled token stops searches at their next check, after at least one
+  // step so that they still have a best move.
+  token->cancel();
+  Search cancelled(heuristic, b);
+  cancelled.set_cancellation_token(token, 1);
+  cancelled.complete_search();
+  EXPECT_TRUE(cancelled.was_cancelled());
+  EXPECT_EQ(cancelled.get_iterations(), 1);
+  EXPECT_NO_THROW(cancelled.get_tree()->get_best_move());
+
+  // Tokens can watch externally owned flags.
+  std::uint8_t flag = 0;
+  auto external_token =
+      CancellationToken::from_address(reinterpret_cast<std::uintptr_t>(&flag));
+  EXPECT_FALSE(external_token->is_cancelled());
+  flag = 1;
+  EXPECT_TRUE(external_token->is_cancelled());
+  external_token->reset();
+  EXPECT_EQ(flag, 0);
+  EXPECT_THROW(CancellationToken::from_address(0), std::invalid_argument);
+}
+
+TEST(SearchesTest, TestBudgets) {
+  using namespace NInARow;
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  // A small gamma and a large stopping threshold make for long searches.
+  std::vector<double> params = DefaultFourByNineParameters;
+  params[0] = 1000.0;
+  params[2] = 0.001;
+  auto heuristic = Heuristic<Board>::create(params);
+  heuristic->set_noise_enabled(false);
+  const Board b;
+
+  Search unbounded(heuristic, b);
+  unbounded.complete_search();
+  EXPECT_FALSE(unbounded.was_budget_exhausted());
+  EXPECT_EQ(unbounded.get_expansions_used(), unbounded.get_iterations());
+  ASSERT_GT(unbounded.get_iterations(), 10);
+
+  // An expansion budget stops the search after exactly that many steps.
+  Search bounded(heuristic, b);
+  bounded.set_expansion_budget(10);
+  bounded.complete_search();
+  EXPECT_TRUE(bounded.was_budget_exhausted());
+  EXPECT_EQ(bounded.get_expansions_used(), 10);
+  EXPECT_EQ(bounded.get_iterations(), 10);
+  EXPECT_NO_THROW(bounded.get_tree()->get_best_move());
+  EXPECT_GE(bounded.get_seconds_used(), 0.0);
+
+  // A search that has run out of time still takes one step.
+  Search timed(heuristic, b);
+  timed.set_time_budget(1e-12);
+  timed.complete_search();
+  EXPECT_TRUE(timed.was_budget_exhausted());
+  EXPECT_EQ(timed.get_expansions_used(), 1);
+  EXPECT_NO_THROW(timed.sample_move());
+
+  EXPECT_THROW(timed.set_time_budget(-1.0), std::invalid_argument);
+}
+
+TEST(SearchesTest, TestBudgetsPerCall) {
+  using namespace NInARow;
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  std::vector<double> params = DefaultFourByNineParameters;
+  params[0] = 1000.0;
+  params[2] = 0.001;
+  auto heuristic = Heuristic<Board>::create(params);
+  heuristic->set_noise_enabled(false);
+  const Board b;
+
+  // Each call to complete_search gets the whole budget again.
+  Search search(heuristic, b);
+  search.set_expansion_budget(10);
+  search.complete_search();
+  EXPECT_TRUE(search.was_budget_exhausted());
+  EXPECT_EQ(search.get_expansions_used(), 10);
+  search.complete_search();
+  EXPECT_TRUE(search.was_budget_exhausted());
+  EXPECT_EQ(search.get_expansions_used(), 10);
+  EXPECT_EQ(search.get_iterations(), 20);
+
+  // A call that completes the search clears the flags of the previous one.
+  search.set_expansion_budget(0);
+  search.complete_search();
+  EXPECT_FALSE(search.was_budget_exhausted());
+  EXPECT_GT(search.get_expansions_used(), 0);
+
+  Search cancelled(heuristic, b);
+  auto token = CancellationToken::create();
+  cancelled.set_cancellation_token(token, 1);
+  token->cancel();
+  cancelled.complete_search();
+  EXPECT_TRUE(cancelled.was_cancelled());
+  cancelled.set_cancellation_token(nullptr);
+  cancelled.complete_search();
+  EXPECT_FALSE(cancelled.was_cancelled());
+}
+
+TEST(SearchesTest, TestAdvanceRoot) {
+  using namespace NInARow;
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  Board b;
+  Search search(heuristic, b);
+  search.set_expansion_budget(1000);
+  for (std::size_t i = 0; i < 6; ++i) {
+    search.complete_search();
+    const auto move = search.get_tree()->get_best_move();
+    std::shared_ptr<Node<Board>> child;
+    for (const auto& node : search.get_tree()->get_children()) {
+      if (node->get_move().board_position == move.board_position) child = node;
+    }
+    ASSERT_TRUE(child);
+    const std::weak_ptr<Node<Board>> old_root = search.get_tree();
+
+    // Without noise, the subtree under the played move is kept, as if it had
+    // been built by a search from the new position.
+    search.advance_root(move);
+    b = b + move;
+    EXPECT_FALSE(search.get_tree()->get_parent());
+    EXPECT_EQ(search.get_tree()->get_board(), b);
+    EXPECT_EQ(search.get_tree()->get_depth(), 1);
+    EXPECT_EQ(search.get_tree()->get_node_count(), child->get_node_count());
+    if (!child->get_children().empty()) {
+      EXPECT_EQ(search.get_tree()->get_best_move().board_position,
+                child->get_best_move().board_position);
+    }
+    auto copy = search.get_tree()->begin();
+    for (const auto& node : *child) {
+      EXPECT_EQ(copy->get_board(), node.get_board());
+      EXPECT_EQ(copy->get_depth(), node.get_depth() - child->get_depth() + 1);
+      EXPECT_EQ(copy->get_value(), node.get_value());
+      EXPECT_EQ(copy->determined(), node.determined());
+      ++copy;
+    }
+    EXPECT_EQ(search.get_iterations(), 0);
+    EXPECT_EQ(search.get_expansions_used(), 0);
+
+    // Nothing refers to the old tree anymore, so it is released.
+    child.reset();
+    EXPECT_TRUE(old_root.expired());
+  }
+  search.complete_search();
+  EXPECT_NO_THROW(search.get_tree()->get_best_move());
+
+  // Moves that aren't in the tree restart the search from the new position.
+  Search fresh(heuristic, b);
+  const auto unexplored =
+      heuristic->get_random_move(search.get_tree()->get_board());
+  fresh.advance_root(unexplored);
+  EXPECT_EQ(fresh.get_tree()->get_board(), b + unexplored);
+  EXPECT_EQ(fresh.get_tree()->get_node_count(), 1);
+  EXPECT_THROW(fresh.advance_root(unexplored), std::logic_error);
+
+  // With noise, the subtree is only kept if asked for.
+  heuristic->set_noise_enabled(true);
+  for (const bool reuse : {false, true}) {
+    Search noisy(heuristic, Board());
+    noisy.complete_search();
+    const auto move = noisy.get_tree()->get_best_move();
+    std::size_t subtree_size = 0;
+    for (const auto& node : noisy.get_tree()->get_children()) {
+      if (node->get_move().board_position == move.board_position)
+        subtree_size = node->get_node_count();
+    }
+    noisy.advance_root(move, reuse);
+    EXPECT_EQ(noisy.get_tree()->get_board(), Board() + move);
+    EXPECT_EQ(noisy.get_tree()->get_node_count(), reuse ? subtree_size : 1);
+  }
+}
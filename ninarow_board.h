@@ -6,6 +6,7 @@
 #include <sstream>
 #include <stdexcept>
 #include <string>
+#include <vector>
 
 #include "ninarow_move.h"
 #include "ninarow_pattern.h"
@@ -51,6 +52,61 @@ class Board {
                 "N in a row boards must be large enough to accommodate a "
                 "possible win, at least for the first player.");
 
+  /**
+   * @return Every line of N positions that wins the game when covered by a
+   * single player: horizontal, vertical, diagonal and anti-diagonal lines,
+   * ordered by their first position. Computed once.
+   */
+  static const std::vector<PatternT> &get_win_lines() {
+    static const std::vector<PatternT> win_lines = []() {
+      std::vector<PatternT> win_lines;
+      const long steps[4][2] = {{0, 1}, {1, 0}, {1, 1}, {1, -1}};
+      for (long row = 0; row < static_cast<long>(HEIGHT); ++row) {
+        for (long col = 0; col < static_cast<long>(WIDTH); ++col) {
+          for (const auto &step : steps) {
+            const long end_row = row + step[0] * static_cast<long>(N - 1U);
+            const long end_col = col + step[1] * static_cast<long>(N - 1U);
+            if (end_row >= static_cast<long>(HEIGHT) || end_col < 0 ||
+                end_col >= static_cast<long>(WIDTH)) {
+              continue;
+            }
+            PatternT line;
+            for (long i = 0; i < static_cast<long>(N); ++i) {
+              line.positions.set((row + step[0] * i) * WIDTH + col +
+                                 step[1] * i);
+            }
+            win_lines.push_back(line);
+          }
+        }
+      }
+      return win_lines;
+    }();
+    return win_lines;
+  }
+
+  /**
+   * @param position A position on the board.
+   *
+   * @return The lines of `get_win_lines()` that contain the given position.
+   * Computed once.
+   */
+  static const std::vector<PatternT> &get_win_lines_through(
+      std::size_t position) {
+    static const std::vector<std::vector<PatternT>> win_lines_through = []() {
+      std::vector<std::vector<PatternT>> win_lines_through(get_board_size());
+      for (const auto &line : get_win_lines()) {
+        for (const auto i : line.get_all_position_indices()) {
+          win_lines_through[i].push_back(line);
+        }
+      }
+      return win_lines_through;
+    }();
+    if (position >= get_board_size())
+      throw std::invalid_argument("Position " + std::to_string(position) +
+                                  " is not on the board!");
+    return win_lines_through[position];
+  }
+
  private:
   /**
    * Represents the pieces currently placed on the game board for both players.
@@ -271,6 +327,47 @@ class Board {
     return pieces[static_cast<size_t>(player)].contains(p);
   }
 
+  /**
+   * @param position An empty position.
+   *
+   * @return The number of winning lines through the given position that the
+   * player to move would leave one piece short of a win, with no opposing
+   * pieces, by playing there.
+   */
+  std::size_t count_threats_made(std::size_t position) const {
+    if (!contains_spaces(position))
+      throw std::invalid_argument("Piece already exists at position " +
+                                  std::to_string(position));
+    const Player player = active_player();
+    std::size_t count = 0;
+    for (const auto &line : get_win_lines_through(position)) {
+      if (count_pieces(line, player) == N - 2U &&
+          count_pieces(line, get_other_player(player)) == 0) {
+        ++count;
+      }
+    }
+    return count;
+  }
+
+  /**
+   * @param position An empty position.
+   *
+   * @return The number of winning lines through the given position that the
+   * opponent of the player to move is one piece short of, and that playing
+   * there would block.
+   */
+  std::size_t count_threats_defended(std::size_t position) const {
+    if (!contains_spaces(position))
+      throw std::invalid_argument("Piece already exists at position " +
+                                  std::to_string(position));
+    const Player opponent = get_other_player(active_player());
+    std::size_t count = 0;
+    for (const auto &line : get_win_lines_through(position)) {
+      if (count_pieces(line, opponent) == N - 1U) ++count;
+    }
+    return count;
+  }
+
   /**
    * @param m The move to add to the board.
    */
@@ -349,6 +446,48 @@ class Board {
   bool operator!=(const Board &b) const { return !(*this == b); }
 };
 
+/**
+ * Counts the threats made by each of a batch of moves. See
+ * `Board::count_threats_made`.
+ *
+ * @param boards The boards the moves are played on.
+ * @param positions The position of the move played on each board.
+ *
+ * @return The number of threats made by each move.
+ */
+template <class Board>
+std::vector<size_t> count_threats_made(const std::vector<Board> &boards,
+                                       const std::vector<size_t> &positions) {
+  if (boards.size() != positions.size())
+    throw std::invalid_argument("Expected one position per board!");
+  std::vector<size_t> counts(boards.size());
+  for (std::size_t i = 0; i < boards.size(); ++i) {
+    counts[i] = boards[i].count_threats_made(positions[i]);
+  }
+  return counts;
+}
+
+/**
+ * Counts the threats defended by each of a batch of moves. See
+ * `Board::count_threats_defended`.
+ *
+ * @param boards The boards the moves are played on.
+ * @param positions The position of the move played on each board.
+ *
+ * @return The number of threats defended by each move.
+ */
+template <class Board>
+std::vector<size_t> count_threats_defended(
+    const std::vector<Board> &boards, const std::vector<size_t> &positions) {
+  if (boards.size() != positions.size())
+    throw std::invalid_argument("Expected one position per board!");
+  std::vector<size_t> counts(boards.size());
+  for (std::size_t i = 0; i < boards.size(); ++i) {
+    counts[i] = boards[i].count_threats_defended(positions[i]);
+  }
+  return counts;
+}
+
 }  // namespace NInARow
 
 #endif  // NINAROW_BOARD_H_INCLUDED
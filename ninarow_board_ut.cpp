@@ -196,3 +196,57 @@ TEST(NInARowBoardTest, TestBoardUtility) {
   EXPECT_TRUE(board.contains(some_player_one, Player::Player1));
   EXPECT_FALSE(board.contains(some_player_one, Player::Player2));
 }
+
+/**
+ * Tests the winning line tables and threat counting.
+ */
+TEST(NInARowBoardTest, TestWinLines) {
+  using Board = Board<4, 9, 4>;
+
+  // 24 horizontal, 9 vertical, and 6 of each kind of diagonal line.
+  EXPECT_EQ(Board::get_win_lines().size(), 45);
+  for (const auto &line : Board::get_win_lines()) {
+    EXPECT_EQ(line.positions.count(), 4);
+    EXPECT_TRUE(line.contains_win());
+  }
+  // A corner is on one line of each kind but the anti-diagonal.
+  EXPECT_EQ(Board::get_win_lines_through(0).size(), 3);
+  // (1, 4) is on 4 horizontal lines, 1 vertical line, and both diagonals.
+  EXPECT_EQ(Board::get_win_lines_through(13).size(), 7);
+  for (const auto &line : Board::get_win_lines_through(13)) {
+    EXPECT_TRUE(line.positions.test(13));
+  }
+  EXPECT_THROW(Board::get_win_lines_through(Board::get_board_size()),
+               std::invalid_argument);
+
+  // Black has (0, 0) and (0, 1), white has (1, 1) and (1, 2).
+  Board board;
+  board.add(Board::MoveT(0, 0, 0.0, Player::Player1));
+  board.add(Board::MoveT(1, 1, 0.0, Player::Player2));
+  board.add(Board::MoveT(0, 1, 0.0, Player::Player1));
+  board.add(Board::MoveT(1, 2, 0.0, Player::Player2));
+
+  // Black threatens along the top row by playing (0, 2) or (0, 3).
+  EXPECT_EQ(board.count_threats_made(2), 1);
+  EXPECT_EQ(board.count_threats_made(3), 1);
+  EXPECT_EQ(board.count_threats_made(4), 0);
+  EXPECT_EQ(board.count_threats_defended(9), 0);
+  EXPECT_THROW(board.count_threats_made(0), std::invalid_argument);
+  EXPECT_THROW(board.count_threats_defended(10), std::invalid_argument);
+
+  // Once white has three in the second row, black can block either end.
+  const Board after_white = board + Board::MoveT(0, 2, 0.0, Player::Player1) +
+                            Board::MoveT(1, 3, 0.0, Player::Player2);
+  EXPECT_EQ(after_white.count_threats_defended(9), 1);
+  EXPECT_EQ(after_white.count_threats_defended(13), 1);
+  EXPECT_EQ(after_white.count_threats_defended(14), 0);
+
+  const std::vector<Board> boards{board, board, after_white};
+  const std::vector<size_t> positions{2, 4, 13};
+  EXPECT_EQ(count_threats_made(boards, positions),
+            (std::vector<size_t>{1, 0, 0}));
+  EXPECT_EQ(count_threats_defended(boards, positions),
+            (std::vector<size_t>{0, 0, 1}));
+  EXPECT_THROW(count_threats_made(boards, std::vector<size_t>{}),
+               std::invalid_argument);
+}
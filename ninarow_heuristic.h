@@ -3,16 +3,20 @@
 
 #include <algorithm>
 #include <array>
+#include <atomic>
 #include <fstream>
 #include <iostream>
+#include <limits>
+#include <mutex>
 #include <random>
-#include <unordered_map>
 
 #include "bfs_node.h"
 #include "fourbynine_features.h"
 #include "ninarow_board.h"
 #include "ninarow_heuristic_feature.h"
+#include "ninarow_transposition_table.h"
 #include "ninarow_vectorized_feature_evaluator.h"
+#include "random_engine.h"
 #include "searches.h"
 
 namespace NInARow {
@@ -91,12 +95,6 @@ struct HeuristicFeatureWithMetadata {
    */
   std::size_t weight_index;
 
-  /**
-   * If true, this feature should be evaluated. Features are turned off with
-   * `drop_rate` probability by the heuristic.
-   */
-  bool enabled;
-
   /**
    * Default constructor.
    */
@@ -116,8 +114,66 @@ struct HeuristicFeatureWithMetadata {
                                std::size_t weight_index)
       : feature(feature),
         vector_index(vector_index),
-        weight_index(weight_index),
-        enabled(true) {}
+        weight_index(weight_index) {}
+};
+
+/**
+ * The mutable state of a single search: its source of randomness and the set of
+ * features that were dropped for it. Keeping this state out of the heuristic
+ * allows any number of searches to share a heuristic concurrently.
+ */
+struct SearchContext {
+  /**
+   * The random number generator used for all of the search's noise.
+   */
+  RandomEngine engine;
+
+  /**
+   * A random distribution used for supplying the heuristic evaluation function
+   * with a noise parameter.
+   */
+  std::normal_distribution<double> noise;
+
+  /**
+   * For each feature, indexed by its vector index, nonzero if the feature has
+   * been dropped for this search. Empty if no features have been dropped.
+   */
+  std::vector<std::uint8_t> dropped_features;
+
+  /**
+   * Identifies the evaluation function used by this search, i.e. the
+   * heuristic's features minus the dropped ones. Used to keep transposition
+   * tables from mixing evaluations made with different features.
+   */
+  std::uint64_t evaluation_version;
+
+  /**
+   * Constructor.
+   *
+   * @param seed The seed of the search's random number generator.
+   */
+  explicit SearchContext(std::uint64_t seed = std::mt19937_64::default_seed)
+      : SearchContext(RandomEngine(seed)) {}
+
+  /**
+   * Constructor.
+   *
+   * @param engine The search's random number generator.
+   */
+  explicit SearchContext(RandomEngine engine)
+      : engine(std::move(engine)),
+        noise(0.0, 1.0),
+        dropped_features(),
+        evaluation_version(0) {}
+
+  /**
+   * @param vector_index The vector index of a feature.
+   *
+   * @return True if the feature has been dropped for this search.
+   */
+  bool is_dropped(std::size_t vector_index) const {
+    return !dropped_features.empty() && dropped_features[vector_index];
+  }
 };
 
 /**
@@ -130,6 +186,9 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
  public:
   using Feature = HeuristicFeature<Board>;
   using BoardT = Board;
+  using FeatureCountsT = FeatureOverlapCounts;
+  using TranspositionTableT = TranspositionTable<Board>;
+  using SearchContextT = SearchContext;
 
  private:
   /**
@@ -195,9 +254,40 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
   double center_weight;
 
   /**
-   * Our internal random number generator.
+   * The search context used when the heuristic is called outside of a search.
+   * Its random number generator also seeds the contexts of new searches. Never
+   * has any features dropped.
    */
-  std::mt19937_64 engine;
+  SearchContext default_context;
+
+  /**
+   * Guards `default_context`, which is shared by all callers.
+   */
+  std::mutex default_context_mutex;
+
+  /**
+   * If true, each search draws its randomness from its own counter-based
+   * generator, keyed by `rng_seed` and the search's id, instead of being seeded
+   * from `default_context`.
+   */
+  bool counter_based_rng;
+
+  /**
+   * The seed last passed to `seed_generator`.
+   */
+  std::atomic<std::uint64_t> rng_seed;
+
+  /**
+   * The id of the next search to be created, if `counter_based_rng` is set.
+   */
+  std::atomic<std::uint64_t> next_search_id;
+
+  /**
+   * The stream of the counter-based generator of `default_context`. Distinct
+   * from the stream of any search.
+   */
+  static constexpr std::uint64_t default_context_stream =
+      std::numeric_limits<std::uint64_t>::max();
 
   /**
    * Holds a list of weights for all of the features of the heuristic.
@@ -205,15 +295,34 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
   std::vector<FeatureGroupWeight> feature_group_weights;
 
   /**
-   * Holds all of the features of the heuristic.
+   * The features of a heuristic, along with everything precomputed from them.
+   * Shared between heuristics that only differ in their parameters, and copied
+   * before being modified if shared.
    */
-  std::vector<HeuristicFeatureWithMetadata<Board>> features;
+  struct FeatureSet {
+    /**
+     * Holds all of the features of the heuristic.
+     */
+    std::vector<HeuristicFeatureWithMetadata<Board>> features;
+
+    /**
+     * A helper class used to evaluate all of the features on the board in
+     * parallel quickly.
+     */
+    VectorizedFeatureEvaluator<Board> feature_evaluator;
+
+    /**
+     * For each feature, indexed by its index in `feature_evaluator`, the board
+     * positions covered by the feature's spaces. Precomputed when the feature
+     * is added so that move generation doesn't have to extract them.
+     */
+    std::vector<std::vector<std::size_t>> feature_space_positions;
+  };
 
   /**
-   * A helper class used to evaluate all of the features on the board in
-   * parallel quickly.
+   * The features of the heuristic. Never null.
    */
-  VectorizedFeatureEvaluator<Board> feature_evaluator;
+  std::shared_ptr<FeatureSet> feature_set;
 
   /**
    * A static weight given to each tile on the board as function of the tile's
@@ -222,28 +331,43 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
   std::array<double, Board::get_board_size()> vtile;
 
   /**
-   * A random distribution used for supplying the heuristic evaluation function
-   * with a noise parameter.
+   * If true, noise is injected across the evaluation function, including random
+   * feature dropout. If false, the heuristic will evaluate deterministically.
    */
-  std::normal_distribution<double> noise;
+  bool noise_enabled;
 
   /**
-   * A random distribution used for determining when the heuristic evaluation
-   * should lapse and choose a random move. See `lapse_rate`.
+   * Identifies the heuristic's current set of features and parameters. See
+   * `SearchContext::evaluation_version`.
    */
-  std::bernoulli_distribution lapse;
+  std::uint64_t evaluation_version;
 
   /**
-   * If true, noise is injected across the evaluation function, including random
-   * feature dropout. If false, the heuristic will evaluate deterministically.
+   * @return A new evaluation version, distinct from every version previously
+   * handed out by any heuristic.
    */
-  bool noise_enabled;
+  static std::uint64_t next_evaluation_version() {
+    static std::atomic<std::uint64_t> last_evaluation_version{0};
+    return ++last_evaluation_version;
+  }
 
   /**
-   * Some state to keep track of whether or not a search is currently being
-   * executed. Used for inspecting the search during execution.
+   * @return The feature set of the default heuristic, built once and shared by
+   * every heuristic created with the default features.
    */
-  bool search_in_progress;
+  static const std::shared_ptr<FeatureSet>& default_feature_set() {
+    static const std::shared_ptr<FeatureSet> feature_set = []() {
+      auto heuristic = std::shared_ptr<Heuristic>(new Heuristic(
+          DefaultFourByNineParameters, std::make_shared<FeatureSet>()));
+      for (std::size_t i = 0; i < FourByNineFeatures.size(); ++i) {
+        for (auto& feature : FourByNineFeatures[i]) {
+          heuristic->add_feature(i, feature);
+        }
+      }
+      return heuristic->feature_set;
+    }();
+    return feature_set;
+  }
 
  public:
   /**
@@ -251,40 +375,96 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    *
    * @param params The parameters to use for the heuristic.
    * @param add_default_features If true, use the default feature set in
-   * `fourbynine_features.h`. If false, don't inject any features.
+   * `fourbynine_features.h`, which is built once and shared between all
+   * heuristics using it. If false, don't inject any features.
    *
    * @return A pointer to a newly created heuristic.
    */
   static std::shared_ptr<Heuristic> create(
       const std::vector<double>& params = DefaultFourByNineParameters,
       bool add_default_features = true) {
-    auto heuristic = std::shared_ptr<Heuristic>(new Heuristic(params));
+    auto heuristic = std::shared_ptr<Heuristic>(
+        new Heuristic(params, std::make_shared<FeatureSet>()));
     if (add_default_features) {
-      for (size_t i = 0; i < FourByNineFeatures.size(); ++i) {
-        for (auto& feature : FourByNineFeatures[i]) {
-          heuristic->add_feature(i, feature);
-        }
+      if (heuristic->feature_group_weights.size() < FourByNineFeatures.size()) {
+        throw std::out_of_range(
+            "Trying to add a feature to a non-existent feature group.");
       }
+      heuristic->feature_set = default_feature_set();
     }
     return heuristic;
   }
 
+  /**
+   * Creates a heuristic that shares this heuristic's features, but uses a
+   * different set of parameters. Much cheaper than creating a heuristic from
+   * scratch, since no features have to be registered.
+   *
+   * @param params The parameters to use for the new heuristic. Must contain
+   * weights for the same number of feature groups as this heuristic.
+   *
+   * @return A pointer to a newly created heuristic.
+   */
+  std::shared_ptr<Heuristic> clone_with_parameters(
+      const std::vector<double>& params) const {
+    check_feature_group_count(params);
+    auto heuristic =
+        std::shared_ptr<Heuristic>(new Heuristic(params, feature_set));
+    heuristic->noise_enabled = noise_enabled;
+    heuristic->set_counter_based_rng(counter_based_rng);
+    return heuristic;
+  }
+
+  /**
+   * Replaces the parameters of this heuristic in place, keeping its features.
+   * Must not be called while searches using this heuristic are running.
+   *
+   * @param params The new parameters. Must contain weights for the same number
+   * of feature groups as this heuristic.
+   */
+  void set_parameters(const std::vector<double>& params) {
+    check_feature_group_count(params);
+    feature_group_weights.clear();
+    parse_parameters(params);
+    evaluation_version = next_evaluation_version();
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    default_context.evaluation_version = evaluation_version;
+  }
+
  private:
   /**
    * Constructor.
    *
    * @param params The parameters for this heuristic.
+   * @param feature_set The features of this heuristic.
    */
-  Heuristic(const std::vector<double>& params)
-      : engine(),
+  Heuristic(const std::vector<double>& params,
+            std::shared_ptr<FeatureSet> feature_set)
+      : default_context(),
+        default_context_mutex(),
+        counter_based_rng(false),
+        rng_seed(std::mt19937_64::default_seed),
+        next_search_id(0),
         feature_group_weights(),
-        features(),
-        feature_evaluator(),
+        feature_set(std::move(feature_set)),
         vtile(),
-        noise(),
-        lapse(),
         noise_enabled(true),
-        search_in_progress(false) {
+        evaluation_version(next_evaluation_version()) {
+    parse_parameters(params);
+    default_context.evaluation_version = evaluation_version;
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i)
+      vtile[i] = 1.0 / sqrt(pow(i / Board::get_board_width() - 1.5, 2) +
+                            pow(i % Board::get_board_width() - 4.0, 2));
+  }
+
+  /**
+   * Reads the scalar parameters and feature group weights of the heuristic
+   * from a parameter vector. Feature groups are appended to
+   * `feature_group_weights`.
+   *
+   * @param params The parameters to read.
+   */
+  void parse_parameters(const std::vector<double>& params) {
     if (params.size() < 7 || (params.size() - 7) % 3 != 0) {
       throw std::invalid_argument(
           "The incorrect number of parameters have been passed to the "
@@ -306,22 +486,96 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
                         params[param_pack_idx + j + num_param_packs],
                         params[param_pack_idx + j + 2 * num_param_packs]);
     }
-    noise = std::normal_distribution<double>(0.0, 1.0);
-    lapse = std::bernoulli_distribution(lapse_rate);
-    for (std::size_t i = 0; i < Board::get_board_size(); ++i)
-      vtile[i] = 1.0 / sqrt(pow(i / Board::get_board_width() - 1.5, 2) +
-                            pow(i % Board::get_board_width() - 4.0, 2));
     c_self = 2.0 * opp_scale / (1.0 + opp_scale);
     c_opp = 2.0 / (1.0 + opp_scale);
   }
 
+  /**
+   * Throws if the given parameters don't contain weights for exactly as many
+   * feature groups as this heuristic has.
+   *
+   * @param params The parameters to check.
+   */
+  void check_feature_group_count(const std::vector<double>& params) const {
+    if (params.size() != 7 + 3 * feature_group_weights.size()) {
+      throw std::invalid_argument(
+          "The parameters passed to the heuristic don't match its number of "
+          "feature groups.");
+    }
+  }
+
+  /**
+   * @return A seed for the Mersenne twister of a new search, drawn from the
+   * heuristic's random number generator.
+   */
+  std::uint64_t next_search_seed() {
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    return default_context.engine();
+  }
+
+  /**
+   * Restarts the random number generator of `default_context` from `rng_seed`,
+   * as a counter-based generator if `counter_based_rng` is set. Must be called
+   * with `default_context_mutex` held.
+   */
+  void reset_default_engine() {
+    default_context.engine =
+        counter_based_rng ? RandomEngine(rng_seed, default_context_stream)
+                          : RandomEngine(rng_seed);
+  }
+
  public:
   /**
-   * Sets the seed for the internal random number generator.
+   * Sets the seed for the internal random number generator. If counter-based
+   * random number generation is enabled, also restarts the search ids at zero.
    *
    * @param seed The seed to use for the random number generator.
    */
-  void seed_generator(uint64_t seed) { engine.seed(seed); }
+  void seed_generator(uint64_t seed) {
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    rng_seed = seed;
+    next_search_id = 0;
+    reset_default_engine();
+  }
+
+  /**
+   * Chooses how searches draw their randomness. By default, each search's
+   * Mersenne twister is seeded from the heuristic's. If counter-based random
+   * number generation is enabled, each search instead gets a Philox generator
+   * keyed by the heuristic's seed and a sequential search id. Such generators
+   * are cheap to create, don't contend for the heuristic, and make any single
+   * search reproducible from the seed and its id alone, whichever thread ran
+   * it. Restarts the random number generator from the last seed. Must not be
+   * changed while searches are running.
+   *
+   * @param enabled If true, enable counter-based random number generation.
+   */
+  void set_counter_based_rng(bool enabled) {
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    counter_based_rng = enabled;
+    next_search_id = 0;
+    reset_default_engine();
+  }
+
+  /**
+   * @return True if searches use counter-based random number generators.
+   */
+  bool is_counter_based_rng() const { return counter_based_rng; }
+
+  /**
+   * @return The id the next search will be created with, if counter-based
+   * random number generation is enabled.
+   */
+  std::uint64_t get_next_search_id() const { return next_search_id; }
+
+  /**
+   * Sets the id the next search will be created with, e.g. to replay a single
+   * search of a run. Only meaningful if counter-based random number generation
+   * is enabled.
+   *
+   * @param id The id of the next search.
+   */
+  void set_next_search_id(std::uint64_t id) { next_search_id = id; }
 
   /**
    * @return A list of feature group weights.
@@ -334,9 +588,9 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    * @return All of the features in the heuristic, along with their associated
    * metadata.
    */
-  std::vector<HeuristicFeatureWithMetadata<Board>>&
-  get_features_with_metadata() {
-    return features;
+  const std::vector<HeuristicFeatureWithMetadata<Board>>&
+  get_features_with_metadata() const {
+    return feature_set->features;
   }
 
   /**
@@ -365,8 +619,42 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
       throw std::out_of_range(
           "Trying to add a feature to a non-existent feature group.");
     }
-    features.emplace_back(feature, feature_evaluator.register_feature(feature),
-                          i);
+    if (feature_set.use_count() > 1) {
+      feature_set = std::make_shared<FeatureSet>(*feature_set);
+    }
+    const std::size_t vector_index =
+        feature_set->feature_evaluator.register_feature(feature);
+    feature_set->features.emplace_back(feature, vector_index, i);
+    evaluation_version = next_evaluation_version();
+    default_context.evaluation_version = evaluation_version;
+    feature_set->feature_space_positions.resize(vector_index + 1);
+    feature_set->feature_space_positions[vector_index] =
+        feature.spaces.get_all_position_indices();
+  }
+
+  /**
+   * Computes the overlap counts between the given board and every feature of
+   * the heuristic from scratch.
+   *
+   * @param b The board to evaluate.
+   *
+   * @return The feature overlap counts of the given board.
+   */
+  FeatureOverlapCounts get_feature_counts(const Board& b) const {
+    return feature_set->feature_evaluator.query(b);
+  }
+
+  /**
+   * Incrementally updates a set of feature overlap counts to reflect a move
+   * being played.
+   *
+   * @param counts The feature overlap counts of the board before the move is
+   * played. Updated in place.
+   * @param move The move being played.
+   */
+  void update_feature_counts(FeatureOverlapCounts& counts,
+                             const typename Board::MoveT& move) const {
+    feature_set->feature_evaluator.update(counts, move);
   }
 
   /**
@@ -378,25 +666,56 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    * position.
    */
   double evaluate(const Board& b) const {
+    return evaluate(b, get_feature_counts(b));
+  }
+
+  /**
+   * Evaluates a given board position and returns a heuristic value for it,
+   * using precomputed feature overlap counts.
+   *
+   * @param b The board to evaluate.
+   * @param counts The feature overlap counts of the given board.
+   *
+   * @return The value of the heuristic evaluation function of the given
+   * position.
+   */
+  double evaluate(const Board& b, const FeatureOverlapCounts& counts) const {
+    return evaluate(b, counts, default_context);
+  }
+
+  /**
+   * Evaluates a given board position within a search and returns a heuristic
+   * value for it, using precomputed feature overlap counts.
+   *
+   * @param b The board to evaluate.
+   * @param counts The feature overlap counts of the given board.
+   * @param context The context of the search the board is evaluated in.
+   *
+   * @return The value of the heuristic evaluation function of the given
+   * position.
+   */
+  double evaluate(const Board& b, const FeatureOverlapCounts& counts,
+                  const SearchContext& context) const {
     const Player player = b.active_player();
     const Player other_player = get_other_player(player);
     double val = 0.0;
 
-    for (const auto i : b.get_pieces(player).get_all_position_indices()) {
-      val += center_weight * vtile[i];
+    const auto player_positions = b.get_pieces(player).positions;
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+      if (player_positions.test(i)) val += center_weight * vtile[i];
     }
 
-    for (const auto i : b.get_pieces(other_player).get_all_position_indices()) {
-      val -= center_weight * vtile[i];
+    const auto other_player_positions = b.get_pieces(other_player).positions;
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+      if (other_player_positions.test(i)) val -= center_weight * vtile[i];
     }
 
-    const auto player_pieces = feature_evaluator.query_pieces(b, player);
-    const auto opponent_pieces =
-        feature_evaluator.query_pieces(b, other_player);
-    const auto spaces = feature_evaluator.query_spaces(b);
-    for (const auto& feature : features) {
-      if (!feature.enabled) continue;
+    const auto& player_pieces = counts.get_pieces(player);
+    const auto& opponent_pieces = counts.get_pieces(other_player);
+    const auto& spaces = counts.spaces;
+    for (const auto& feature : feature_set->features) {
       const auto i = feature.vector_index;
+      if (context.is_dropped(i)) continue;
       if (feature.feature.contained_in(player_pieces[i], spaces[i])) {
         val += feature_group_weights[feature.weight_index].weight_act;
       } else if (feature.feature.contained_in(opponent_pieces[i], spaces[i])) {
@@ -422,95 +741,88 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
   std::vector<typename Board::MoveT> get_moves(const Board& b,
                                                Player evalPlayer,
                                                bool sorted = true) {
-    const Player player = b.active_player();
-    const Player other_player = get_other_player(player);
-    const double c_act = (player == evalPlayer) ? c_self : c_opp;
-    const double c_pass = (player == evalPlayer) ? c_opp : c_self;
-
-    auto player_pieces = feature_evaluator.query_pieces(b, player);
-    auto opponent_pieces = feature_evaluator.query_pieces(b, other_player);
-    auto spaces = feature_evaluator.query_spaces(b);
-
-    std::unordered_map<typename Board::PatternT, typename Board::MoveT,
-                       typename Board::PatternHasherT>
-        candidate_moves;
-    double deltaL = 0.0;
-    for (const auto& feature : features) {
-      if (!feature.enabled) continue;
-      const auto i = feature.vector_index;
-      if (feature.feature.contained_in(player_pieces[i], spaces[i])) {
-        deltaL -= c_pass *
-                  feature_group_weights[feature.weight_index].diff_act_pass();
-      } else if (feature.feature.contained_in(opponent_pieces[i], spaces[i])) {
-        deltaL -=
-            c_act * feature_group_weights[feature.weight_index].diff_act_pass();
-      }
-    }
-
-    for (const auto i : b.get_spaces().get_all_position_indices()) {
-      candidate_moves[typename Board::PatternT(1LLU << i)] =
-          typename Board::MoveT(i,
-                                deltaL + center_weight * vtile[i] +
-                                    (noise_enabled ? noise(engine) : 0.0),
-                                player);
-    }
+    return get_moves(b, evalPlayer, get_feature_counts(b), sorted);
+  }
 
-    for (const auto& feature : features) {
-      if (!feature.enabled) continue;
-      const auto i = feature.vector_index;
+  /**
+   * Returns all possible moves from a given position, as well as their
+   * associated heuristic evaluations, using precomputed feature overlap
+   * counts.
+   *
+   * @param b The board containing the starting position.
+   * @param evalPlayer The player from whose perspective we're evaluating the
+   * board.
+   * @param counts The feature overlap counts of the given board.
+   * @param sorted If true, return all of the moves in sorted order by heuristic
+   * evaluation.
+   *
+   * @return All possible moves from the given position, evaluated by the
+   * heuristic.
+   */
+  std::vector<typename Board::MoveT> get_moves(
+      const Board& b, Player evalPlayer, const FeatureOverlapCounts& counts,
+      bool sorted = true) {
+    std::vector<typename Board::MoveT> moves;
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    get_moves(b, evalPlayer, counts, default_context, moves, sorted);
+    return moves;
+  }
 
-      // If either player can fill in the feature, and the current player
-      // can complete it...
-      if (feature.feature.can_be_completed(player_pieces[i], opponent_pieces[i],
-                                           spaces[i])) {
-        const typename Board::PatternT player_missing_pieces =
-            feature.feature.missing_pieces(b, player);
-        auto search = candidate_moves.find(player_missing_pieces);
-        if (search != candidate_moves.end()) {
-          search->second.val +=
-              c_pass * feature_group_weights[feature.weight_index].weight_pass;
-        }
+  /**
+   * Computes all possible moves from a given position within a search, as well
+   * as their associated heuristic evaluations, using precomputed feature
+   * overlap counts. Writes the moves into a caller-supplied buffer so that
+   * repeated calls don't allocate.
+   *
+   * If a transposition table is given, the noise-free evaluation of the
+   * position is looked up in (or inserted into) the table, and fresh noise is
+   * drawn on top of it for every call. This is equivalent in distribution to
+   * evaluating without a table, and exactly equivalent when noise is disabled.
+   * Evaluations are only shared between searches that drop the same features
+   * (see `TranspositionTable`).
+   *
+   * @param b The board containing the starting position.
+   * @param evalPlayer The player from whose perspective we're evaluating the
+   * board.
+   * @param counts The feature overlap counts of the given board.
+   * @param context The context of the search the moves are evaluated in.
+   * @param moves Overwritten with all possible moves from the given position,
+   * evaluated by the heuristic.
+   * @param sorted If true, return all of the moves in sorted order by heuristic
+   * evaluation.
+   * @param table An optional transposition table caching move evaluations.
+   */
+  void get_moves(const Board& b, Player evalPlayer,
+                 const FeatureOverlapCounts& counts, SearchContext& context,
+                 std::vector<typename Board::MoveT>& moves, bool sorted = true,
+                 TranspositionTableT* table = nullptr) const {
+    const auto empty_positions = b.get_spaces().positions;
+    typename TranspositionTableT::ValuesT values;
+    if (!table) {
+      evaluate_moves(b, evalPlayer, counts, context, noise_enabled, values);
+    } else {
+      const auto key = TranspositionTableT::hash(b, evalPlayer);
+      if (!table->find(key, b, evalPlayer, context.evaluation_version,
+                       values)) {
+        evaluate_moves(b, evalPlayer, counts, context, false, values);
+        table->insert(key, b, evalPlayer, context.evaluation_version, values);
       }
-
-      // If the current player has the required pieces but the opponent can
-      // block us or if the other player has the feature and we can block
-      // them...
-      const bool can_be_removed =
-          feature.feature.can_be_removed(player_pieces[i], spaces[i]);
-      const bool can_remove_opponent =
-          feature.feature.can_be_removed(opponent_pieces[i], spaces[i]);
-      if (can_be_removed || can_remove_opponent) {
-        for (const auto& position :
-             feature.feature.spaces.get_all_positions()) {
-          if (b.contains_spaces(position)) {
-            auto search = candidate_moves.find(position);
-            if (search != candidate_moves.end()) {
-              if (can_be_removed)
-                search->second.val -=
-                    c_pass *
-                    feature_group_weights[feature.weight_index].weight_pass;
-              if (can_remove_opponent)
-                search->second.val +=
-                    c_act *
-                    feature_group_weights[feature.weight_index].weight_act;
-            }
-          }
+      if (noise_enabled) {
+        for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+          if (empty_positions.test(i))
+            values[i] += context.noise(context.engine);
         }
       }
     }
 
-    std::vector<typename Board::MoveT> output_moves;
-    for (const auto kv : candidate_moves) {
-      output_moves.push_back(kv.second);
+    const Player player = b.active_player();
+    moves.clear();
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+      if (empty_positions.test(i)) moves.emplace_back(i, values[i], player);
     }
-    std::sort(output_moves.begin(), output_moves.end(),
-              [](const auto& m1, const auto& m2) {
-                return m1.board_position < m2.board_position;
-              });
 
-    if (!sorted) return output_moves;
-    std::sort(output_moves.begin(), output_moves.end(), std::greater<>());
-    return output_moves;
+    if (!sorted) return;
+    std::sort(moves.begin(), moves.end(), std::greater<>());
   }
 
   /**
@@ -525,7 +837,51 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    */
   std::vector<typename Board::MoveT> get_pruned_moves(const Board& b,
                                                       Player evalPlayer) {
-    std::vector<typename Board::MoveT> candidates = get_moves(b, evalPlayer);
+    return get_pruned_moves(b, evalPlayer, get_feature_counts(b));
+  }
+
+  /**
+   * Returns a pruned set of moves from the given position, using precomputed
+   * feature overlap counts. Evaluates every move, and then removes the weakest
+   * moves as determined by `pruning_thresh`.
+   *
+   * @param b The board containing the starting position.
+   * @param evalPlayer The player from whose perspective we're evaluating the
+   * board.
+   * @param counts The feature overlap counts of the given board.
+   *
+   * @return Pruned moves from the given position, evaluated by the heuristic.
+   */
+  std::vector<typename Board::MoveT> get_pruned_moves(
+      const Board& b, Player evalPlayer, const FeatureOverlapCounts& counts) {
+    std::vector<typename Board::MoveT> candidates;
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    get_pruned_moves(b, evalPlayer, counts, default_context, candidates);
+    return candidates;
+  }
+
+  /**
+   * Computes a pruned set of moves from the given position within a search,
+   * using precomputed feature overlap counts, and writes them into a
+   * caller-supplied buffer so that repeated calls don't allocate. Evaluates
+   * every move, and then removes the weakest moves as determined by
+   * `pruning_thresh`.
+   *
+   * @param b The board containing the starting position.
+   * @param evalPlayer The player from whose perspective we're evaluating the
+   * board.
+   * @param counts The feature overlap counts of the given board.
+   * @param context The context of the search the moves are evaluated in.
+   * @param candidates Overwritten with the pruned moves from the given
+   * position, evaluated by the heuristic.
+   * @param table An optional transposition table caching move evaluations.
+   */
+  void get_pruned_moves(const Board& b, Player evalPlayer,
+                        const FeatureOverlapCounts& counts,
+                        SearchContext& context,
+                        std::vector<typename Board::MoveT>& candidates,
+                        TranspositionTableT* table = nullptr) const {
+    get_moves(b, evalPlayer, counts, context, candidates, true, table);
     std::size_t i = 1;
     while (i < candidates.size() &&
            abs(candidates[0].val - candidates[i].val) < pruning_thresh) {
@@ -533,7 +889,6 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
     }
     if (i < candidates.size())
       candidates.erase(candidates.begin() + i, candidates.end());
-    return candidates;
   }
 
   /**
@@ -543,6 +898,19 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    * on the board.
    */
   typename Board::MoveT get_random_move(const Board& b) {
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    return get_random_move(b, default_context);
+  }
+
+  /**
+   * @param b The board containing the starting position.
+   * @param context The context of the search the move is selected in.
+   *
+   * @return A legal move selected uniformly at random from all possible moves
+   * on the board.
+   */
+  typename Board::MoveT get_random_move(const Board& b,
+                                        SearchContext& context) const {
     std::vector<std::size_t> options;
 
     for (const auto i : b.get_spaces().get_all_position_indices()) {
@@ -551,7 +919,7 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
 
     if (options.size() > 0) {
       return typename Board::MoveT(options[std::uniform_int_distribution<int>(
-                                       0, options.size() - 1U)(engine)],
+                                       0, options.size() - 1U)(context.engine)],
                                    0.0, b.active_player());
     } else {
       return typename Board::MoveT(0, 0.0, b.active_player());
@@ -571,39 +939,81 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
    * lapse.
    */
   typename Board::MoveT get_best_move(std::shared_ptr<Node<Board>> tree) {
-    if (noise_enabled && lapse(engine))
-      return get_random_move(tree->get_board());
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    return get_best_move(tree, default_context);
+  }
+
+  /**
+   * Applies the heuristic's lapse rate to the result of a search. See
+   * `get_best_move`.
+   *
+   * @param tree The tree of moves over which we'd like to select the best.
+   * @param context The context of the search that built the tree.
+   *
+   * @return Either the best move in the given tree, or a random move if we
+   * lapse.
+   */
+  typename Board::MoveT get_best_move(std::shared_ptr<Node<Board>> tree,
+                                      SearchContext& context) const {
+    if (sample_lapse(context))
+      return get_random_move(tree->get_board(), context);
 
     return tree->get_best_move();
   }
 
   /**
-   * Tells the heuristic that a search is in progress, triggering the removal
-   * of a random subset of features as determined by their respective
-   * `drop_rate`s.
+   * Decides whether the heuristic lapses on its next move, in which case it
+   * plays a random move instead of the result of a search. Since the decision
+   * doesn't depend on the search, it can be made before searching, and the
+   * search skipped entirely on a lapse.
+   *
+   * @return True if the heuristic should play a random move.
    */
-  void start_search() {
-    if (search_in_progress)
-      throw std::logic_error(
-          "Cannot start a search when a previous search is being executed!");
-    search_in_progress = true;
-    if (noise_enabled) remove_features();
+  bool sample_lapse() {
+    std::lock_guard<std::mutex> lock(default_context_mutex);
+    return sample_lapse(default_context);
   }
 
   /**
-   * Tells the heuristic that a search has completed and restores all dropped
-   * features.
+   * Decides whether the heuristic lapses on its next move. See `sample_lapse`.
+   *
+   * @param context The context of the search the move is selected in.
+   *
+   * @return True if the heuristic should play a random move.
+   */
+  bool sample_lapse(SearchContext& context) const {
+    return noise_enabled &&
+           std::bernoulli_distribution{lapse_rate}(context.engine);
+  }
+
+  /**
+   * Creates the context for a new search, seeding its random number generator
+   * from the heuristic's (see `set_counter_based_rng`) and removing a random
+   * subset of features as determined by their respective `drop_rate`s if noise
+   * is enabled.
+   *
+   * @return The context of the new search.
    */
-  void complete_search() {
-    restore_features();
-    search_in_progress = false;
+  SearchContext create_search_context() {
+    SearchContext context(counter_based_rng
+                              ? RandomEngine(rng_seed, next_search_id++)
+                              : RandomEngine(next_search_seed()));
+    context.evaluation_version = evaluation_version;
+    if (noise_enabled) remove_features(context);
+    return context;
   }
 
   /**
-   * @param enabled If true, enable noise, else, disable noise.
+   * @param enabled If true, enable noise, else, disable noise. Must not be
+   * changed while searches are running.
    */
   void set_noise_enabled(bool enabled) { noise_enabled = enabled; }
 
+  /**
+   * @return True if noise is enabled.
+   */
+  bool is_noise_enabled() const { return noise_enabled; }
+
   /**
    * @return The `gamma` parameter.
    */
@@ -616,25 +1026,113 @@ class Heuristic : public std::enable_shared_from_this<Heuristic<Board>> {
 
  private:
   /**
-   * Randomly removes features, respecting their associated `drop_rate`s.
+   * Evaluates every move from a given position, using precomputed feature
+   * overlap counts.
+   *
+   * @param b The board containing the starting position.
+   * @param evalPlayer The player from whose perspective we're evaluating the
+   * board.
+   * @param counts The feature overlap counts of the given board.
+   * @param context The context of the search the moves are evaluated in.
+   * @param add_noise If true, inject noise into each move's evaluation.
+   * @param values Overwritten with the evaluation of every move, indexed by
+   * board position. Only the entries of empty positions are written.
    */
-  void remove_features() {
-    for (auto& feature : features) {
-      if (std::bernoulli_distribution{
-              feature_group_weights[feature.weight_index].drop_rate}(engine)) {
-        feature.enabled = false;
-      } else {
-        feature.enabled = true;
+  void evaluate_moves(const Board& b, Player evalPlayer,
+                      const FeatureOverlapCounts& counts,
+                      SearchContext& context, bool add_noise,
+                      typename TranspositionTableT::ValuesT& values) const {
+    const Player player = b.active_player();
+    const Player other_player = get_other_player(player);
+    const double c_act = (player == evalPlayer) ? c_self : c_opp;
+    const double c_pass = (player == evalPlayer) ? c_opp : c_self;
+
+    const auto& player_pieces = counts.get_pieces(player);
+    const auto& opponent_pieces = counts.get_pieces(other_player);
+    const auto& spaces = counts.spaces;
+
+    const auto empty_positions = b.get_spaces().positions;
+    double deltaL = 0.0;
+    for (const auto& feature : feature_set->features) {
+      const auto i = feature.vector_index;
+      if (context.is_dropped(i)) continue;
+      if (feature.feature.contained_in(player_pieces[i], spaces[i])) {
+        deltaL -= c_pass *
+                  feature_group_weights[feature.weight_index].diff_act_pass();
+      } else if (feature.feature.contained_in(opponent_pieces[i], spaces[i])) {
+        deltaL -=
+            c_act * feature_group_weights[feature.weight_index].diff_act_pass();
+      }
+    }
+
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+      if (!empty_positions.test(i)) continue;
+      values[i] = deltaL + center_weight * vtile[i] +
+                  (add_noise ? context.noise(context.engine) : 0.0);
+    }
+
+    for (const auto& feature : feature_set->features) {
+      const auto i = feature.vector_index;
+      if (context.is_dropped(i)) continue;
+
+      // If either player can fill in the feature, and the current player
+      // can complete it...
+      if (feature.feature.can_be_completed(player_pieces[i], opponent_pieces[i],
+                                           spaces[i])) {
+        const auto player_missing_pieces =
+            feature.feature.missing_pieces(b, player).positions;
+        if (player_missing_pieces.count() == 1 &&
+            (player_missing_pieces & empty_positions).any()) {
+          std::size_t position = 0;
+          while (!player_missing_pieces.test(position)) ++position;
+          values[position] +=
+              c_pass * feature_group_weights[feature.weight_index].weight_pass;
+        }
+      }
+
+      // If the current player has the required pieces but the opponent can
+      // block us or if the other player has the feature and we can block
+      // them...
+      const bool can_be_removed =
+          feature.feature.can_be_removed(player_pieces[i], spaces[i]);
+      const bool can_remove_opponent =
+          feature.feature.can_be_removed(opponent_pieces[i], spaces[i]);
+      if (can_be_removed || can_remove_opponent) {
+        for (const auto position : feature_set->feature_space_positions[i]) {
+          if (!empty_positions.test(position)) continue;
+          if (can_be_removed)
+            values[position] -=
+                c_pass *
+                feature_group_weights[feature.weight_index].weight_pass;
+          if (can_remove_opponent)
+            values[position] +=
+                c_act * feature_group_weights[feature.weight_index].weight_act;
+        }
       }
     }
   }
 
   /**
-   * Restores all features to the pool.
+   * Randomly removes features from a search, respecting their associated
+   * `drop_rate`s.
+   *
+   * @param context The context of the search to remove features from.
    */
-  void restore_features() {
-    for (auto& feature : features) {
-      feature.enabled = true;
+  void remove_features(SearchContext& context) {
+    context.dropped_features.assign(feature_set->features.size(), 0);
+    bool any_dropped = false;
+    for (const auto& feature : feature_set->features) {
+      if (std::bernoulli_distribution{
+              feature_group_weights[feature.weight_index].drop_rate}(
+              context.engine)) {
+        context.dropped_features[feature.vector_index] = 1;
+        any_dropped = true;
+      }
+    }
+    if (any_dropped) {
+      context.evaluation_version = next_evaluation_version();
+    } else {
+      context.dropped_features.clear();
     }
   }
 };
@@ -1,5 +1,7 @@
 #include <gtest/gtest.h>
 
+#include <thread>
+
 #include "fourbynine_features.h"
 #include "ninarow_bfs.h"
 #include "ninarow_board.h"
@@ -52,3 +54,232 @@ TEST(NInARowHeuristicTest, TestHeuristicGetBestMoveBFS) {
     }
   }
 }
+
+TEST(NInARowHeuristicTest, TestHeuristicIncrementalFeatureCounts) {
+  using Board = Board<4, 9, 4>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  heuristic->seed_generator(3);
+
+  Board b;
+  auto counts = heuristic->get_feature_counts(b);
+  std::size_t moves_remaining = 20;
+  while (moves_remaining-- != 0) {
+    EXPECT_EQ(heuristic->evaluate(b, counts), heuristic->evaluate(b));
+    const auto incremental_moves =
+        heuristic->get_moves(b, b.active_player(), counts);
+    const auto moves = heuristic->get_moves(b, b.active_player());
+    ASSERT_EQ(incremental_moves.size(), moves.size());
+    for (std::size_t i = 0; i < moves.size(); ++i) {
+      EXPECT_EQ(incremental_moves[i].board_position, moves[i].board_position);
+      EXPECT_EQ(incremental_moves[i].val, moves[i].val);
+    }
+
+    const auto move = heuristic->get_random_move(b);
+    heuristic->update_feature_counts(counts, move);
+    b = b + move;
+  }
+}
+
+TEST(NInARowHeuristicTest, TestHeuristicGetMovesIntoBuffer) {
+  using Board = Board<4, 9, 4>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  heuristic->seed_generator(5);
+
+  Board b;
+  SearchContext context;
+  std::vector<Board::MoveT> buffer;
+  std::vector<Board::MoveT> pruned_buffer;
+  std::size_t moves_remaining = 20;
+  while (moves_remaining-- != 0) {
+    const auto counts = heuristic->get_feature_counts(b);
+    heuristic->get_moves(b, b.active_player(), counts, context, buffer);
+    const auto moves = heuristic->get_moves(b, b.active_player());
+    ASSERT_EQ(buffer.size(), moves.size());
+    for (std::size_t i = 0; i < moves.size(); ++i) {
+      EXPECT_EQ(buffer[i].board_position, moves[i].board_position);
+      EXPECT_EQ(buffer[i].val, moves[i].val);
+    }
+
+    heuristic->get_pruned_moves(b, b.active_player(), counts, context,
+                                pruned_buffer);
+    const auto pruned_moves = heuristic->get_pruned_moves(b, b.active_player());
+    ASSERT_EQ(pruned_buffer.size(), pruned_moves.size());
+    for (std::size_t i = 0; i < pruned_moves.size(); ++i) {
+      EXPECT_EQ(pruned_buffer[i].board_position,
+                pruned_moves[i].board_position);
+    }
+
+    b = b + heuristic->get_random_move(b);
+  }
+}
+
+TEST(NInARowHeuristicTest, TestHeuristicConcurrentSearches) {
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  // Searches running concurrently on a shared heuristic must produce the same
+  // trees as when run one after another.
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+
+  std::vector<Board> boards;
+  Board b;
+  for (std::size_t i = 0; i < 8; ++i) {
+    boards.push_back(b);
+    b = b + heuristic->get_random_move(b);
+  }
+
+  std::vector<std::string> expected;
+  for (const auto& board : boards) {
+    auto search = std::make_shared<Search>(heuristic, board);
+    search->complete_search();
+    expected.push_back(search->get_tree()->to_string(3));
+  }
+
+  std::vector<std::string> actual(boards.size());
+  std::vector<std::thread> threads;
+  for (std::size_t i = 0; i < boards.size(); ++i) {
+    threads.emplace_back([&, i]() {
+      auto search = std::make_shared<Search>(heuristic, boards[i]);
+      search->complete_search();
+      actual[i] = search->get_tree()->to_string(3);
+    });
+  }
+  for (auto& thread : threads) thread.join();
+  EXPECT_EQ(actual, expected);
+
+  // With noise, each search draws its own seed from the heuristic, so seeding
+  // the heuristic makes a sequence of searches reproducible.
+  heuristic->set_noise_enabled(true);
+  std::vector<std::string> noisy_runs[2];
+  for (auto& run : noisy_runs) {
+    heuristic->seed_generator(3);
+    for (const auto& board : boards) {
+      auto search = std::make_shared<Search>(heuristic, board);
+      search->complete_search();
+      run.push_back(search->get_tree()->to_string(3));
+    }
+  }
+  EXPECT_EQ(noisy_runs[0], noisy_runs[1]);
+}
+
+TEST(NInARowHeuristicTest, TestHeuristicParameterUpdates) {
+  using Board = Board<4, 9, 4>;
+
+  std::vector<double> params = DefaultFourByNineParameters;
+  params[1] = 3.0;
+  for (std::size_t i = 6; i < params.size(); ++i) params[i] *= 1.5;
+
+  auto heuristic = Heuristic<Board>::create();
+  auto expected = Heuristic<Board>::create(params);
+  auto clone = heuristic->clone_with_parameters(params);
+  expected->set_noise_enabled(false);
+  clone->set_noise_enabled(false);
+
+  // Cloned heuristics share their features with the original.
+  EXPECT_EQ(&clone->get_features_with_metadata(),
+            &heuristic->get_features_with_metadata());
+
+  Board b;
+  for (std::size_t i = 0; i < 10; ++i) {
+    heuristic->set_noise_enabled(false);
+    heuristic->set_parameters(DefaultFourByNineParameters);
+    const double original = heuristic->evaluate(b);
+    heuristic->set_parameters(params);
+    EXPECT_EQ(heuristic->evaluate(b), expected->evaluate(b));
+    EXPECT_EQ(clone->evaluate(b), expected->evaluate(b));
+    if (i != 0) {
+      EXPECT_NE(heuristic->evaluate(b), original);
+    }
+
+    const auto moves = heuristic->get_pruned_moves(b, b.active_player());
+    const auto expected_moves =
+        expected->get_pruned_moves(b, b.active_player());
+    ASSERT_EQ(moves.size(), expected_moves.size());
+    for (std::size_t j = 0; j < moves.size(); ++j) {
+      EXPECT_EQ(moves[j].board_position, expected_moves[j].board_position);
+      EXPECT_EQ(moves[j].val, expected_moves[j].val);
+    }
+
+    heuristic->set_noise_enabled(true);
+    b = b + heuristic->get_random_move(b);
+  }
+
+  EXPECT_THROW(heuristic->set_parameters(std::vector<double>(7, 1.0)),
+               std::invalid_argument);
+  EXPECT_THROW(heuristic->clone_with_parameters(std::vector<double>(10, 1.0)),
+               std::invalid_argument);
+
+  // Adding a feature to a clone doesn't affect the heuristics it shares
+  // features with.
+  const std::size_t feature_count =
+      heuristic->get_features_with_metadata().size();
+  clone->add_feature(0, FourByNineFeatures[0][0]);
+  EXPECT_EQ(clone->get_features_with_metadata().size(), feature_count + 1);
+  EXPECT_EQ(heuristic->get_features_with_metadata().size(), feature_count);
+}
+
+TEST(NInARowHeuristicTest, TestHeuristicCounterBasedRNG) {
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_counter_based_rng(true);
+  EXPECT_TRUE(heuristic->is_counter_based_rng());
+  heuristic->seed_generator(11);
+  EXPECT_EQ(heuristic->get_next_search_id(), 0);
+
+  std::vector<Board> boards;
+  Board b;
+  for (std::size_t i = 0; i < 6; ++i) {
+    boards.push_back(b);
+    b = b + heuristic->get_random_move(b);
+  }
+
+  // Searches created concurrently get distinct ids, and each one is
+  // reproducible from the seed and its id alone.
+  std::vector<std::string> trees(boards.size());
+  std::vector<std::thread> threads;
+  for (std::size_t i = 0; i < boards.size(); ++i) {
+    threads.emplace_back([&, i]() {
+      auto search = std::make_shared<Search>(heuristic, boards[i]);
+      search->complete_search();
+      trees[i] = search->get_tree()->to_string(3);
+    });
+  }
+  for (auto& thread : threads) thread.join();
+  EXPECT_EQ(heuristic->get_next_search_id(), boards.size());
+
+  for (std::size_t i = 0; i < boards.size(); ++i) {
+    // Whichever id the search of this board got, replaying it reproduces it.
+    bool replayed = false;
+    for (std::uint64_t id = 0; id < boards.size(); ++id) {
+      heuristic->seed_generator(11);
+      heuristic->set_next_search_id(id);
+      auto search = std::make_shared<Search>(heuristic, boards[i]);
+      search->complete_search();
+      replayed = replayed || search->get_tree()->to_string(3) == trees[i];
+    }
+    EXPECT_TRUE(replayed);
+  }
+
+  // Reseeding restarts the sequence of searches.
+  std::vector<std::string> runs[2];
+  for (auto& run : runs) {
+    heuristic->seed_generator(5);
+    for (const auto& board : boards) {
+      auto search = std::make_shared<Search>(heuristic, board);
+      search->complete_search();
+      run.push_back(search->get_tree()->to_string(3));
+    }
+  }
+  EXPECT_EQ(runs[0], runs[1]);
+
+  // Clones keep the choice of generator.
+  EXPECT_TRUE(heuristic->clone_with_parameters(DefaultFourByNineParameters)
+                  ->is_counter_based_rng());
+}
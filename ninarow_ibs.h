@@ -0,0 +1,350 @@
+#ifndef NINAROW_IBS_H_INCLUDED
+#define NINAROW_IBS_H_INCLUDED
+
+#include <algorithm>
+#include <condition_variable>
+#include <cstdint>
+#include <exception>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <random>
+#include <stdexcept>
+#include <thread>
+#include <vector>
+
+#include "cancellation_token.h"
+#include "ninarow_bfs.h"
+#include "ninarow_heuristic.h"
+
+namespace NInARow {
+
+/**
+ * The results of estimating the log-likelihoods of a batch of observed moves
+ * with inverse binomial sampling. All vectors are indexed by task, in the order
+ * the tasks were added.
+ */
+struct IBSResult {
+  /**
+   * The estimated negative log-likelihood of each observed move.
+   */
+  std::vector<double> L_values;
+
+  /**
+   * The number of searches run for each observed move.
+   */
+  std::vector<size_t> attempt_counts;
+
+  /**
+   * The number of times each observed move was reproduced by a search.
+   */
+  std::vector<size_t> success_counts;
+
+  /**
+   * The running expected log-likelihood at the end of the estimation.
+   */
+  double Lexpt;
+
+  /**
+   * True if the estimation stopped early because `Lexpt` exceeded the cutoff.
+   */
+  bool cutoff_reached;
+};
+
+/**
+ * Estimates the log-likelihood of a set of observed moves under a heuristic
+ * using inverse binomial sampling (IBS): moves are sampled from the heuristic
+ * at each observed position until they reproduce the observed move a required
+ * number of times. Samples are drawn by a pool of threads sharing a single
+ * heuristic. Observed moves played from the same position share their samples:
+ * each move sampled from a position counts as a trial for every observed move
+ * at that position.
+ *
+ * @tparam Heuristic The heuristic being fit.
+ */
+template <class Heuristic>
+class InverseBinomialSampler {
+ public:
+  using BoardT = typename Heuristic::BoardT;
+  using MoveT = typename BoardT::MoveT;
+
+ private:
+  /**
+   * A single observed move.
+   */
+  struct Task {
+    /**
+     * The position the move was played in.
+     */
+    BoardT board;
+
+    /**
+     * The observed move.
+     */
+    MoveT move;
+
+    /**
+     * The number of times the heuristic has to reproduce the observed move.
+     */
+    std::size_t required_success_count;
+  };
+
+  /**
+   * The sampling progress of a single observed move. Mirrors
+   * `SuccessFrequencyTracker` in model_fit.py.
+   */
+  struct TaskState {
+    std::size_t attempt_count = 1;
+    std::size_t success_count = 0;
+    std::size_t num_trials = 0;
+    double L = 0.0;
+  };
+
+  /**
+   * The observed moves to estimate the log-likelihood of.
+   */
+  std::vector<Task> tasks;
+
+  /**
+   * The expected contribution of each observed move to the log-likelihood.
+   */
+  double expt_factor;
+
+  /**
+   * The per-move stop-loss cutoff: the estimation ends early once the expected
+   * log-likelihood exceeds the number of moves times this value.
+   */
+  double cutoff;
+
+ public:
+  /**
+   * Constructor.
+   *
+   * @param expt_factor The expected contribution of each observed move to the
+   * log-likelihood.
+   * @param cutoff The per-move stop-loss cutoff.
+   */
+  InverseBinomialSampler(double expt_factor = 1.0, double cutoff = 3.5)
+      : tasks(), expt_factor(expt_factor), cutoff(cutoff) {}
+
+  /**
+   * Adds an observed move to the batch.
+   *
+   * @param board The position the move was played in.
+   * @param move The observed move.
+   * @param required_success_count The number of times the heuristic has to
+   * reproduce the observed move.
+   */
+  void add_task(const BoardT& board, const MoveT& move,
+                std::size_t required_success_count = 1) {
+    if (required_success_count == 0)
+      throw std::invalid_argument(
+          "Observed moves must be reproduced at least once!");
+    tasks.push_back(Task{board, move, required_success_count});
+  }
+
+  /**
+   * @return The number of observed moves in the batch.
+   */
+  std::size_t get_num_tasks() const { return tasks.size(); }
+
+  /**
+   * Removes all observed moves from the batch.
+   */
+  void clear_tasks() { tasks.clear(); }
+
+  /**
+   * Estimates the log-likelihood of every observed move under a heuristic with
+   * the given parameters.
+   *
+   * @param params The parameters of the heuristic, as accepted by
+   * `Heuristic::create`.
+   * @param seed The seed for all of the randomness of the estimation.
+   * @param num_threads The number of threads to sample with. If zero, use one
+   * thread per hardware thread.
+   *
+   * @return The estimated log-likelihoods.
+   */
+  IBSResult estimate_log_likelihoods(const std::vector<double>& params,
+                                     std::uint64_t seed,
+                                     std::size_t num_threads = 0) const {
+    auto heuristic = Heuristic::create(params);
+    heuristic->seed_generator(seed);
+
+    if (num_threads == 0)
+      num_threads = std::max(1U, std::thread::hardware_concurrency());
+
+    const double N = static_cast<double>(tasks.size());
+    const double Lexpt_cutoff = N * cutoff;
+    std::vector<TaskState> states(tasks.size());
+
+    // Group the observed moves by the position they were played from.
+    std::vector<std::vector<std::size_t>> groups;
+    {
+      std::map<std::pair<unsigned long long, unsigned long long>, std::size_t>
+          group_indices;
+      for (std::size_t i = 0; i < tasks.size(); ++i) {
+        const auto key = std::make_pair(
+            tasks[i].board.get_pieces(Player::Player1).positions.to_ullong(),
+            tasks[i].board.get_pieces(Player::Player2).positions.to_ullong());
+        const auto inserted = group_indices.emplace(key, groups.size());
+        if (inserted.second) groups.emplace_back();
+        groups[inserted.first->second].push_back(i);
+      }
+    }
+    std::vector<std::size_t> available(groups.size());
+    for (std::size_t i = 0; i < available.size(); ++i) available[i] = i;
+    double Lexpt = N * expt_factor;
+    bool cutoff_reached = false;
+    std::size_t claimed_count = 0;
+    std::mutex mutex;
+    std::condition_variable available_changed;
+    std::exception_ptr error;
+    // Cancels running searches once their results are no longer needed.
+    const auto cancellation = CancellationToken::create();
+
+    // Each worker repeatedly claims a random unfinished position and samples
+    // it until the next success of any of its observed moves, so a position is
+    // only ever worked on by one thread.
+    auto worker = [&](std::size_t thread_index) {
+      std::mt19937_64 engine(seed + thread_index + 1);
+      SearchContext lapse_context(engine());
+      std::vector<std::pair<std::size_t, TaskState>> members;
+      while (true) {
+        std::size_t group;
+        members.clear();
+        {
+          // If every unfinished position is claimed, wait for one to be
+          // handed back rather than exiting.
+          std::unique_lock<std::mutex> lock(mutex);
+          available_changed.wait(lock, [&]() {
+            return cutoff_reached || error || !available.empty() ||
+                   claimed_count == 0;
+          });
+          if (cutoff_reached || error || available.empty()) return;
+          ++claimed_count;
+          const std::size_t choice = std::uniform_int_distribution<std::size_t>(
+              0, available.size() - 1)(engine);
+          group = available[choice];
+          available[choice] = available.back();
+          available.pop_back();
+          for (const auto id : groups[group]) {
+            if (states[id].success_count != tasks[id].required_success_count)
+              members.emplace_back(id, states[id]);
+          }
+        }
+
+        const auto& board = tasks[groups[group].front()].board;
+        double local_Lexpt_delta = 0.0;
+        // Gives up on the claimed position once the cutoff has been reached.
+        // Progress on it since its last success is discarded. Must be called
+        // with the mutex held.
+        const auto abandon_position = [&]() {
+          Lexpt += local_Lexpt_delta;
+          cutoff_reached = true;
+          for (const auto& member : members) {
+            states[member.first].num_trials = member.second.num_trials;
+          }
+          cancellation->cancel();
+          available_changed.notify_all();
+        };
+        try {
+          while (true) {
+            // Lapses are decided before searching so that no search is wasted
+            // on them.
+            std::size_t sampled_position;
+            if (heuristic->sample_lapse(lapse_context)) {
+              sampled_position =
+                  heuristic->get_random_move(board, lapse_context)
+                      .board_position;
+            } else {
+              NInARowBestFirstSearch<Heuristic> search(heuristic, board);
+              search.set_cancellation_token(cancellation);
+              search.complete_search();
+              if (search.was_cancelled()) {
+                std::lock_guard<std::mutex> lock(mutex);
+                abandon_position();
+                return;
+              }
+              sampled_position =
+                  search.get_tree()->get_best_move().board_position;
+            }
+            bool any_success = false;
+            for (auto& member : members) {
+              const auto& observed = tasks[member.first];
+              auto& task = member.second;
+              if (task.success_count == observed.required_success_count)
+                continue;
+              ++task.num_trials;
+              if (sampled_position == observed.move.board_position) {
+                ++task.success_count;
+                if (task.success_count != observed.required_success_count)
+                  task.attempt_count = 1;
+                local_Lexpt_delta -=
+                    expt_factor / observed.required_success_count;
+                any_success = true;
+              } else {
+                const double delta =
+                    expt_factor /
+                    (observed.required_success_count * task.attempt_count);
+                task.L += delta;
+                ++task.attempt_count;
+                local_Lexpt_delta += delta;
+              }
+            }
+
+            std::lock_guard<std::mutex> lock(mutex);
+            if (any_success) {
+              bool finished = true;
+              for (const auto& member : members) {
+                states[member.first] = member.second;
+                finished =
+                    finished && member.second.success_count ==
+                                    tasks[member.first].required_success_count;
+              }
+              Lexpt += local_Lexpt_delta;
+              if (!finished) available.push_back(group);
+              --claimed_count;
+              available_changed.notify_all();
+              break;
+            }
+            // We may need to exit early. This implicitly signals all of the
+            // other threads as well. Progress on the current position since
+            // its last success is discarded.
+            if (cutoff_reached || Lexpt + local_Lexpt_delta > Lexpt_cutoff) {
+              abandon_position();
+              return;
+            }
+          }
+        } catch (...) {
+          std::lock_guard<std::mutex> lock(mutex);
+          if (!error) error = std::current_exception();
+          cancellation->cancel();
+          available_changed.notify_all();
+          return;
+        }
+      }
+    };
+
+    std::vector<std::thread> threads;
+    for (std::size_t i = 1; i < num_threads; ++i)
+      threads.emplace_back(worker, i);
+    worker(0);
+    for (auto& thread : threads) thread.join();
+    if (error) std::rethrow_exception(error);
+
+    IBSResult result;
+    for (const auto& state : states) {
+      result.L_values.push_back(state.L);
+      result.attempt_counts.push_back(state.num_trials);
+      result.success_counts.push_back(state.success_count);
+    }
+    result.Lexpt = Lexpt;
+    result.cutoff_reached = cutoff_reached;
+    return result;
+  }
+};
+
+}  // namespace NInARow
+
+#endif  // NINAROW_IBS_H_INCLUDED
@@ -0,0 +1,116 @@
+#include <gtest/gtest.h>
+
+#include <cmath>
+#include <numeric>
+
+#include "fourbynine_features.h"
+#include "ninarow_board.h"
+#include "ninarow_heuristic.h"
+#include "ninarow_ibs.h"
+
+using namespace NInARow;
+
+namespace {
+
+/**
+ * @return Default heuristic parameters with a lapse rate of one, so that every
+ * sampled move is uniformly random, and a search that stops almost
+ * immediately.
+ */
+std::vector<double> get_lapsing_parameters() {
+  auto params = DefaultFourByNineParameters;
+  params[2] = 1.0;  // gamma
+  params[3] = 1.0;  // lapse_rate
+  return params;
+}
+
+}  // namespace
+
+TEST(NInARowIBSTest, TestRandomMoveLikelihood) {
+  using Board = Board<4, 9, 4>;
+
+  // With every move uniformly random, the expected estimate is -log(1/36).
+  for (const std::size_t num_threads : {1, 4}) {
+    InverseBinomialSampler<Heuristic<Board>> sampler(1.0, 1000.0);
+    const std::size_t num_tasks = 200;
+    for (std::size_t i = 0; i < num_tasks; ++i) {
+      sampler.add_task(Board(), Board::MoveT(i % Board::get_board_size(), 0.0,
+                                             Player::Player1));
+    }
+    EXPECT_EQ(sampler.get_num_tasks(), num_tasks);
+
+    const auto result = sampler.estimate_log_likelihoods(
+        get_lapsing_parameters(), 7, num_threads);
+    EXPECT_FALSE(result.cutoff_reached);
+    ASSERT_EQ(result.L_values.size(), num_tasks);
+    for (std::size_t i = 0; i < num_tasks; ++i) {
+      EXPECT_EQ(result.success_counts[i], 1);
+      EXPECT_GE(result.attempt_counts[i], 1);
+    }
+    const double mean_L =
+        std::accumulate(result.L_values.begin(), result.L_values.end(), 0.0) /
+        num_tasks;
+    EXPECT_NEAR(mean_L, std::log(Board::get_board_size()), 0.5);
+  }
+}
+
+TEST(NInARowIBSTest, TestCutoff) {
+  using Board = Board<4, 9, 4>;
+
+  // An observed move on an occupied square is never reproduced, so sampling
+  // continues until 1 + H(n) exceeds the cutoff of 3.5, i.e. for n = 7 trials.
+  const Board b = Board() + Board::MoveT(0, 0.0, Player::Player1);
+  InverseBinomialSampler<Heuristic<Board>> sampler(1.0, 3.5);
+  sampler.add_task(b, Board::MoveT(0, 0.0, Player::Player2));
+  EXPECT_THROW(sampler.add_task(b, Board::MoveT(1, 0.0, Player::Player2), 0),
+               std::invalid_argument);
+
+  const auto result =
+      sampler.estimate_log_likelihoods(get_lapsing_parameters(), 0, 1);
+  EXPECT_TRUE(result.cutoff_reached);
+  EXPECT_GT(result.Lexpt, 3.5);
+  EXPECT_EQ(result.attempt_counts[0], 7);
+  EXPECT_EQ(result.success_counts[0], 0);
+
+  sampler.clear_tasks();
+  EXPECT_EQ(sampler.get_num_tasks(), 0);
+}
+
+TEST(NInARowIBSTest, TestDeterministicWithOneThread) {
+  using Board = Board<4, 9, 4>;
+
+  InverseBinomialSampler<Heuristic<Board>> sampler;
+  Board b;
+  for (std::size_t i = 0; i < 6; ++i) {
+    const Board::MoveT move(13 + i, 0.0, b.active_player());
+    sampler.add_task(b, move, 2);
+    b = b + move;
+  }
+
+  const auto first =
+      sampler.estimate_log_likelihoods(DefaultFourByNineParameters, 11, 1);
+  const auto second =
+      sampler.estimate_log_likelihoods(DefaultFourByNineParameters, 11, 1);
+  EXPECT_EQ(first.L_values, second.L_values);
+  EXPECT_EQ(first.attempt_counts, second.attempt_counts);
+  EXPECT_EQ(first.success_counts, second.success_counts);
+}
+
+TEST(NInARowIBSTest, TestSharedPositionSamples) {
+  using Board = Board<4, 9, 4>;
+
+  // Observed moves at the same position are credited with the same samples,
+  // so identical observations get identical estimates.
+  InverseBinomialSampler<Heuristic<Board>> sampler(1.0, 1000.0);
+  const Board b;
+  sampler.add_task(b, Board::MoveT(3, 0.0, Player::Player1), 3);
+  sampler.add_task(b, Board::MoveT(20, 0.0, Player::Player1), 3);
+  sampler.add_task(b, Board::MoveT(3, 0.0, Player::Player1), 3);
+
+  const auto result =
+      sampler.estimate_log_likelihoods(get_lapsing_parameters(), 5, 4);
+  EXPECT_FALSE(result.cutoff_reached);
+  EXPECT_EQ(result.L_values[0], result.L_values[2]);
+  EXPECT_EQ(result.attempt_counts[0], result.attempt_counts[2]);
+  EXPECT_EQ(result.success_counts, std::vector<size_t>(3, 3));
+}
@@ -0,0 +1,89 @@
+#ifndef NINAROW_MOVE_HISTOGRAM_H_INCLUDED
+#define NINAROW_MOVE_HISTOGRAM_H_INCLUDED
+
+#include <algorithm>
+#include <atomic>
+#include <cstdint>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+#include "ninarow_bfs.h"
+#include "ninarow_heuristic.h"
+
+namespace NInARow {
+
+/**
+ * Samples moves from a heuristic with the given parameters at each of a list of
+ * positions, and counts how often each board position is played. Samples are
+ * drawn by a pool of threads sharing a single heuristic, which gives each
+ * search its own counter-based random number generator.
+ *
+ * @tparam Heuristic The heuristic to sample from.
+ *
+ * @param params The parameters of the heuristic, as accepted by
+ * `Heuristic::create`.
+ * @param boards The positions to sample moves at.
+ * @param num_samples The number of moves to sample at each position.
+ * @param seed The seed for all of the randomness of the sampling.
+ * @param num_threads The number of threads to sample with. If zero, use one
+ * thread per hardware thread.
+ *
+ * @return The move counts, in row-major order: element `i *
+ * BoardT::get_board_size() + j` is the number of times board position `j` was
+ * played at `boards[i]`. Each row sums to `num_samples`.
+ */
+template <class Heuristic>
+std::vector<size_t> sample_move_histogram(
+    const std::vector<double>& params,
+    const std::vector<typename Heuristic::BoardT>& boards,
+    std::size_t num_samples, std::uint64_t seed, std::size_t num_threads = 0) {
+  using BoardT = typename Heuristic::BoardT;
+  auto heuristic = Heuristic::create(params);
+  heuristic->set_counter_based_rng(true);
+  heuristic->seed_generator(seed);
+
+  if (num_threads == 0)
+    num_threads = std::max(1U, std::thread::hardware_concurrency());
+  num_threads = std::max<std::size_t>(1, std::min(num_threads, boards.size()));
+
+  const std::size_t board_size = BoardT::get_board_size();
+  std::vector<size_t> counts(boards.size() * board_size, 0);
+  std::atomic<std::size_t> next_board(0);
+  std::mutex mutex;
+  std::exception_ptr error;
+
+  // Each worker repeatedly claims the next unsampled position and fills in its
+  // row of the counts, so no two threads ever write to the same row.
+  auto worker = [&]() {
+    try {
+      while (true) {
+        const std::size_t i = next_board++;
+        if (i >= boards.size()) return;
+        {
+          std::lock_guard<std::mutex> lock(mutex);
+          if (error) return;
+        }
+        for (std::size_t sample = 0; sample < num_samples; ++sample) {
+          NInARowBestFirstSearch<Heuristic> search(heuristic, boards[i]);
+          ++counts[i * board_size + search.sample_move().board_position];
+        }
+      }
+    } catch (...) {
+      std::lock_guard<std::mutex> lock(mutex);
+      if (!error) error = std::current_exception();
+    }
+  };
+
+  std::vector<std::thread> threads;
+  for (std::size_t i = 1; i < num_threads; ++i) threads.emplace_back(worker);
+  worker();
+  for (auto& thread : threads) thread.join();
+  if (error) std::rethrow_exception(error);
+  return counts;
+}
+
+}  // namespace NInARow
+
+#endif  // NINAROW_MOVE_HISTOGRAM_H_INCLUDED
@@ -0,0 +1,49 @@
+#include <gtest/gtest.h>
+
+#include <numeric>
+
+#include "fourbynine_features.h"
+#include "ninarow_board.h"
+#include "ninarow_heuristic.h"
+#include "ninarow_move_histogram.h"
+
+using namespace NInARow;
+
+TEST(NInARowMoveHistogramTest, TestCountsPerPosition) {
+  using Board = Board<4, 9, 4>;
+  const std::size_t board_size = Board::get_board_size();
+
+  std::vector<Board> boards(3);
+  boards[1] = boards[0] + Board::MoveT(0, 0.0, Player::Player1);
+  boards[2] = boards[1] + Board::MoveT(1, 0.0, Player::Player2);
+
+  const std::size_t num_samples = 20;
+  for (const std::size_t num_threads : {1, 4}) {
+    const auto counts = sample_move_histogram<Heuristic<Board>>(
+        DefaultFourByNineParameters, boards, num_samples, 3, num_threads);
+    ASSERT_EQ(counts.size(), boards.size() * board_size);
+    for (std::size_t i = 0; i < boards.size(); ++i) {
+      const auto row = counts.begin() + i * board_size;
+      EXPECT_EQ(std::accumulate(row, row + board_size, std::size_t{0}),
+                num_samples);
+      // Occupied squares are never played, not even on a lapse.
+      for (std::size_t j = 0; j < board_size; ++j) {
+        if (boards[i].count_spaces(Board::PatternT(1ULL << j)) == 0) {
+          EXPECT_EQ(row[j], 0);
+        }
+      }
+    }
+  }
+}
+
+TEST(NInARowMoveHistogramTest, TestDeterministicWithOneThread) {
+  using Board = Board<4, 9, 4>;
+  const std::vector<Board> boards(2);
+  const auto counts = sample_move_histogram<Heuristic<Board>>(
+      DefaultFourByNineParameters, boards, 10, 5, 1);
+  EXPECT_EQ(counts, sample_move_histogram<Heuristic<Board>>(
+                        DefaultFourByNineParameters, boards, 10, 5, 1));
+  EXPECT_TRUE(sample_move_histogram<Heuristic<Board>>(
+                  DefaultFourByNineParameters, {}, 10, 5, 4)
+                  .empty());
+}
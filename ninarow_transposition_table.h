@@ -0,0 +1,296 @@
+#ifndef NINAROW_TRANSPOSITION_TABLE_H_INCLUDED
+#define NINAROW_TRANSPOSITION_TABLE_H_INCLUDED
+
+#include <array>
+#include <cstdint>
+#include <mutex>
+#include <random>
+#include <vector>
+
+#include "player.h"
+
+namespace NInARow {
+
+/**
+ * A bounded cache of heuristic move evaluations, keyed by a Zobrist hash of
+ * the board. Positions that are reached through different move orders
+ * (transpositions) can reuse the evaluations computed for the first one.
+ *
+ * The table is direct-mapped: every board hashes to exactly one slot, and a
+ * newly inserted evaluation always replaces whatever occupied its slot.
+ * Invalidating the table is O(1), as entries are tagged with the generation
+ * they were inserted in.
+ *
+ * Entries are also tagged with the version of the evaluation function that
+ * produced them (see `SearchContext::evaluation_version`), and only match
+ * lookups made with the same version. Without noise, every search using a
+ * heuristic shares one version, so evaluations are reused across searches.
+ * With noise, every search that drops a feature evaluates with a version of
+ * its own, so its entries are only reused for transpositions within its own
+ * tree, and serve no other search.
+ *
+ * Lookups and insertions are guarded by a lock, so a table may be shared by
+ * searches running concurrently on several threads. Searches that share a
+ * table compete for its slots and its lock, so heavily parallel searches are
+ * better off with a table each.
+ *
+ * @note The cached evaluations depend on the heuristic that produced them, so
+ * a table should only ever be shared between searches using the same
+ * heuristic.
+ *
+ * @tparam Board The board representation used by the game.
+ */
+template <typename Board>
+class TranspositionTable {
+ public:
+  /**
+   * The noise-free heuristic values of every move on a board, indexed by board
+   * position. Only the values of empty positions are meaningful.
+   */
+  using ValuesT = std::array<double, Board::get_board_size()>;
+
+ private:
+  /**
+   * A single cached evaluation.
+   */
+  struct Entry {
+    /**
+     * The Zobrist hash of the board and evaluating player.
+     */
+    std::uint64_t key;
+
+    /**
+     * The generation this entry was inserted in. Entries from earlier
+     * generations are treated as empty.
+     */
+    std::uint64_t generation;
+
+    /**
+     * The version of the evaluation function the entry was computed with.
+     */
+    std::uint64_t version;
+
+    /**
+     * The board that was evaluated. Used to rule out hash collisions.
+     */
+    Board board;
+
+    /**
+     * The player from whose perspective the board was evaluated.
+     */
+    Player eval_player;
+
+    /**
+     * The cached move values.
+     */
+    ValuesT values;
+  };
+
+  /**
+   * The slots of the table. Always a power of two in size.
+   */
+  std::vector<Entry> entries;
+
+  /**
+   * The current generation of the table.
+   */
+  std::uint64_t generation;
+
+  /**
+   * Lookup statistics.
+   * @{
+   */
+  std::size_t hits;
+  std::size_t misses;
+  std::size_t evictions;
+  /**
+   * @}
+   */
+
+  /**
+   * Guards the entries, the generation and the statistics.
+   */
+  mutable std::mutex mutex;
+
+  /**
+   * @return The random keys XORed together to form the Zobrist hash of a
+   * board, one per player per board position, followed by one key per
+   * evaluating player.
+   */
+  static const std::array<std::uint64_t, 2 * Board::get_board_size() + 2>&
+  get_zobrist_keys() {
+    static const auto keys = []() {
+      // A fixed seed keeps hashes stable across runs.
+      std::mt19937_64 engine(0x5eed);
+      std::array<std::uint64_t, 2 * Board::get_board_size() + 2> keys;
+      for (auto& key : keys) key = engine();
+      return keys;
+    }();
+    return keys;
+  }
+
+  /**
+   * @param capacity A requested capacity.
+   *
+   * @return The smallest power of two that is at least the requested capacity.
+   */
+  static std::size_t round_up_capacity(std::size_t capacity) {
+    std::size_t rounded = 1;
+    while (rounded < capacity) rounded <<= 1;
+    return rounded;
+  }
+
+  /**
+   * @param key A Zobrist hash.
+   *
+   * @return The slot that the given key maps to.
+   */
+  Entry& slot(std::uint64_t key) {
+    return entries[static_cast<std::size_t>(key) & (entries.size() - 1)];
+  }
+
+ public:
+  /**
+   * Constructor.
+   *
+   * @param capacity The number of evaluations the table can hold. Rounded up
+   * to the nearest power of two.
+   */
+  explicit TranspositionTable(std::size_t capacity = 1 << 14)
+      : entries(round_up_capacity(capacity)),
+        generation(1),
+        hits(0),
+        misses(0),
+        evictions(0) {
+    for (auto& entry : entries) entry.generation = 0;
+  }
+
+  /**
+   * Computes the Zobrist hash of a board evaluated from the perspective of a
+   * given player. Boards containing the same pieces hash identically regardless
+   * of the order in which the pieces were played.
+   *
+   * @param b The board to hash.
+   * @param eval_player The player from whose perspective the board is
+   * evaluated.
+   *
+   * @return The hash of the board and player.
+   */
+  static std::uint64_t hash(const Board& b, Player eval_player) {
+    const auto& keys = get_zobrist_keys();
+    std::uint64_t key = keys[2 * Board::get_board_size() +
+                             static_cast<std::size_t>(eval_player)];
+    for (const Player player : {Player::Player1, Player::Player2}) {
+      const auto positions = b.get_pieces(player).positions;
+      const std::size_t offset =
+          static_cast<std::size_t>(player) * Board::get_board_size();
+      for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+        if (positions.test(i)) key ^= keys[offset + i];
+      }
+    }
+    return key;
+  }
+
+  /**
+   * Looks up the cached evaluation of a board.
+   *
+   * @param key The hash of the board and player (see `hash`).
+   * @param b The board to look up.
+   * @param eval_player The player from whose perspective the board is
+   * evaluated.
+   * @param version The version of the evaluation function to look up an
+   * evaluation of.
+   * @param values Overwritten with the cached move values if the board is in
+   * the table.
+   *
+   * @return True if the board is in the table.
+   */
+  bool find(std::uint64_t key, const Board& b, Player eval_player,
+            std::uint64_t version, ValuesT& values) {
+    std::lock_guard<std::mutex> lock(mutex);
+    const Entry& entry = slot(key);
+    if (entry.generation == generation && entry.key == key &&
+        entry.version == version && entry.eval_player == eval_player &&
+        entry.board == b) {
+      ++hits;
+      values = entry.values;
+      return true;
+    }
+    ++misses;
+    return false;
+  }
+
+  /**
+   * Caches the evaluation of a board, evicting whatever evaluation previously
+   * occupied its slot.
+   *
+   * @param key The hash of the board and player (see `hash`).
+   * @param b The board that was evaluated.
+   * @param eval_player The player from whose perspective the board was
+   * evaluated.
+   * @param version The version of the evaluation function the board was
+   * evaluated with.
+   * @param values The noise-free move values of the board.
+   */
+  void insert(std::uint64_t key, const Board& b, Player eval_player,
+              std::uint64_t version, const ValuesT& values) {
+    std::lock_guard<std::mutex> lock(mutex);
+    Entry& entry = slot(key);
+    if (entry.generation == generation) ++evictions;
+    entry.key = key;
+    entry.generation = generation;
+    entry.version = version;
+    entry.board = b;
+    entry.eval_player = eval_player;
+    entry.values = values;
+  }
+
+  /**
+   * Invalidates every cached evaluation. Lookup statistics are preserved.
+   */
+  void clear() {
+    std::lock_guard<std::mutex> lock(mutex);
+    ++generation;
+  }
+
+  /**
+   * Resets the lookup statistics to zero.
+   */
+  void reset_statistics() {
+    std::lock_guard<std::mutex> lock(mutex);
+    hits = misses = evictions = 0;
+  }
+
+  /**
+   * @return The number of evaluations the table can hold.
+   */
+  std::size_t get_capacity() const { return entries.size(); }
+
+  /**
+   * @return The number of lookups that found a cached evaluation.
+   */
+  std::size_t get_hits() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return hits;
+  }
+
+  /**
+   * @return The number of lookups that did not find a cached evaluation.
+   */
+  std::size_t get_misses() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return misses;
+  }
+
+  /**
+   * @return The number of cached evaluations that were replaced by newer ones.
+   */
+  std::size_t get_evictions() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return evictions;
+  }
+};
+
+}  // namespace NInARow
+
+#endif  // NINAROW_TRANSPOSITION_TABLE_H_INCLUDED
@@ -0,0 +1,156 @@
+#include <gtest/gtest.h>
+
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "ninarow_bfs.h"
+#include "ninarow_board.h"
+#include "ninarow_heuristic.h"
+#include "ninarow_transposition_table.h"
+
+using namespace NInARow;
+
+TEST(NInARowTranspositionTableTest, TestZobristHash) {
+  using Board = Board<4, 9, 4>;
+  using Table = TranspositionTable<Board>;
+
+  Board b1;
+  b1 = b1 + Board::MoveT(0, 0.0, Player::Player1);
+  b1 = b1 + Board::MoveT(10, 0.0, Player::Player2);
+  b1 = b1 + Board::MoveT(20, 0.0, Player::Player1);
+
+  Board b2;
+  b2 = b2 + Board::MoveT(20, 0.0, Player::Player1);
+  b2 = b2 + Board::MoveT(10, 0.0, Player::Player2);
+  b2 = b2 + Board::MoveT(0, 0.0, Player::Player1);
+
+  EXPECT_EQ(Table::hash(b1, Player::Player1), Table::hash(b2, Player::Player1));
+  EXPECT_NE(Table::hash(b1, Player::Player1), Table::hash(b1, Player::Player2));
+  EXPECT_NE(Table::hash(b1, Player::Player1),
+            Table::hash(b1 - Board::MoveT(20, 0.0, Player::Player1),
+                        Player::Player1));
+  // Swapping the colors of the pieces must change the hash.
+  Board b3;
+  b3 = b3 + Board::MoveT(10, 0.0, Player::Player1);
+  b3 = b3 + Board::MoveT(0, 0.0, Player::Player2);
+  b3 = b3 + Board::MoveT(20, 0.0, Player::Player1);
+  EXPECT_NE(Table::hash(b1, Player::Player1), Table::hash(b3, Player::Player1));
+}
+
+TEST(NInARowTranspositionTableTest, TestLookupAndEviction) {
+  using Board = Board<4, 9, 4>;
+  using Table = TranspositionTable<Board>;
+
+  Table table(3);
+  EXPECT_EQ(table.get_capacity(), 4);
+
+  Table::ValuesT values;
+  values.fill(1.0);
+
+  Board b;
+  const auto key = Table::hash(b, Player::Player1);
+  Table::ValuesT found;
+  EXPECT_FALSE(table.find(key, b, Player::Player1, 1, found));
+  table.insert(key, b, Player::Player1, 1, values);
+  ASSERT_TRUE(table.find(key, b, Player::Player1, 1, found));
+  EXPECT_EQ(found, values);
+  EXPECT_FALSE(table.find(Table::hash(b, Player::Player2), b, Player::Player2,
+                          1, found));
+  // Evaluations made with another version of the evaluation function must not
+  // be returned.
+  EXPECT_FALSE(table.find(key, b, Player::Player1, 2, found));
+  EXPECT_EQ(table.get_hits(), 1);
+  EXPECT_EQ(table.get_misses(), 3);
+
+  // Filling more positions than the table can hold must evict some of them.
+  for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+    const auto next = b + Board::MoveT(i, 0.0, Player::Player1);
+    table.insert(Table::hash(next, Player::Player1), next, Player::Player1, 1,
+                 values);
+  }
+  EXPECT_GE(table.get_evictions(),
+            Board::get_board_size() - table.get_capacity());
+
+  table.reset_statistics();
+  table.clear();
+  for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+    const auto next = b + Board::MoveT(i, 0.0, Player::Player1);
+    EXPECT_FALSE(table.find(Table::hash(next, Player::Player1), next,
+                            Player::Player1, 1, found));
+  }
+  EXPECT_EQ(table.get_hits(), 0);
+  EXPECT_EQ(table.get_misses(), Board::get_board_size());
+  EXPECT_EQ(table.get_evictions(), 0);
+}
+
+TEST(NInARowTranspositionTableTest, TestSearchWithTranspositionTable) {
+  using Board = Board<4, 9, 4>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  auto table = std::make_shared<Heuristic<Board>::TranspositionTableT>();
+
+  Board b;
+  b = b + Board::MoveT(13, 0.0, Player::Player1);
+  b = b + Board::MoveT(22, 0.0, Player::Player2);
+
+  // Without noise, a search using the table must build exactly the same tree.
+  auto reference =
+      std::make_shared<NInARowBestFirstSearch<Heuristic<Board>>>(heuristic, b);
+  reference->complete_search();
+  for (std::size_t i = 0; i < 2; ++i) {
+    auto search = std::make_shared<NInARowBestFirstSearch<Heuristic<Board>>>(
+        heuristic, b);
+    search->set_transposition_table(table);
+    search->complete_search();
+    EXPECT_EQ(search->get_tree()->to_string(),
+              reference->get_tree()->to_string());
+  }
+
+  // The second search should have found every position it evaluated.
+  EXPECT_GE(table->get_hits(), table->get_misses());
+
+  // With noise, the table must only ever return evaluations made with the
+  // features dropped by the current search.
+  heuristic->set_noise_enabled(true);
+  heuristic->seed_generator(0);
+  table->reset_statistics();
+  for (std::size_t i = 0; i < 5; ++i) {
+    auto search = std::make_shared<NInARowBestFirstSearch<Heuristic<Board>>>(
+        heuristic, b);
+    search->set_transposition_table(table);
+    search->complete_search();
+  }
+  EXPECT_GT(table->get_misses(), 0);
+}
+
+TEST(NInARowTranspositionTableTest, TestConcurrentSearches) {
+  using Board = Board<4, 9, 4>;
+  using Search = NInARowBestFirstSearch<Heuristic<Board>>;
+
+  auto heuristic = Heuristic<Board>::create();
+  heuristic->set_noise_enabled(false);
+  auto table = std::make_shared<Heuristic<Board>::TranspositionTableT>();
+  const Board b;
+
+  Search reference(heuristic, b);
+  reference.complete_search();
+
+  // Searches sharing a table across threads must each build the same tree as
+  // a search without one.
+  std::vector<std::string> trees(4);
+  std::vector<std::thread> threads;
+  for (std::size_t i = 0; i < trees.size(); ++i) {
+    threads.emplace_back([&, i]() {
+      Search search(heuristic, b);
+      search.set_transposition_table(table);
+      search.complete_search();
+      trees[i] = search.get_tree()->to_string(100);
+    });
+  }
+  for (auto& thread : threads) thread.join();
+  for (const auto& tree : trees)
+    EXPECT_EQ(tree, reference.get_tree()->to_string(100));
+  EXPECT_GT(table->get_hits(), 0);
+}
@@ -2,8 +2,15 @@
 #define NINAROW_VECTORIZED_FEATURE_EVALUATOR_H_INCLUDED
 
 #include <Eigen/Dense>
+#include <array>
+#include <bitset>
+#include <cstdint>
 #include <unordered_map>
 
+#if defined(__AVX2__) && defined(__x86_64__)
+#include <immintrin.h>
+#endif
+
 #include "ninarow_heuristic_feature.h"
 #include "player.h"
 
@@ -80,13 +87,182 @@ class VectorizedBitsetCounter {
   }
 };
 
+/**
+ * @param x A 64-bit word.
+ *
+ * @return The number of set bits in the given word, using the hardware
+ * popcount instruction where the compiler exposes it.
+ */
+inline std::size_t popcount64(std::uint64_t x) {
+#if defined(__GNUC__) || defined(__clang__)
+  return static_cast<std::size_t>(__builtin_popcountll(x));
+#else
+  return std::bitset<64>(x).count();
+#endif
+}
+
+/**
+ * Counts the number of overlapping bits between a given bitset and a vector of
+ * known bitsets by packing every known bitset into contiguous 64-bit words and
+ * counting overlaps with a bitwise AND followed by a popcount. Provides the
+ * same interface as VectorizedBitsetCounter. When compiled with AVX2 support,
+ * four single-word bitsets are counted at a time.
+ *
+ * @tparam N The maximum length of all of the bitsets in the known vector of
+ * bitsets.
+ */
+template <std::size_t N>
+class PackedBitsetCounter {
+ private:
+  /**
+   * The number of 64-bit words needed to hold a single bitset.
+   */
+  static constexpr std::size_t WORDS_PER_BITSET = (N + 63) / 64;
+
+  /**
+   * All of the known bitsets, stored contiguously, WORDS_PER_BITSET words per
+   * bitset.
+   */
+  std::vector<std::uint64_t> words;
+
+  /**
+   * The number of bitsets that have been registered for evaluation.
+   */
+  std::size_t bitset_count;
+
+  /**
+   * Converts a bitset to its packed representation.
+   *
+   * @param bitset The set of bits to convert.
+   *
+   * @return The bits of the given bitset packed into 64-bit words, with bit 0
+   * of the bitset stored in the LSB of the first word.
+   */
+  static std::array<std::uint64_t, WORDS_PER_BITSET> bitset_to_words(
+      const std::bitset<N> &bitset) {
+    std::array<std::uint64_t, WORDS_PER_BITSET> packed{};
+    if (N <= 64) {
+      packed[0] = bitset.to_ullong();
+    } else {
+      for (std::size_t i = 0; i < N; ++i) {
+        packed[i / 64] |= static_cast<std::uint64_t>(bitset[i]) << (i % 64);
+      }
+    }
+    return packed;
+  }
+
+ public:
+  /**
+   * Constructor.
+   */
+  PackedBitsetCounter() : words(), bitset_count(0) {}
+
+  /**
+   * Adds a bitset into our known pool. After this function is called, each
+   * query will return an additional line representing the bit overlap count
+   * with this bitset.
+   *
+   * @param bitset The bitset to add.
+   */
+  void register_bitset(const std::bitset<N> &bitset) {
+    const auto packed = bitset_to_words(bitset);
+    words.insert(words.end(), packed.begin(), packed.end());
+    ++bitset_count;
+  }
+
+  /**
+   * Queries all of the added bitsets against a new bitset. Returns a vector
+   * where each element of the vector corresponds to a count of the overlapping
+   * bits between each line of our registered bitsets and the given bitset.
+   *
+   * @param bitset The bitset to query against.
+   *
+   * @return A list of bit overlap counts, where each element corresponds to the
+   * bit overlap count for each registered bitset against the given bitset.
+   */
+  std::vector<std::size_t> query(std::bitset<N> bitset) const {
+    const auto packed = bitset_to_words(bitset);
+    std::vector<std::size_t> counts(bitset_count);
+    std::size_t i = 0;
+#if defined(__AVX2__) && defined(__x86_64__)
+    if (WORDS_PER_BITSET == 1) {
+      // Nibble lookup popcount: count the bits of each byte with a shuffle,
+      // then sum the bytes of each 64-bit lane.
+      const __m256i query_words =
+          _mm256_set1_epi64x(static_cast<long long>(packed[0]));
+      const __m256i lookup =
+          _mm256_setr_epi8(0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4, 0, 1,
+                           1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4);
+      const __m256i low_mask = _mm256_set1_epi8(0x0f);
+      for (; i + 4 <= bitset_count; i += 4) {
+        const __m256i overlap = _mm256_and_si256(
+            _mm256_loadu_si256(
+                reinterpret_cast<const __m256i *>(words.data() + i)),
+            query_words);
+        const __m256i byte_counts = _mm256_add_epi8(
+            _mm256_shuffle_epi8(lookup, _mm256_and_si256(overlap, low_mask)),
+            _mm256_shuffle_epi8(
+                lookup,
+                _mm256_and_si256(_mm256_srli_epi16(overlap, 4), low_mask)));
+        alignas(32) std::uint64_t lane_counts[4];
+        _mm256_store_si256(
+            reinterpret_cast<__m256i *>(lane_counts),
+            _mm256_sad_epu8(byte_counts, _mm256_setzero_si256()));
+        for (std::size_t j = 0; j < 4; ++j) {
+          counts[i + j] = static_cast<std::size_t>(lane_counts[j]);
+        }
+      }
+    }
+#endif
+    for (; i < bitset_count; ++i) {
+      std::size_t count = 0;
+      for (std::size_t j = 0; j < WORDS_PER_BITSET; ++j) {
+        count += popcount64(words[i * WORDS_PER_BITSET + j] & packed[j]);
+      }
+      counts[i] = count;
+    }
+    return counts;
+  }
+};
+
+/**
+ * Holds the overlap counts between a single board and every feature registered
+ * with a VectorizedFeatureEvaluator. Counts can be updated incrementally as
+ * moves are played instead of being recomputed from scratch for every board.
+ */
+struct FeatureOverlapCounts {
+  /**
+   * For each player, the number of that player's pieces that overlap with each
+   * feature's pieces, in feature registration order.
+   */
+  std::array<std::vector<std::uint8_t>, 2> pieces;
+
+  /**
+   * The number of empty spaces that overlap with each feature's spaces, in
+   * feature registration order.
+   */
+  std::vector<std::uint8_t> spaces;
+
+  /**
+   * @param player The player whose piece counts are requested.
+   *
+   * @return The piece overlap counts of the given player for each feature.
+   */
+  const std::vector<std::uint8_t> &get_pieces(Player player) const {
+    return pieces[static_cast<std::size_t>(player)];
+  }
+};
+
 /**
  * Registers a number of features that can all be evaluated simultaneously and
  * efficiently on given boards.
  *
  * @tparam Board The board that the feature will evaluate.
+ * @tparam BitsetCounter The backend used to count bit overlaps, e.g.
+ * VectorizedBitsetCounter or PackedBitsetCounter.
  */
-template <typename Board>
+template <typename Board,
+          template <std::size_t> class BitsetCounter = PackedBitsetCounter>
 class VectorizedFeatureEvaluator {
  private:
   /**
@@ -99,21 +275,52 @@ class VectorizedFeatureEvaluator {
    * the features we're tracking. (A feature comprises pieces and spaces.) Each
    * line of this counter represents one feature's pieces.
    */
-  VectorizedBitsetCounter<Board::get_board_size()> feature_pieces_bitsets;
+  BitsetCounter<Board::get_board_size()> feature_pieces_bitsets;
 
   /**
    * A counter representing the set of all of the spaces corresponding to all of
    * the features we're tracking. (A feature comprises pieces and spaces.) Each
    * line of this counter represents one feature's spaces.
    */
-  VectorizedBitsetCounter<Board::get_board_size()> feature_spaces_bitsets;
+  BitsetCounter<Board::get_board_size()> feature_spaces_bitsets;
+
+  /**
+   * For each board position, the indices of all of the features whose pieces
+   * include that position.
+   */
+  std::array<std::vector<std::size_t>, Board::get_board_size()>
+      pieces_incidence;
+
+  /**
+   * For each board position, the indices of all of the features whose spaces
+   * include that position.
+   */
+  std::array<std::vector<std::size_t>, Board::get_board_size()>
+      spaces_incidence;
+
+  /**
+   * Converts a list of overlap counts into the compact representation used by
+   * FeatureOverlapCounts.
+   *
+   * @param counts The counts to convert.
+   *
+   * @return The converted counts.
+   */
+  static std::vector<std::uint8_t> to_compact_counts(
+      const std::vector<std::size_t> &counts) {
+    return {counts.begin(), counts.end()};
+  }
 
  public:
   /**
    * Constructor.
    */
   VectorizedFeatureEvaluator()
-      : feature_count(0), feature_pieces_bitsets(), feature_spaces_bitsets() {}
+      : feature_count(0),
+        feature_pieces_bitsets(),
+        feature_spaces_bitsets(),
+        pieces_incidence(),
+        spaces_incidence() {}
 
   /**
    * Adds a new feature to the evaluator.
@@ -125,6 +332,12 @@ class VectorizedFeatureEvaluator {
   std::size_t register_feature(const HeuristicFeature<Board> &feature) {
     feature_pieces_bitsets.register_bitset(feature.pieces.positions);
     feature_spaces_bitsets.register_bitset(feature.spaces.positions);
+    for (std::size_t i = 0; i < Board::get_board_size(); ++i) {
+      if (feature.pieces.positions.test(i))
+        pieces_incidence[i].push_back(feature_count);
+      if (feature.spaces.positions.test(i))
+        spaces_incidence[i].push_back(feature_count);
+    }
     return feature_count++;
   }
 
@@ -155,6 +368,44 @@ class VectorizedFeatureEvaluator {
   std::vector<std::size_t> query_spaces(const Board &b) const {
     return feature_spaces_bitsets.query(b.get_spaces().positions);
   }
+
+  /**
+   * Computes the overlap counts of every registered feature against the given
+   * board from scratch.
+   *
+   * @param b The board to evaluate.
+   *
+   * @return The overlap counts of the given board with every feature.
+   */
+  FeatureOverlapCounts query(const Board &b) const {
+    FeatureOverlapCounts counts;
+    counts.pieces[static_cast<std::size_t>(Player::Player1)] =
+        to_compact_counts(query_pieces(b, Player::Player1));
+    counts.pieces[static_cast<std::size_t>(Player::Player2)] =
+        to_compact_counts(query_pieces(b, Player::Player2));
+    counts.spaces = to_compact_counts(query_spaces(b));
+    return counts;
+  }
+
+  /**
+   * Updates the overlap counts of a board to reflect a single move being
+   * played on it. Only the features that contain the move's position are
+   * touched.
+   *
+   * @param counts The overlap counts of the board prior to the move. Updated in
+   * place.
+   * @param move The move being played.
+   */
+  void update(FeatureOverlapCounts &counts,
+              const typename Board::MoveT &move) const {
+    auto &player_pieces = counts.pieces[static_cast<std::size_t>(move.player)];
+    for (const auto i : pieces_incidence[move.board_position]) {
+      ++player_pieces[i];
+    }
+    for (const auto i : spaces_incidence[move.board_position]) {
+      --counts.spaces[i];
+    }
+  }
 };
 }  // namespace NInARow
 
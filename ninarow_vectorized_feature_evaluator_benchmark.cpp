@@ -0,0 +1,87 @@
+#include <chrono>
+#include <iostream>
+#include <random>
+
+#include "fourbynine_features.h"
+#include "ninarow_board.h"
+#include "ninarow_vectorized_feature_evaluator.h"
+
+using namespace NInARow;
+using FourByNineBoard = Board<4, 9, 4>;
+
+/**
+ * Generates a list of random (legal) boards to query against.
+ *
+ * @param count The number of boards to generate.
+ * @param engine The random number generator to use.
+ *
+ * @return A list of random boards.
+ */
+std::vector<FourByNineBoard> generate_boards(std::size_t count,
+                                             std::mt19937_64 &engine) {
+  std::vector<FourByNineBoard> boards;
+  while (boards.size() < count) {
+    FourByNineBoard board;
+    const std::size_t num_moves = std::uniform_int_distribution<std::size_t>(
+        0, FourByNineBoard::get_max_num_moves() - 1)(engine);
+    for (std::size_t i = 0; i < num_moves; ++i) {
+      const auto spaces = board.get_spaces().get_all_position_indices();
+      board.add(FourByNineBoard::MoveT(
+          spaces[std::uniform_int_distribution<std::size_t>(
+              0, spaces.size() - 1)(engine)],
+          0.0, board.active_player()));
+    }
+    boards.push_back(board);
+  }
+  return boards;
+}
+
+/**
+ * Measures the number of full feature queries (pieces for both players plus
+ * spaces) per second that the given evaluator backend can sustain.
+ *
+ * @tparam BitsetCounter The bit counting backend to benchmark.
+ * @param boards The boards to query.
+ * @param iterations The number of passes to make over the boards.
+ *
+ * @return The number of queries per second.
+ */
+template <template <std::size_t> class BitsetCounter>
+double benchmark_queries(const std::vector<FourByNineBoard> &boards,
+                         std::size_t iterations) {
+  VectorizedFeatureEvaluator<FourByNineBoard, BitsetCounter> evaluator;
+  for (const auto &group : FourByNineFeatures) {
+    for (const auto &feature : group) {
+      evaluator.register_feature(feature);
+    }
+  }
+
+  std::size_t checksum = 0;
+  const auto start = std::chrono::steady_clock::now();
+  for (std::size_t i = 0; i < iterations; ++i) {
+    for (const auto &board : boards) {
+      const auto counts = evaluator.query(board);
+      checksum += counts.spaces.back();
+    }
+  }
+  const auto end = std::chrono::steady_clock::now();
+  // Print the checksum so that the queries cannot be optimized away.
+  std::cerr << "checksum: " << checksum << std::endl;
+  return static_cast<double>(iterations * boards.size()) /
+         std::chrono::duration<double>(end - start).count();
+}
+
+int main() {
+  std::mt19937_64 engine(0);
+  const auto boards = generate_boards(1000, engine);
+  const std::size_t iterations = 20;
+
+  const double eigen_rate =
+      benchmark_queries<VectorizedBitsetCounter>(boards, iterations);
+  const double packed_rate =
+      benchmark_queries<PackedBitsetCounter>(boards, iterations);
+  std::cout << "Eigen backend:  " << eigen_rate << " queries/sec" << std::endl;
+  std::cout << "Packed backend: " << packed_rate << " queries/sec" << std::endl;
+  std::cout << "Speedup: " << packed_rate / eigen_rate << "x" << std::endl;
+  return 0;
+}
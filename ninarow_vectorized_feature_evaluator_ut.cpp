@@ -1,5 +1,7 @@
 #include <gtest/gtest.h>
 
+#include <random>
+
 #include "ninarow_board.h"
 #include "ninarow_vectorized_feature_evaluator.h"
 
@@ -103,3 +105,72 @@ TEST(NInARowHeuristicFeatureEvaluatorTest, TestHeuristicFeatureEvaluator) {
   test_feature(0, board, Player::Player2, false, false, false, false);
   test_feature(1, board, Player::Player2, false, false, false, false);
 }
+
+/**
+ * Tests that incrementally updated feature overlap counts match counts
+ * computed from scratch.
+ */
+TEST(NInARowHeuristicFeatureEvaluatorTest, TestIncrementalFeatureCounts) {
+  using Board = Board<3, 3, 3>;
+
+  VectorizedFeatureEvaluator<Board> feature_evaluator;
+  feature_evaluator.register_feature({{0b000000101}, {0b101010000}, 2});
+  feature_evaluator.register_feature({{0b000000101}, {0b000000010}, 1});
+  feature_evaluator.register_feature({{0b100010001}, {0b000000000}, 0});
+  feature_evaluator.register_feature({{0b000000000}, {0b001010100}, 3});
+
+  Board board;
+  auto counts = feature_evaluator.query(board);
+  const std::vector<std::size_t> positions = {4, 0, 8, 2, 6, 1, 3, 5, 7};
+  Player player = Player::Player1;
+  for (const auto position : positions) {
+    const Board::MoveT move(position, 0.0, player);
+    feature_evaluator.update(counts, move);
+    board.add(move);
+    player = get_other_player(player);
+
+    const auto expected_counts = feature_evaluator.query(board);
+    EXPECT_EQ(counts.get_pieces(Player::Player1),
+              expected_counts.get_pieces(Player::Player1));
+    EXPECT_EQ(counts.get_pieces(Player::Player2),
+              expected_counts.get_pieces(Player::Player2));
+    EXPECT_EQ(counts.spaces, expected_counts.spaces);
+  }
+}
+
+/**
+ * Tests that the packed popcount backend produces the same overlap counts as
+ * the Eigen backend, for both single-word and multi-word bitsets.
+ */
+template <std::size_t N>
+void test_bitset_counters_agree() {
+  std::mt19937_64 engine(N);
+  auto random_bitset = [&engine]() {
+    std::bitset<N> bitset;
+    for (std::size_t i = 0; i < N; ++i) {
+      bitset[i] = std::bernoulli_distribution(0.3)(engine);
+    }
+    return bitset;
+  };
+
+  VectorizedBitsetCounter<N> eigen_counter;
+  PackedBitsetCounter<N> packed_counter;
+  // Use a count that is not a multiple of any vector width.
+  for (std::size_t i = 0; i < 37; ++i) {
+    const auto bitset = random_bitset();
+    eigen_counter.register_bitset(bitset);
+    packed_counter.register_bitset(bitset);
+  }
+
+  for (std::size_t i = 0; i < 100; ++i) {
+    const auto bitset = random_bitset();
+    EXPECT_EQ(eigen_counter.query(bitset), packed_counter.query(bitset));
+  }
+}
+
+TEST(NInARowHeuristicFeatureEvaluatorTest, TestPackedBitsetCounter) {
+  test_bitset_counters_agree<9>();
+  test_bitset_counters_agree<36>();
+  test_bitset_counters_agree<64>();
+  test_bitset_counters_agree<100>();
+}
@@ -0,0 +1,177 @@
+#ifndef NODE_ARENA_H_INCLUDED
+#define NODE_ARENA_H_INCLUDED
+
+#include <cstddef>
+#include <memory>
+#include <stdexcept>
+#include <vector>
+
+/**
+ * A bump allocator that stores the nodes of a single search tree (and their
+ * reference count control blocks) contiguously in large blocks. Individual
+ * deallocations are no-ops: all of the memory is released in one step when the
+ * arena is destroyed, i.e. once the last node allocated from it is released.
+ *
+ * @note An arena is not thread-safe; a tree should only be grown from one
+ * thread at a time.
+ */
+class NodeArena : public std::enable_shared_from_this<NodeArena> {
+ private:
+  /**
+   * The default size of a single block of memory, in bytes.
+   */
+  static constexpr std::size_t BLOCK_SIZE = 1 << 16;
+
+  /**
+   * The blocks of memory owned by the arena. The last block is the one
+   * currently being allocated from.
+   */
+  std::vector<std::unique_ptr<unsigned char[]>> blocks;
+
+  /**
+   * The number of bytes already allocated from the current block.
+   */
+  std::size_t offset;
+
+  /**
+   * The size of the current block, in bytes.
+   */
+  std::size_t block_size;
+
+  /**
+   * The total number of bytes allocated from the arena.
+   */
+  std::size_t bytes_allocated;
+
+  /**
+   * Constructor.
+   */
+  NodeArena() : blocks(), offset(0), block_size(0), bytes_allocated(0) {}
+
+ public:
+  /**
+   * @return A pointer to a new, empty arena.
+   */
+  static std::shared_ptr<NodeArena> create() {
+    return std::shared_ptr<NodeArena>(new NodeArena());
+  }
+
+  /**
+   * Allocates uninitialized memory from the arena.
+   *
+   * @param size The number of bytes to allocate.
+   * @param alignment The required alignment of the allocation. Must be a power
+   * of two no larger than that of std::max_align_t.
+   *
+   * @return A pointer to the allocated memory.
+   */
+  void *allocate(std::size_t size, std::size_t alignment) {
+    if (alignment > alignof(std::max_align_t))
+      throw std::invalid_argument(
+          "Node arenas do not support over-aligned allocations!");
+    offset = (offset + alignment - 1) & ~(alignment - 1);
+    if (blocks.empty() || offset + size > block_size) {
+      block_size = size > BLOCK_SIZE ? size : BLOCK_SIZE;
+      blocks.emplace_back(new unsigned char[block_size]);
+      offset = 0;
+    }
+    void *memory = blocks.back().get() + offset;
+    offset += size;
+    bytes_allocated += size;
+    return memory;
+  }
+
+  /**
+   * @return The total number of bytes allocated from the arena.
+   */
+  std::size_t get_bytes_allocated() const { return bytes_allocated; }
+
+  /**
+   * @return The number of blocks of memory owned by the arena.
+   */
+  std::size_t get_num_blocks() const { return blocks.size(); }
+};
+
+/**
+ * A standard allocator drawing memory from a NodeArena. Every copy of the
+ * allocator keeps the arena alive, so shared pointers whose control blocks were
+ * allocated with it keep their memory valid for as long as they exist.
+ *
+ * @tparam T The type of object being allocated.
+ */
+template <class T>
+class NodeArenaAllocator {
+  template <class U>
+  friend class NodeArenaAllocator;
+
+ private:
+  /**
+   * The arena memory is drawn from.
+   */
+  std::shared_ptr<NodeArena> arena;
+
+ public:
+  using value_type = T;
+
+  /**
+   * Constructor.
+   *
+   * @param arena The arena to draw memory from.
+   */
+  explicit NodeArenaAllocator(std::shared_ptr<NodeArena> arena)
+      : arena(std::move(arena)) {}
+
+  /**
+   * Rebinding constructor.
+   *
+   * @param other The allocator whose arena to share.
+   */
+  template <class U>
+  NodeArenaAllocator(const NodeArenaAllocator<U> &other) : arena(other.arena) {}
+
+  /**
+   * @param n The number of objects to allocate memory for.
+   *
+   * @return Uninitialized memory for n objects of type T.
+   */
+  T *allocate(std::size_t n) {
+    return static_cast<T *>(arena->allocate(n * sizeof(T), alignof(T)));
+  }
+
+  /**
+   * Does nothing; memory is released when the arena is destroyed.
+   */
+  void deallocate(T *, std::size_t) {}
+
+  template <class U>
+  bool operator==(const NodeArenaAllocator<U> &other) const {
+    return arena == other.arena;
+  }
+
+  template <class U>
+  bool operator!=(const NodeArenaAllocator<U> &other) const {
+    return arena != other.arena;
+  }
+};
+
+/**
+ * Takes ownership of an object that was constructed in memory allocated from an
+ * arena, returning a shared pointer to it whose control block is also stored in
+ * the arena. The object is destroyed, but its memory isn't released, once the
+ * last shared pointer to it goes away.
+ *
+ * @tparam T The type of the object.
+ * @param arena The arena the object was constructed in.
+ * @param object The object to take ownership of.
+ *
+ * @return A shared pointer to the object.
+ */
+template <class T>
+std::shared_ptr<T> adopt_arena_object(std::shared_ptr<NodeArena> arena,
+                                      T *object) {
+  return std::shared_ptr<T>(
+      object, [](T *object) { object->~T(); },
+      NodeArenaAllocator<T>(std::move(arena)));
+}
+
+#endif  // NODE_ARENA_H_INCLUDED
@@ -0,0 +1,70 @@
+#include <gtest/gtest.h>
+
+#include <cstdint>
+#include <new>
+
+#include "node_arena.h"
+
+namespace {
+
+/**
+ * Counts how many instances of itself are alive.
+ */
+struct Counted {
+  static int alive;
+  double value;
+  explicit Counted(double value) : value(value) { ++alive; }
+  ~Counted() { --alive; }
+};
+
+int Counted::alive = 0;
+
+}  // namespace
+
+/**
+ * Tests that allocations are aligned and that large allocations succeed.
+ */
+TEST(NodeArenaTest, TestAllocate) {
+  auto arena = NodeArena::create();
+  for (std::size_t size = 1; size < 100; ++size) {
+    const auto address =
+        reinterpret_cast<std::uintptr_t>(arena->allocate(size, 8));
+    EXPECT_EQ(address % 8, 0);
+  }
+  EXPECT_EQ(arena->get_num_blocks(), 1);
+
+  arena->allocate(1 << 20, 8);
+  EXPECT_EQ(arena->get_num_blocks(), 2);
+  EXPECT_GE(arena->get_bytes_allocated(), 1 << 20);
+
+  EXPECT_THROW(arena->allocate(8, 2 * alignof(std::max_align_t)),
+               std::invalid_argument);
+}
+
+/**
+ * Tests that adopted objects are destroyed once released, and keep their arena
+ * alive until then.
+ */
+TEST(NodeArenaTest, TestAdoptArenaObject) {
+  std::shared_ptr<Counted> object;
+  std::weak_ptr<NodeArena> weak_arena;
+  {
+    auto arena = NodeArena::create();
+    weak_arena = arena;
+    object = adopt_arena_object(
+        arena,
+        new (arena->allocate(sizeof(Counted), alignof(Counted))) Counted(1.5));
+    auto other = adopt_arena_object(
+        arena,
+        new (arena->allocate(sizeof(Counted), alignof(Counted))) Counted(2.5));
+    EXPECT_EQ(Counted::alive, 2);
+  }
+
+  EXPECT_EQ(Counted::alive, 1);
+  EXPECT_FALSE(weak_arena.expired());
+  EXPECT_EQ(object->value, 1.5);
+
+  object.reset();
+  EXPECT_EQ(Counted::alive, 0);
+  EXPECT_TRUE(weak_arena.expired());
+}
@@ -0,0 +1,236 @@
+#ifndef RANDOM_ENGINE_H_INCLUDED
+#define RANDOM_ENGINE_H_INCLUDED
+
+#include <array>
+#include <cstdint>
+#include <limits>
+#include <memory>
+#include <random>
+
+/**
+ * The Philox4x32-10 counter-based random number generator of Salmon et al.,
+ * "Parallel Random Numbers: As Easy as 1, 2, 3" (2011). Each output block is a
+ * bijective function of a 128-bit counter under a 64-bit key, so the generator
+ * has almost no state, is cheap to seed, and gives statistically independent
+ * streams for distinct (key, stream) pairs without any coordination.
+ *
+ * The key is the seed. The upper 64 bits of the counter select the stream and
+ * the lower 64 bits count the blocks drawn from it.
+ */
+class Philox4x32 {
+ public:
+  using result_type = std::uint64_t;
+
+  /**
+   * A block of output, or a counter.
+   */
+  using Block = std::array<std::uint32_t, 4>;
+
+  /**
+   * A key.
+   */
+  using Key = std::array<std::uint32_t, 2>;
+
+ private:
+  /**
+   * The key of the generator.
+   */
+  Key key;
+
+  /**
+   * The counter of the next block to generate.
+   */
+  Block counter;
+
+  /**
+   * The current block of output.
+   */
+  Block block;
+
+  /**
+   * The index of the next 64-bit output in `block`. Two outputs are drawn from
+   * each block.
+   */
+  std::size_t index;
+
+ public:
+  /**
+   * Constructor.
+   *
+   * @param seed The seed, used as the key.
+   * @param stream The stream to draw from.
+   */
+  explicit Philox4x32(std::uint64_t seed = 0, std::uint64_t stream = 0)
+      : key(), counter(), block(), index(2) {
+    this->seed(seed, stream);
+  }
+
+  /**
+   * Restarts the generator at the beginning of the given stream.
+   *
+   * @param seed The seed, used as the key.
+   * @param stream The stream to draw from.
+   */
+  void seed(std::uint64_t seed, std::uint64_t stream = 0) {
+    key = {static_cast<std::uint32_t>(seed),
+           static_cast<std::uint32_t>(seed >> 32)};
+    counter = {0, 0, static_cast<std::uint32_t>(stream),
+               static_cast<std::uint32_t>(stream >> 32)};
+    index = 2;
+  }
+
+  /**
+   * Computes a single block of output.
+   *
+   * @param counter The counter of the block.
+   * @param key The key.
+   *
+   * @return The block of output.
+   */
+  static Block generate_block(Block counter, Key key) {
+    for (std::size_t round = 0; round < 10; ++round) {
+      if (round != 0) {
+        key[0] += 0x9E3779B9;
+        key[1] += 0xBB67AE85;
+      }
+      const std::uint64_t product0 =
+          static_cast<std::uint64_t>(0xD2511F53) * counter[0];
+      const std::uint64_t product1 =
+          static_cast<std::uint64_t>(0xCD9E8D57) * counter[2];
+      counter = {
+          static_cast<std::uint32_t>(product1 >> 32) ^ counter[1] ^ key[0],
+          static_cast<std::uint32_t>(product1),
+          static_cast<std::uint32_t>(product0 >> 32) ^ counter[3] ^ key[1],
+          static_cast<std::uint32_t>(product0)};
+    }
+    return counter;
+  }
+
+  /**
+   * @return The next 64 bits of output.
+   */
+  result_type operator()() {
+    if (index == 2) {
+      block = generate_block(counter, key);
+      if (++counter[0] == 0) ++counter[1];
+      index = 0;
+    }
+    const result_type result =
+        static_cast<result_type>(block[2 * index]) |
+        (static_cast<result_type>(block[2 * index + 1]) << 32);
+    ++index;
+    return result;
+  }
+
+  /**
+   * @return The smallest possible output.
+   */
+  static constexpr result_type min() {
+    return std::numeric_limits<result_type>::min();
+  }
+
+  /**
+   * @return The largest possible output.
+   */
+  static constexpr result_type max() {
+    return std::numeric_limits<result_type>::max();
+  }
+};
+
+/**
+ * The random number generator of a search: either a Mersenne twister, or a
+ * counter-based Philox generator, which is much cheaper to seed and whose
+ * streams can be derived directly from a seed and a search id.
+ */
+class RandomEngine {
+ public:
+  using result_type = std::uint64_t;
+
+ private:
+  /**
+   * The Mersenne twister, if the engine isn't counter-based.
+   */
+  std::unique_ptr<std::mt19937_64> mersenne_twister;
+
+  /**
+   * The Philox generator, used if the engine is counter-based.
+   */
+  Philox4x32 philox;
+
+ public:
+  /**
+   * Constructs a Mersenne twister engine.
+   *
+   * @param seed The seed of the engine.
+   */
+  explicit RandomEngine(std::uint64_t seed = std::mt19937_64::default_seed)
+      : mersenne_twister(new std::mt19937_64(seed)), philox() {}
+
+  /**
+   * Constructs a counter-based engine.
+   *
+   * @param seed The seed of the engine.
+   * @param stream The stream of the engine.
+   */
+  RandomEngine(std::uint64_t seed, std::uint64_t stream)
+      : mersenne_twister(), philox(seed, stream) {}
+
+  /**
+   * Copy constructor.
+   *
+   * @param other The engine to copy, including its current position.
+   */
+  RandomEngine(const RandomEngine& other)
+      : mersenne_twister(other.mersenne_twister
+                             ? new std::mt19937_64(*other.mersenne_twister)
+                             : nullptr),
+        philox(other.philox) {}
+
+  /**
+   * Copy assignment operator.
+   *
+   * @param other The engine to copy, including its current position.
+   *
+   * @return This engine.
+   */
+  RandomEngine& operator=(const RandomEngine& other) {
+    if (this != &other) {
+      mersenne_twister.reset(other.mersenne_twister
+                                 ? new std::mt19937_64(*other.mersenne_twister)
+                                 : nullptr);
+      philox = other.philox;
+    }
+    return *this;
+  }
+
+  RandomEngine(RandomEngine&&) = default;
+  RandomEngine& operator=(RandomEngine&&) = default;
+
+  /**
+   * @return True if the engine is counter-based.
+   */
+  bool is_counter_based() const { return !mersenne_twister; }
+
+  /**
+   * @return The next 64 bits of output.
+   */
+  result_type operator()() {
+    return mersenne_twister ? (*mersenne_twister)() : philox();
+  }
+
+  /**
+   * @return The smallest possible output.
+   */
+  static constexpr result_type min() {
+    return std::numeric_limits<result_type>::min();
+  }
+
+  /**
+   * @return The largest possible output.
+   */
+  static constexpr result_type max() {
+    return std::numeric_limits<result_type>::max();
+  }
+};
+
+#endif  // RANDOM_ENGINE_H_INCLUDED
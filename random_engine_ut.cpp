@@ -0,0 +1,69 @@
+#include <gtest/gtest.h>
+
+#include <cstdint>
+#include <random>
+#include <set>
+
+#include "random_engine.h"
+
+TEST(RandomEngineTest, TestPhiloxKnownAnswers) {
+  // Known answer tests from the Random123 distribution.
+  EXPECT_EQ(
+      Philox4x32::generate_block({0, 0, 0, 0}, {0, 0}),
+      (Philox4x32::Block{0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8}));
+  EXPECT_EQ(
+      Philox4x32::generate_block(
+          {0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff},
+          {0xffffffff, 0xffffffff}),
+      (Philox4x32::Block{0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd}));
+  EXPECT_EQ(
+      Philox4x32::generate_block(
+          {0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344},
+          {0xa4093822, 0x299f31d0}),
+      (Philox4x32::Block{0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1}));
+}
+
+TEST(RandomEngineTest, TestPhiloxStreams) {
+  // Outputs are drawn two per block, counting up from the start of the stream.
+  Philox4x32 philox(0x299f31d0a4093822, 0x0370734413198a2e);
+  const auto block = Philox4x32::generate_block({0, 0, 0x13198a2e, 0x03707344},
+                                                {0xa4093822, 0x299f31d0});
+  EXPECT_EQ(philox(), block[0] | (std::uint64_t{block[1]} << 32));
+  EXPECT_EQ(philox(), block[2] | (std::uint64_t{block[3]} << 32));
+  const auto next_block = Philox4x32::generate_block(
+      {1, 0, 0x13198a2e, 0x03707344}, {0xa4093822, 0x299f31d0});
+  EXPECT_EQ(philox(), next_block[0] | (std::uint64_t{next_block[1]} << 32));
+
+  // Distinct streams and seeds give distinct outputs.
+  std::set<std::uint64_t> outputs;
+  for (std::uint64_t seed = 0; seed < 4; ++seed) {
+    for (std::uint64_t stream = 0; stream < 4; ++stream) {
+      Philox4x32 generator(seed, stream);
+      for (std::size_t i = 0; i < 8; ++i) outputs.insert(generator());
+    }
+  }
+  EXPECT_EQ(outputs.size(), 4 * 4 * 8);
+}
+
+TEST(RandomEngineTest, TestRandomEngine) {
+  // Mersenne twister engines match std::mt19937_64.
+  RandomEngine engine(42);
+  std::mt19937_64 mersenne_twister(42);
+  EXPECT_FALSE(engine.is_counter_based());
+  for (std::size_t i = 0; i < 10; ++i) EXPECT_EQ(engine(), mersenne_twister());
+
+  // Counter-based engines match Philox4x32.
+  RandomEngine counter_based(42, 7);
+  Philox4x32 philox(42, 7);
+  EXPECT_TRUE(counter_based.is_counter_based());
+  for (std::size_t i = 0; i < 10; ++i) EXPECT_EQ(counter_based(), philox());
+
+  // Copies continue from the same position independently.
+  for (auto& original : {engine, counter_based}) {
+    RandomEngine copy = original;
+    RandomEngine other_copy(0);
+    other_copy = original;
+    EXPECT_EQ(copy.is_counter_based(), original.is_counter_based());
+    for (std::size_t i = 0; i < 10; ++i) EXPECT_EQ(copy(), other_copy());
+  }
+}
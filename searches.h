@@ -1,9 +1,13 @@
 #ifndef SEARCHES_H_INCLUDED
 #define SEARCHES_H_INCLUDED
 
+#include <chrono>
 #include <memory>
+#include <stdexcept>
+#include <unordered_map>
 
 #include "bfs_node.h"
+#include "cancellation_token.h"
 #include "game_tree_node.h"
 
 /**
@@ -24,10 +28,20 @@ class AbstractSearch {
    */
   AbstractSearch(std::shared_ptr<Heuristic> heuristic,
                  const typename Heuristic::BoardT &board)
-      : heuristic(heuristic), board(board) {
+      : heuristic(heuristic),
+        board(board),
+        context(),
+        cancellation_token(),
+        cancellation_check_interval(1),
+        cancelled(false),
+        expansion_budget(0),
+        time_budget(0.0),
+        budget_exhausted(false),
+        expansions_used(0),
+        seconds_used(0.0) {
     if (!heuristic)
       throw std::invalid_argument("Must pass a non-null heuristic!");
-    this->heuristic->start_search();
+    context = this->heuristic->create_search_context();
   }
 
   /**
@@ -39,22 +53,126 @@ class AbstractSearch {
   virtual bool advance_search() = 0;
 
   /**
-   * Runs the current search to completion.
+   * Runs the current search to completion, until it is cancelled through its
+   * cancellation token, or until it exhausts its budget. Both budgets apply to
+   * each call separately, so a search that was interrupted can be resumed with
+   * a fresh budget.
    */
   void complete_search() {
-    while (!advance_search()) {
+    using Clock = std::chrono::steady_clock;
+    cancelled = false;
+    budget_exhausted = false;
+    expansions_used = 0;
+    seconds_used = 0.0;
+    const auto start = Clock::now();
+    const auto deadline =
+        start + std::chrono::duration_cast<Clock::duration>(
+                    std::chrono::duration<double>(time_budget));
+    for (std::size_t steps = 0;; ++steps) {
+      // At least one step is always taken, so that the tree has a best move
+      // even if the search is interrupted.
+      if (steps != 0) {
+        if (cancellation_token && steps % cancellation_check_interval == 0 &&
+            cancellation_token->is_cancelled()) {
+          cancelled = true;
+          break;
+        }
+        if ((expansion_budget != 0 && expansions_used >= expansion_budget) ||
+            (time_budget != 0.0 && Clock::now() >= deadline)) {
+          budget_exhausted = true;
+          break;
+        }
+      }
+      if (advance_search()) break;
+      ++expansions_used;
     }
+    seconds_used = std::chrono::duration<double>(Clock::now() - start).count();
   }
 
   /**
-   * Destructor.
+   * Limits the number of steps each call to `complete_search` may take. Once
+   * the budget is exhausted, the search stops and its tree holds the best move
+   * found so far.
+   *
+   * @param budget The maximum number of steps, or zero for no limit.
    */
-  virtual ~AbstractSearch() {
-    if (heuristic) {
-      heuristic->complete_search();
-    }
+  void set_expansion_budget(std::size_t budget) { expansion_budget = budget; }
+
+  /**
+   * Limits the wall-clock time each call to `complete_search` may take. Once
+   * the budget is exhausted, the search stops and its tree holds the best move
+   * found so far. The deadline is checked between steps, so a call may overrun
+   * it by up to one step.
+   *
+   * @param seconds The maximum duration in seconds, or zero for no limit.
+   */
+  void set_time_budget(double seconds) {
+    if (!(seconds >= 0.0))
+      throw std::invalid_argument("The time budget must be non-negative!");
+    time_budget = seconds;
   }
 
+  /**
+   * @return True if the last call to `complete_search` stopped because the
+   * search exhausted its budget. The search tree is then incomplete.
+   */
+  bool was_budget_exhausted() const { return budget_exhausted; }
+
+  /**
+   * @return The number of steps taken by the last call to `complete_search`.
+   */
+  std::size_t get_expansions_used() const { return expansions_used; }
+
+  /**
+   * @return The wall-clock time spent in the last call to `complete_search`, in
+   * seconds.
+   */
+  double get_seconds_used() const { return seconds_used; }
+
+  /**
+   * Sets a token through which the search can be cancelled while running.
+   *
+   * @param token The token to watch, or nullptr to stop watching one.
+   * @param check_interval The token is checked once every this many steps of
+   * the search.
+   */
+  void set_cancellation_token(std::shared_ptr<CancellationToken> token,
+                              std::size_t check_interval = 16) {
+    if (check_interval == 0)
+      throw std::invalid_argument("The check interval must be positive!");
+    cancellation_token = token;
+    cancellation_check_interval = check_interval;
+  }
+
+  /**
+   * @return True if the last call to `complete_search` stopped because the
+   * search was cancelled. The search tree is then incomplete.
+   */
+  bool was_cancelled() const { return cancelled; }
+
+  /**
+   * Samples the move the heuristic plays from the starting position, applying
+   * its lapse rate. Equivalent in distribution to running the search to
+   * completion and calling `Heuristic::get_best_move` on the resulting tree,
+   * but the lapse is decided first, so no search is run on a lapse.
+   *
+   * @return Either the best move found by the search, or a random move if the
+   * heuristic lapses. If the search was cancelled (see `was_cancelled`) or
+   * exhausted its budget (see `was_budget_exhausted`), the best move found so
+   * far.
+   */
+  typename Heuristic::BoardT::MoveT sample_move() {
+    if (heuristic->sample_lapse(context))
+      return heuristic->get_random_move(board, context);
+    complete_search();
+    return get_tree()->get_best_move();
+  }
+
+  /**
+   * Destructor.
+   */
+  virtual ~AbstractSearch() = default;
+
   /**
    * @return (the root of) The current search tree.
    */
@@ -69,7 +187,58 @@ class AbstractSearch {
   /**
    * The starting board position.
    */
-  const typename Heuristic::BoardT board;
+  typename Heuristic::BoardT board;
+
+  /**
+   * The random number generator and dropped features of this search. Owned by
+   * the search so that searches sharing a heuristic don't interfere with each
+   * other.
+   */
+  typename Heuristic::SearchContextT context;
+
+  /**
+   * The token through which the search can be cancelled, if any.
+   */
+  std::shared_ptr<CancellationToken> cancellation_token;
+
+  /**
+   * The number of steps of the search between checks of the cancellation
+   * token.
+   */
+  std::size_t cancellation_check_interval;
+
+  /**
+   * True if the last call to `complete_search` was cancelled.
+   */
+  bool cancelled;
+
+  /**
+   * The maximum number of steps of each call to `complete_search`, or zero for
+   * no limit.
+   */
+  std::size_t expansion_budget;
+
+  /**
+   * The maximum duration of each call to `complete_search` in seconds, or zero
+   * for no limit.
+   */
+  double time_budget;
+
+  /**
+   * True if the last call to `complete_search` exhausted its budget.
+   */
+  bool budget_exhausted;
+
+  /**
+   * The number of steps taken by the last call to `complete_search`.
+   */
+  std::size_t expansions_used;
+
+  /**
+   * The wall-clock time spent in the last call to `complete_search`, in
+   * seconds.
+   */
+  double seconds_used;
 };
 
 /**
@@ -93,7 +262,12 @@ class Search : public AbstractSearch<Heuristic> {
   Search(std::shared_ptr<Heuristic> heuristic,
          const typename Heuristic::BoardT &board)
       : AbstractSearch<Heuristic>(heuristic, board),
-        root(NodeT::create(board, heuristic->evaluate(board))) {}
+        root(),
+        feature_counts(),
+        candidate_moves(),
+        transposition_table() {
+    create_root();
+  }
 
   /**
    * Performs a single step of the search algorithm, typically expanding a
@@ -103,14 +277,14 @@ class Search : public AbstractSearch<Heuristic> {
    */
   virtual bool advance_search() override {
     if (stopping_conditions(this->heuristic, this->board)) {
-      this->heuristic->complete_search();
       return true;
     } else {
       auto current_node = select_next_node();
       const auto current_board = current_node->get_board();
-      const std::vector<typename Heuristic::BoardT::MoveT> candidate_moves =
-          this->heuristic->get_pruned_moves(current_board,
-                                            current_board.active_player());
+      this->heuristic->get_pruned_moves(
+          current_board, current_board.active_player(),
+          get_feature_counts(current_node), this->context, candidate_moves,
+          transposition_table.get());
       current_node->expand(candidate_moves);
       on_node_expansion(current_node, this->heuristic, this->board);
       return false;
@@ -122,10 +296,110 @@ class Search : public AbstractSearch<Heuristic> {
    */
   virtual std::shared_ptr<Node<typename Heuristic::BoardT>> get_tree()
       override {
-    return std::dynamic_pointer_cast<Node<typename Heuristic::BoardT>>(root);
+    return root;
+  }
+
+  /**
+   * Moves the root of the search to the position reached by playing the given
+   * move, e.g. once it has been played in a game. If possible, the subtree
+   * already built under the move is kept, so that the next call to
+   * `complete_search` continues from it rather than starting from scratch. The
+   * subtree is copied into a new tree (see `NodeT::copy_as_root`), so depths
+   * are measured from the new root, and the memory of the old tree is released
+   * unless it is referenced elsewhere. The search's counters and budgets
+   * restart as for a new search.
+   *
+   * A kept subtree was built with this search's noise and dropped features, so
+   * it is only kept if the heuristic's noise is disabled, or if
+   * `reuse_noisy_subtree` is set. Otherwise, or if the move isn't in the tree,
+   * the search starts over from the new position exactly as if it had just
+   * been constructed.
+   *
+   * @param move The move to play from the current root.
+   * @param reuse_noisy_subtree If true, keep the subtree even if noise is
+   * enabled.
+   */
+  void advance_root(const typename Heuristic::BoardT::MoveT &move,
+                    bool reuse_noisy_subtree = false) {
+    const auto new_board = this->board + move;
+    std::shared_ptr<NodeT> child;
+    if (reuse_noisy_subtree || !this->heuristic->is_noise_enabled()) {
+      for (const auto &node : root->get_children()) {
+        if (node->get_move().board_position == move.board_position) {
+          child = std::dynamic_pointer_cast<NodeT>(node);
+          break;
+        }
+      }
+    }
+
+    this->board = new_board;
+    this->cancelled = false;
+    this->budget_exhausted = false;
+    this->expansions_used = 0;
+    this->seconds_used = 0.0;
+    if (child) {
+      root = NodeT::copy_as_root(*child);
+      // Only keep the feature counts of the nodes that are still in the tree.
+      // The copy visits its nodes in the same order as the original, so each
+      // count can be moved over to the copy of its node.
+      std::unordered_map<const NodeT *, typename Heuristic::FeatureCountsT>
+          kept_counts;
+      auto copy = root->begin();
+      for (const auto &node : *child) {
+        auto search = feature_counts.find(static_cast<const NodeT *>(&node));
+        if (search != feature_counts.end())
+          kept_counts.emplace(static_cast<const NodeT *>(&*copy),
+                              std::move(search->second));
+        ++copy;
+      }
+      feature_counts = std::move(kept_counts);
+    } else {
+      this->context = this->heuristic->create_search_context();
+      feature_counts.clear();
+      create_root();
+    }
+    on_root_advanced();
+  }
+
+  /**
+   * Sets a transposition table for the search to cache move evaluations in.
+   * Positions reached by several move orders are then only evaluated once. The
+   * same table may be shared across successive searches using the same
+   * heuristic.
+   *
+   * @param table The transposition table to use, or nullptr to stop using one.
+   */
+  void set_transposition_table(
+      std::shared_ptr<typename Heuristic::TranspositionTableT> table) {
+    transposition_table = table;
+  }
+
+  /**
+   * @return The transposition table used by the search, if any.
+   */
+  std::shared_ptr<typename Heuristic::TranspositionTableT>
+  get_transposition_table() const {
+    return transposition_table;
   }
 
  protected:
+  /**
+   * Creates a new search tree consisting of only the starting position.
+   */
+  void create_root() {
+    auto root_counts = this->heuristic->get_feature_counts(this->board);
+    root = NodeT::create(
+        this->board,
+        this->heuristic->evaluate(this->board, root_counts, this->context));
+    feature_counts.emplace(root.get(), std::move(root_counts));
+  }
+
+  /**
+   * Called whenever the root of the search has been moved by `advance_root`.
+   * Can be overridden to reset search metadata.
+   */
+  virtual void on_root_advanced() {}
+
   /**
    * Finds the next node in the tree to be expanded at each step of the search
    * process.
@@ -136,6 +410,36 @@ class Search : public AbstractSearch<Heuristic> {
     return std::dynamic_pointer_cast<NodeT>(root->select());
   }
 
+  /**
+   * Returns the feature overlap counts for the given node, deriving them
+   * incrementally from the node's parent where possible. The counts are cached
+   * for the lifetime of the search so that the node's children can in turn be
+   * derived from them.
+   *
+   * @param node The node whose counts are requested.
+   *
+   * @return The feature overlap counts of the node's board.
+   */
+  const typename Heuristic::FeatureCountsT &get_feature_counts(
+      const std::shared_ptr<NodeT> &node) {
+    auto search = feature_counts.find(node.get());
+    if (search != feature_counts.end()) return search->second;
+
+    const auto parent = std::dynamic_pointer_cast<NodeT>(node->get_parent());
+    const auto parent_search =
+        parent ? feature_counts.find(parent.get()) : feature_counts.end();
+    if (parent_search == feature_counts.end()) {
+      return feature_counts
+          .emplace(node.get(),
+                   this->heuristic->get_feature_counts(node->get_board()))
+          .first->second;
+    }
+
+    auto counts = parent_search->second;
+    this->heuristic->update_feature_counts(counts, node->get_move());
+    return feature_counts.emplace(node.get(), std::move(counts)).first->second;
+  }
+
   /**
    * Evaluates search stopping conditions and returns true if the search should
    * end.
@@ -169,6 +473,24 @@ class Search : public AbstractSearch<Heuristic> {
    * The root of the search tree.
    */
   std::shared_ptr<NodeT> root;
+
+  /**
+   * The feature overlap counts of every node that has been expanded during
+   * this search, keyed by node.
+   */
+  std::unordered_map<const NodeT *, typename Heuristic::FeatureCountsT>
+      feature_counts;
+
+  /**
+   * A buffer holding the candidate moves of the node currently being expanded.
+   * Reused across expansions to avoid reallocating it for every node.
+   */
+  std::vector<typename Heuristic::BoardT::MoveT> candidate_moves;
+
+  /**
+   * An optional cache of move evaluations, shared with other searches.
+   */
+  std::shared_ptr<typename Heuristic::TranspositionTableT> transposition_table;
 };
 
 #endif  // SEARCHES_H_INCLUDED